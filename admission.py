@@ -0,0 +1,295 @@
+"""Admission Control - per-route concurrency limits with bounded wait queues, and a limit on request-path Tally fetches"""
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from typing import Deque, Dict, List, Optional, Tuple
+import metrics
+from responses import FastJSONResponse
+
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "true").lower() in ("1", "true", "yes")
+# Route template=concurrent:queued, comma separated; requests beyond both get a 429
+ADMISSION_LIMITS = os.getenv("ADMISSION_LIMITS", "/orders/auto-approval=16:32")
+# Longest a queued request waits for a slot before it is rejected
+ADMISSION_QUEUE_TIMEOUT_SECONDS = float(os.getenv("ADMISSION_QUEUE_TIMEOUT_SECONDS", "5"))
+# Retry-After sent with rejections
+ADMISSION_RETRY_AFTER_SECONDS = int(os.getenv("ADMISSION_RETRY_AFTER_SECONDS", "2"))
+# Tally fetches made while serving a request (cache misses), and how many may wait; rejections get a 503
+TALLY_FETCH_CONCURRENCY = int(os.getenv("TALLY_FETCH_CONCURRENCY", "8"))
+TALLY_FETCH_QUEUE = int(os.getenv("TALLY_FETCH_QUEUE", "16"))
+
+logger = logging.getLogger(__name__)
+
+
+class AdmissionRejected(Exception):
+    """Raised when a limiter's slots and wait queue are full, or the wait timed out"""
+
+    def __init__(self, limiter: "ConcurrencyLimiter", reason: str):
+        super().__init__(f"{limiter.name} is at capacity ({reason}), retry in {limiter.retry_after}s")
+        self.limiter = limiter
+        self.reason = reason
+        self.status_code = limiter.status_code
+        self.retry_after = limiter.retry_after
+
+
+class ConcurrencyLimiter:
+    """
+    At most `limit` holders, at most `queue` waiters, FIFO hand-off
+
+    A released slot passes straight to the oldest waiter, so a burst is
+    served in arrival order and late arrivals cannot overtake the queue.
+    Waiters are concurrent.futures.Future objects, which both threads
+    (acquire) and coroutines (acquire_async) can wait on. Anything beyond
+    the queue, or waiting longer than timeout, raises AdmissionRejected at
+    once instead of holding a thread or a database connection.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        limit: int,
+        queue: int,
+        timeout: float = ADMISSION_QUEUE_TIMEOUT_SECONDS,
+        status_code: int = 429,
+        retry_after: int = ADMISSION_RETRY_AFTER_SECONDS,
+    ):
+        self.name = name
+        self.limit = limit
+        self.queue = queue
+        self.timeout = timeout
+        self.status_code = status_code
+        self.retry_after = retry_after
+        self.active = 0
+        self._waiters: Deque[Future] = deque()
+        # A threading lock: the Tally limiter is shared by threadpool and event-loop callers
+        self._lock = threading.Lock()
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    def _try_enter(self) -> Optional[Future]:
+        """None when a slot was taken; otherwise the waiter to wait on"""
+        with self._lock:
+            if self.active < self.limit:
+                self.active += 1
+                return None
+            if len(self._waiters) >= self.queue:
+                self._reject("queue_full")
+            waiter = Future()
+            self._waiters.append(waiter)
+            return waiter
+
+    def _give_up(self, waiter: Future) -> None:
+        """After a timed-out wait: reject, unless the slot was handed over meanwhile"""
+        with self._lock:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+            elif waiter.done() and not waiter.cancelled():
+                return
+        self._reject("timeout")
+
+    def _reject(self, reason: str) -> None:
+        metrics.admission_rejections.inc(limiter=self.name, reason=reason)
+        raise AdmissionRejected(self, reason)
+
+    def acquire(self) -> None:
+        waiter = self._try_enter()
+        if waiter is None:
+            return
+        start = time.perf_counter()
+        try:
+            waiter.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            self._give_up(waiter)
+        metrics.admission_wait_seconds.observe(time.perf_counter() - start, limiter=self.name)
+
+    async def acquire_async(self) -> None:
+        waiter = self._try_enter()
+        if waiter is None:
+            return
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(asyncio.wrap_future(waiter), self.timeout)
+        except asyncio.TimeoutError:
+            # wait_for cancels the waiter unless the slot was already handed over
+            self._give_up(waiter)
+        except asyncio.CancelledError:
+            # Client went away while queued: pass on a slot that was handed over
+            with self._lock:
+                handed = waiter not in self._waiters and waiter.done() and not waiter.cancelled()
+            if handed:
+                self.release()
+            raise
+        metrics.admission_wait_seconds.observe(time.perf_counter() - start, limiter=self.name)
+
+    def release(self) -> None:
+        with self._lock:
+            while self._waiters:
+                waiter = self._waiters.popleft()
+                if waiter.set_running_or_notify_cancel():
+                    # The slot moves to the waiter; active stays the same
+                    waiter.set_result(True)
+                    return
+            self.active -= 1
+
+    @contextmanager
+    def slot(self):
+        self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    @asynccontextmanager
+    async def slot_async(self):
+        await self.acquire_async()
+        try:
+            yield
+        finally:
+            self.release()
+
+
+def parse_limits(value: str) -> Dict[str, Tuple[int, int]]:
+    """'/orders/auto-approval=16:32' -> {'/orders/auto-approval': (16, 32)}"""
+    limits = {}
+    for part in value.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        route, _, sizes = part.partition("=")
+        limit, _, queue = sizes.partition(":")
+        limits[route.strip()] = (int(limit), int(queue or 0))
+    return limits
+
+
+route_limiters: Dict[str, ConcurrencyLimiter] = {
+    route: ConcurrencyLimiter(route, limit, queue)
+    for route, (limit, queue) in parse_limits(ADMISSION_LIMITS).items()
+}
+tally_fetch_limiter = ConcurrencyLimiter("tally_fetch", TALLY_FETCH_CONCURRENCY, TALLY_FETCH_QUEUE, status_code=503)
+
+
+# The route slot the current request holds, as a one-item list so the
+# threadpool's copy of the context shares it; [None] once handed back
+_route_slot: ContextVar[Optional[list]] = ContextVar("route_slot", default=None)
+
+
+def _release_holder(holder: Optional[list]) -> None:
+    if holder is not None and holder[0] is not None:
+        limiter, holder[0] = holder[0], None
+        limiter.release()
+
+
+def release_route_slot() -> None:
+    """Hand the current request's route slot to the next queued request (once)"""
+    _release_holder(_route_slot.get())
+
+
+@contextmanager
+def tally_fetch_slot():
+    """
+    A tally_fetch_limiter slot for a Tally fetch made while serving a request
+
+    The request first gives up its route slot: from here on it waits on
+    Tally, and is bounded by TALLY_FETCH_CONCURRENCY instead, so requests
+    answered from the cache are not queued behind it.
+    """
+    release_route_slot()
+    with tally_fetch_limiter.slot():
+        yield
+
+
+@asynccontextmanager
+async def tally_fetch_slot_async():
+    release_route_slot()
+    async with tally_fetch_limiter.slot_async():
+        yield
+
+
+def rejection_response(error: AdmissionRejected) -> FastJSONResponse:
+    return FastJSONResponse(
+        {"detail": str(error)},
+        status_code=error.status_code,
+        headers={"Retry-After": str(error.retry_after)},
+    )
+
+
+def _all_limiters() -> List[ConcurrencyLimiter]:
+    return list(route_limiters.values()) + [tally_fetch_limiter]
+
+
+metrics.registry.gauge(
+    "admission_in_flight", "Requests holding an admission slot by limiter",
+    lambda: {limiter.name: limiter.active for limiter in _all_limiters()}, label="limiter"
+)
+metrics.registry.gauge(
+    "admission_queue_depth", "Requests waiting for an admission slot by limiter",
+    lambda: {limiter.name: limiter.waiting for limiter in _all_limiters()}, label="limiter"
+)
+
+
+class AdmissionMiddleware:
+    """
+    ASGI middleware applying route_limiters before a request is routed
+
+    Requests to a limited route template take a slot (or queue for one)
+    before FastAPI resolves dependencies, so a rejected request never
+    takes a threadpool thread or a pooled connection. The slot is held
+    until the response has been sent, or until the request starts waiting
+    on Tally (tally_fetch_slot).
+    """
+
+    def __init__(self, app, limiters: Optional[Dict[str, ConcurrencyLimiter]] = None):
+        self.app = app
+        self.limiters = route_limiters if limiters is None else limiters
+        self._routes: Optional[list] = None
+
+    def _limited_routes(self, app) -> list:
+        if self._routes is None:
+            routes = [(route, self.limiters[route.path]) for route in app.router.routes if getattr(route, "path", None) in self.limiters]
+            unknown = set(self.limiters) - {route.path for route, _ in routes}
+            if unknown:
+                logger.warning("⚠ ADMISSION_LIMITS names unknown routes: %s", ", ".join(sorted(unknown)))
+            self._routes = routes
+        return self._routes
+
+    def _match(self, scope) -> Tuple[Optional[object], Optional[ConcurrencyLimiter]]:
+        from starlette.routing import Match
+
+        for route, limiter in self._limited_routes(scope["app"]):
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return route, limiter
+        return None, None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.limiters:
+            await self.app(scope, receive, send)
+            return
+
+        route, limiter = self._match(scope)
+        if limiter is None:
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            await limiter.acquire_async()
+        except AdmissionRejected as e:
+            # Label the rejection with its route for MetricsMiddleware
+            scope["route"] = route
+            logger.warning("⚠ Rejected %s %s: %s", scope["method"], scope["path"], e.reason)
+            await rejection_response(e)(scope, receive, send)
+            return
+        holder = [limiter]
+        token = _route_slot.set(holder)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _route_slot.reset(token)
+            _release_holder(holder)
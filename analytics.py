@@ -0,0 +1,212 @@
+"""Analytics - inventory aging, sell-through and stock cover, computed with pandas over whole tables"""
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import Tuple
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from data_version import get_data_version, snapshot_cache
+from models import Activation, InventoryHistoryDelta, InventoryHistoryRun, PrmInventorySnapshot, Product, Retailer
+
+# Sales window for sell-through and stock cover
+ANALYTICS_SALES_WINDOW_DAYS = int(os.getenv("ANALYTICS_SALES_WINDOW_DAYS", "30"))
+# Rebuild even without data changes after this long, so ages and the sales window move on
+ANALYTICS_MAX_AGE_SECONDS = int(os.getenv("ANALYTICS_MAX_AGE_SECONDS", "3600"))
+
+# Days-in-stock buckets: (upper bound in days, label)
+AGE_BUCKETS = [(30, "0-30"), (60, "31-60"), (90, "61-90"), (float("inf"), "90+")]
+
+LINE_KEYS = ["retailer_id", "goods_id"]
+
+logger = logging.getLogger(__name__)
+
+
+def load_frames(db: Session) -> dict:
+    """
+    The analytics inputs as DataFrames, one query per table
+
+    pandas is imported here rather than at module level so API workers
+    only load it when analytics are first requested.
+    """
+    import pandas as pd
+
+    conn = db.connection()
+    since = datetime.now() - timedelta(days=ANALYTICS_SALES_WINDOW_DAYS)
+    return {
+        "inventory": pd.read_sql_query(
+            select(PrmInventorySnapshot.retailer_id, PrmInventorySnapshot.goods_id, PrmInventorySnapshot.quantity, PrmInventorySnapshot.last_seen),
+            conn,
+            parse_dates=["last_seen"],
+        ),
+        "sales": pd.read_sql_query(
+            select(Activation.retailer_id, Activation.goods_id)
+            .where(Activation.retailer_id != None, Activation.activation_time >= since),  # noqa: E711
+            conn,
+        ),
+        "products": pd.read_sql_query(select(Product.goods_id, Product.name, Product.current_price), conn),
+        "retailers": pd.read_sql_query(select(Retailer.id.label("retailer_id"), Retailer.retailer_code, Retailer.name), conn),
+        "history": pd.read_sql_query(
+            select(InventoryHistoryDelta.retailer_id, InventoryHistoryDelta.goods_id, InventoryHistoryDelta.quantity, InventoryHistoryRun.taken_at)
+            .join(InventoryHistoryRun, InventoryHistoryRun.id == InventoryHistoryDelta.run_id),
+            conn,
+            parse_dates=["taken_at"],
+        ),
+    }
+
+
+def held_since(history):
+    """
+    When each line's current holding started: the first change after its
+    last drop to zero, from the inventory history deltas
+
+    Returns a frame of retailer_id, goods_id, held_since.
+    """
+    import pandas as pd
+
+    if history.empty:
+        return pd.DataFrame({
+            "retailer_id": pd.Series([], dtype="int64"),
+            "goods_id": pd.Series([], dtype="object"),
+            "held_since": pd.Series([], dtype="datetime64[ns]"),
+        })
+    last_zero = (
+        history[history["quantity"] == 0]
+        .groupby(LINE_KEYS, as_index=False)["taken_at"].max()
+        .rename(columns={"taken_at": "last_zero"})
+    )
+    history = history.merge(last_zero, on=LINE_KEYS, how="left")
+    current = history[history["last_zero"].isna() | (history["taken_at"] > history["last_zero"])]
+    return current.groupby(LINE_KEYS, as_index=False)["taken_at"].min().rename(columns={"taken_at": "held_since"})
+
+
+def _records(frame) -> list:
+    """
+    DataFrame rows as dicts with NaN/NaT as None
+
+    Built column by column (one tolist per column, then zip) rather than
+    with to_dict("records"), which boxes every cell separately.
+    """
+    columns = []
+    for name in frame.columns:
+        column = frame[name]
+        if column.dtype.kind == "M":
+            values = [None if value is None else value.to_pydatetime() for value in column.astype(object).where(column.notna(), None)]
+        elif column.dtype.kind in "iub":
+            values = column.tolist()
+        elif column.dtype.kind == "f":
+            values = [None if value != value else value for value in column.tolist()]
+        else:
+            values = column.astype(object).where(column.notna(), None).tolist()
+        columns.append(values)
+    names = list(frame.columns)
+    return [dict(zip(names, row)) for row in zip(*columns)]
+
+
+def compute_inventory_analytics(frames: dict, now: datetime) -> dict:
+    """
+    Aging buckets, sell-through and stock cover per line, retailer and product
+
+    - days_in_stock: days since the line's current holding started (from
+      inventory history; the snapshot time when there is no history yet)
+    - sell_through: units sold in the window / (sold + on hand)
+    - stock_cover_days: days the stock on hand lasts at the window's sales
+      rate (None without sales)
+    """
+    import numpy as np
+    import pandas as pd
+
+    window = ANALYTICS_SALES_WINDOW_DAYS
+    bounds = [-np.inf] + [upper for upper, _ in AGE_BUCKETS]
+    labels = [label for _, label in AGE_BUCKETS]
+
+    sold = frames["sales"].groupby(LINE_KEYS).size().rename("sold").reset_index()
+    lines = (
+        frames["inventory"].groupby(LINE_KEYS, as_index=False).agg(quantity=("quantity", "sum"), last_seen=("last_seen", "max"))
+        .merge(sold, on=LINE_KEYS, how="outer")
+        .merge(held_since(frames["history"]), on=LINE_KEYS, how="left")
+        .merge(frames["products"].rename(columns={"name": "product_name"}), on="goods_id", how="left")
+        .merge(frames["retailers"].rename(columns={"name": "retailer_name"}), on="retailer_id", how="inner")
+    )
+    lines["quantity"] = lines["quantity"].fillna(0).astype("int64")
+    lines["sold"] = lines["sold"].fillna(0).astype("int64")
+    lines["stock_value"] = (lines["quantity"] * lines["current_price"].fillna(0.0)).round(2)
+
+    in_stock = lines["quantity"] > 0
+    lines["in_stock"] = in_stock.astype("int64")
+    started = lines["held_since"].fillna(lines["last_seen"])
+    lines["days_in_stock"] = np.where(in_stock, (now - started).dt.days, np.nan)
+    lines["age_bucket"] = pd.cut(lines["days_in_stock"], bins=bounds, labels=labels).astype(object)
+
+    def rates(frame):
+        moved = frame["sold"] + frame["quantity"]
+        frame["sell_through"] = (frame["sold"] / moved.where(moved > 0)).round(4)
+        daily = frame["sold"] / window
+        frame["daily_sales"] = daily.round(3)
+        frame["stock_cover_days"] = (frame["quantity"] / daily.where(daily > 0)).round(1)
+        return frame
+
+    lines = rates(lines)
+
+    def rollup(key_columns):
+        grouped = lines.groupby(key_columns, as_index=False, dropna=False).agg(
+            lines=("in_stock", "sum"),
+            quantity=("quantity", "sum"),
+            stock_value=("stock_value", "sum"),
+            sold=("sold", "sum"),
+        )
+        aged = lines[in_stock].pivot_table(
+            index=key_columns, columns="age_bucket", values="stock_value", aggfunc="sum", fill_value=0.0, observed=False
+        ).reindex(columns=labels, fill_value=0.0)
+        aged.columns = [f"value_{label.replace('-', '_').replace('+', '_plus')}_days" for label in labels]
+        grouped = grouped.merge(aged.reset_index(), on=key_columns, how="left")
+        for column in aged.columns:
+            grouped[column] = grouped[column].fillna(0.0).round(2)
+        grouped["stock_value"] = grouped["stock_value"].round(2)
+        return rates(grouped)
+
+    retailers = rollup(["retailer_id", "retailer_code", "retailer_name"])
+    products = rollup(["goods_id", "product_name"])
+
+    bucket_totals = (
+        lines[in_stock].groupby("age_bucket")
+        .agg(lines=("quantity", "size"), quantity=("quantity", "sum"), stock_value=("stock_value", "sum"))
+        .reindex(labels, fill_value=0)
+    )
+
+    line_columns = [
+        "retailer_code", "goods_id", "product_name", "quantity", "stock_value", "held_since", "days_in_stock",
+        "age_bucket", "sold", "sell_through", "daily_sales", "stock_cover_days",
+    ]
+    return {
+        "generated_at": now,
+        "sales_window_days": window,
+        "buckets": [
+            {"bucket": label, "lines": int(row["lines"]), "quantity": int(row["quantity"]), "stock_value": round(float(row["stock_value"]), 2)}
+            for label, row in bucket_totals.iterrows()
+        ],
+        "lines": _records(lines.sort_values(["days_in_stock", "stock_value"], ascending=False, na_position="last")[line_columns]),
+        "retailers": _records(retailers.drop(columns=["retailer_id"]).sort_values("value_90_plus_days", ascending=False)),
+        "products": _records(products.sort_values("stock_cover_days", ascending=False, na_position="first")),
+    }
+
+
+def build_inventory_analytics(db: Session) -> dict:
+    started = datetime.now()
+    analytics = compute_inventory_analytics(load_frames(db), started)
+    logger.info(
+        "✓ Inventory analytics for %d lines in %.0f ms",
+        len(analytics["lines"]), (datetime.now() - started).total_seconds() * 1000
+    )
+    return analytics
+
+
+def get_inventory_analytics_snapshot(db: Session) -> Tuple[dict, str]:
+    """Inventory analytics computed once per data version (and ANALYTICS_MAX_AGE_SECONDS), with its ETag"""
+    version = get_data_version(db)
+    snapshot = snapshot_cache.get("inventory-analytics", version, ANALYTICS_MAX_AGE_SECONDS)
+    if snapshot is not None:
+        return snapshot
+
+    analytics = build_inventory_analytics(db)
+    etag = snapshot_cache.put("inventory-analytics", version, analytics)
+    return analytics, etag
@@ -11,20 +11,50 @@ Uses existing tables:
 """
 
 from datetime import datetime, timedelta
-from typing import List, Tuple
+from typing import Dict, List, Optional, Tuple
 
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
-from models import Retailer, Product, PrmInventorySnapshot, Activation
-from tally_cache import get_closing_balance_with_cache
+from models import Retailer, Product, Activation
+from admission import AdmissionRejected
+from reports import stock_value_select
+from tally_cache import get_closing_balance_with_cache, get_closing_balance_with_cache_async
 
 
-def compute_order_value(db: Session, items: List[dict]) -> Tuple[float, List[str]]:
-    """
-    Compute total order value from goods_id and quantity, using Product.current_price.
+# --- Query builders, shared by the sync and async paths ---
 
-    Returns (order_value, rules_triggered_updates)
-    """
+def retailer_id_select(retailer_code: str):
+    return select(Retailer.id).where(Retailer.retailer_code == retailer_code)
+
+
+def product_prices_select(goods_ids: List[str]):
+    """(goods_id, current_price) for the products in an order"""
+    return select(Product.goods_id, Product.current_price).where(Product.goods_id.in_(goods_ids))
+
+
+def retailer_stock_value_select(retailer_id: int):
+    """Stock value of one retailer, as in the negative report"""
+    return stock_value_select().where(Retailer.id == retailer_id)
+
+
+def recent_sales_value_select(retailer_id: int, since: datetime):
+    """Sum of current prices of the retailer's activations since a date"""
+    return (
+        select(func.coalesce(func.sum(Product.current_price), 0.0))
+        .select_from(Activation)
+        .join(Product, Product.goods_id == Activation.goods_id)
+        .where(
+            Activation.retailer_id == retailer_id,
+            Activation.activation_time != None,
+            Activation.activation_time >= since,
+        )
+    )
+
+
+def price_order_items(items: List[dict], prices: Dict[str, Optional[float]]) -> Tuple[float, List[str]]:
+    """Order value from {goods_id: current_price}; returns (order_value, rules_triggered_updates)"""
     total = 0.0
     rules = []
 
@@ -32,32 +62,40 @@ def compute_order_value(db: Session, items: List[dict]) -> Tuple[float, List[str
         goods_id = item["goods_id"]
         qty = item["quantity"]
 
-        product = db.query(Product).filter_by(goods_id=goods_id).first()
-        if not product or product.current_price is None:
+        price = prices.get(goods_id)
+        if price is None:
             rules.append(
                 f"Warning: No price found for goods_id {goods_id}, treated as ₹0 in order value."
             )
             continue
 
-        line_value = (product.current_price or 0.0) * qty
+        line_value = (price or 0.0) * qty
         total += line_value
 
     return float(total), rules
 
 
-def compute_stock_value(db: Session, retailer_id: int) -> float:
+def _stock_value_from(row) -> float:
+    # No inventory rows -> no aggregate row
+    return float(row[3]) if row is not None else 0.0
+
+
+def compute_order_value(db: Session, items: List[dict]) -> Tuple[float, List[str]]:
     """
-    Compute stock value for a retailer, same logic as negative report.
+    Compute total order value from goods_id and quantity, using Product.current_price.
+
+    Returns (order_value, rules_triggered_updates)
     """
-    stock_value = 0.0
-    items = db.query(PrmInventorySnapshot).filter_by(retailer_id=retailer_id).all()
+    goods_ids = list({item["goods_id"] for item in items})
+    prices = dict(db.execute(product_prices_select(goods_ids)).all()) if goods_ids else {}
+    return price_order_items(items, prices)
 
-    for item in items:
-        product = db.query(Product).filter_by(goods_id=item.goods_id).first()
-        if product and product.current_price:
-            stock_value += item.quantity * product.current_price
 
-    return float(stock_value)
+def compute_stock_value(db: Session, retailer_id: int) -> float:
+    """
+    Compute stock value for a retailer, same logic as negative report.
+    """
+    return _stock_value_from(db.execute(retailer_stock_value_select(retailer_id)).first())
 
 
 def compute_recent_sales_value(db: Session, retailer_id: int, days: int = 30) -> float:
@@ -65,24 +103,7 @@ def compute_recent_sales_value(db: Session, retailer_id: int, days: int = 30) ->
     Approximate recent sales value from activations over given days.
     """
     since = datetime.now() - timedelta(days=days)
-    total = 0.0
-
-    activations = (
-        db.query(Activation)
-        .filter(
-            Activation.retailer_id == retailer_id,
-            Activation.activation_time != None,
-            Activation.activation_time >= since,
-        )
-        .all()
-    )
-
-    for act in activations:
-        product = db.query(Product).filter_by(goods_id=act.goods_id).first()
-        if product and product.current_price:
-            total += product.current_price
-
-    return float(total)
+    return float(db.execute(recent_sales_value_select(retailer_id, since)).scalar() or 0.0)
 
 
 def compute_risk_and_decision(
@@ -163,6 +184,34 @@ def compute_risk_and_decision(
     return decision, float(risk), reasons
 
 
+def _approval_result(
+    order_value: float,
+    closing_balance: float,
+    stock_value: float,
+    recent_sales_30d_value: float,
+    warnings: List[str],
+) -> dict:
+    od_amount = closing_balance - stock_value
+
+    # 3) Compute risk + decision
+    decision, risk_score, reasons = compute_risk_and_decision(
+        order_value=order_value,
+        od_amount=od_amount,
+        recent_sales_30d_value=recent_sales_30d_value,
+    )
+
+    rules_triggered = warnings + reasons
+
+    return {
+        "decision": decision,
+        "risk_score": risk_score,
+        "order_value": order_value,
+        "od_amount": od_amount,
+        "recent_sales_30d_value": recent_sales_30d_value,
+        "rules_triggered": rules_triggered,
+    }
+
+
 def run_auto_approval(
     db: Session,
     retailer_code: str,
@@ -175,16 +224,19 @@ def run_auto_approval(
     """
 
     # 1) Find retailer
-    retailer = db.query(Retailer).filter_by(retailer_code=retailer_code).first()
-    if not retailer:
+    retailer_id = db.execute(retailer_id_select(retailer_code)).scalar()
+    if retailer_id is None:
         raise ValueError(f"Retailer with code {retailer_code} not found")
 
     # 2) Compute numbers
     order_value, pricing_warnings = compute_order_value(db, items)
-    stock_value = compute_stock_value(db, retailer.id)
+    stock_value = compute_stock_value(db, retailer_id)
 
     try:
         closing_balance = get_closing_balance_with_cache(db, retailer_code)
+    except AdmissionRejected:
+        # Too many Tally fetches already: the caller retries rather than getting a HOLD
+        raise
     except Exception as e:
         # If Tally unreachable, treat OD as large and HOLD
         closing_balance = stock_value
@@ -192,23 +244,37 @@ def run_auto_approval(
             f"Warning: Could not fetch Tally for {retailer_code}: {e}"
         )
 
-    od_amount = closing_balance - stock_value
-    recent_sales_30d_value = compute_recent_sales_value(db, retailer.id, days=30)
+    recent_sales_30d_value = compute_recent_sales_value(db, retailer_id, days=30)
+    return _approval_result(order_value, closing_balance, stock_value, recent_sales_30d_value, pricing_warnings)
 
-    # 3) Compute risk + decision
-    decision, risk_score, reasons = compute_risk_and_decision(
-        order_value=order_value,
-        od_amount=od_amount,
-        recent_sales_30d_value=recent_sales_30d_value,
-    )
 
-    rules_triggered = pricing_warnings + reasons
+async def run_auto_approval_async(
+    db: AsyncSession,
+    retailer_code: str,
+    items: List[dict],
+) -> dict:
+    """Async run_auto_approval: same queries and rules, awaited I/O"""
+    retailer_id = (await db.execute(retailer_id_select(retailer_code))).scalar()
+    if retailer_id is None:
+        raise ValueError(f"Retailer with code {retailer_code} not found")
 
-    return {
-        "decision": decision,
-        "risk_score": risk_score,
-        "order_value": order_value,
-        "od_amount": od_amount,
-        "recent_sales_30d_value": recent_sales_30d_value,
-        "rules_triggered": rules_triggered,
-    }
+    goods_ids = list({item["goods_id"] for item in items})
+    prices = dict((await db.execute(product_prices_select(goods_ids))).all()) if goods_ids else {}
+    order_value, pricing_warnings = price_order_items(items, prices)
+    stock_value = _stock_value_from((await db.execute(retailer_stock_value_select(retailer_id))).first())
+
+    try:
+        closing_balance = await get_closing_balance_with_cache_async(db, retailer_code)
+    except AdmissionRejected:
+        # Too many Tally fetches already: the caller retries rather than getting a HOLD
+        raise
+    except Exception as e:
+        # If Tally unreachable, treat OD as large and HOLD
+        closing_balance = stock_value
+        pricing_warnings.append(
+            f"Warning: Could not fetch Tally for {retailer_code}: {e}"
+        )
+
+    since = datetime.now() - timedelta(days=30)
+    recent_sales_30d_value = float((await db.execute(recent_sales_value_select(retailer_id, since))).scalar() or 0.0)
+    return _approval_result(order_value, closing_balance, stock_value, recent_sales_30d_value, pricing_warnings)
@@ -0,0 +1 @@
+"""Benchmarks - run from the project root, e.g. python -m benchmarks.tally_sync_load"""
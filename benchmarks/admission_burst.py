@@ -0,0 +1,146 @@
+"""
+Admission control under a month-end auto-approval burst
+
+Starts the Tally simulator (slow responses) and runs each mode in a
+fresh process, so main reads that mode's settings. The process sends
+--slow approvals for retailers without a cached balance (each needs a
+Tally fetch) mixed at random with --fast approvals for retailers whose
+balance is cached, arriving at --rate requests per second:
+
+- unlimited: ADMISSION_ENABLED=false and no Tally fetch limit
+- admission: the ADMISSION_* / TALLY_FETCH_* settings from the environment
+
+Requests go through the whole ASGI stack in-process (httpx.ASGITransport)
+rather than over sockets: with hundreds of simultaneous connections to
+one uvicorn worker, reading the requests dominates latency and hides
+what happens inside the app. Reports latency of the answered and the
+rejected requests and how many were turned away with 429/503.
+
+Usage:
+    python -m benchmarks.admission_burst --slow 300 --fast 200 --rate 200 --latency-ms 1000
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import random
+import time
+from collections import Counter
+from datetime import datetime
+
+from benchmarks.api_concurrency import serve_simulator, wait_until_up
+from benchmarks.common import free_port, print_table, summarize, use_temp_database
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Auto-approval burst with and without admission control")
+    parser.add_argument("--slow", type=int, default=300, help="Approvals that need a Tally fetch")
+    parser.add_argument("--fast", type=int, default=200, help="Approvals for retailers with a cached balance")
+    parser.add_argument("--latency-ms", type=float, default=1000.0, help="Simulated Tally latency")
+    parser.add_argument("--rate", type=float, default=200.0, help="Arrivals per second")
+    return parser.parse_args()
+
+
+def seed_cached_balances(ledger_names) -> None:
+    import database
+    from models import Retailer, TallyLedgerCache
+
+    db = database.SessionLocal()
+    try:
+        ids = dict(db.query(Retailer.retailer_code, Retailer.id).filter(Retailer.retailer_code.in_(ledger_names)))
+        db.bulk_insert_mappings(TallyLedgerCache, [
+            {"retailer_id": ids[name], "ledger_name": name, "closing_balance": 1000.0, "as_of": datetime.now()}
+            for name in ledger_names
+        ])
+        db.commit()
+    finally:
+        db.close()
+    database.engine.dispose()
+
+
+async def run_burst(app, slow_ledgers, fast_ledgers, rate: float):
+    import httpx
+
+    arrivals = [(ledger, "slow") for ledger in slow_ledgers] + [(ledger, "fast") for ledger in fast_ledgers]
+    random.Random(1).shuffle(arrivals)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=300) as client:
+        async def timed(ledger, kind, delay):
+            await asyncio.sleep(delay)
+            start = time.perf_counter()
+            response = await client.post("/orders/auto-approval", json={
+                "retailer_code": ledger, "items": [{"goods_id": "G00001", "quantity": 1}],
+            })
+            return kind, time.perf_counter() - start, response.status_code
+
+        start = time.perf_counter()
+        results = await asyncio.gather(*(timed(ledger, kind, i / rate) for i, (ledger, kind) in enumerate(arrivals)))
+        elapsed = time.perf_counter() - start
+    return results, elapsed
+
+
+def run_mode(env: dict, slow_ledgers, fast_ledgers, rate: float, results) -> None:
+    """One mode in a child process: import main with env applied, burst, report back"""
+    os.environ.update(env)
+    import main as api
+
+    results.put(asyncio.run(run_burst(api.app, slow_ledgers, fast_ledgers, rate)))
+
+
+def main():
+    args = parse_args()
+    tally_port = free_port()
+
+    use_temp_database()
+    os.environ["TALLY_HOST"] = f"http://127.0.0.1:{tally_port}"
+
+    from tally_simulator import make_ledger_names
+    from benchmarks.tally_sync_load import seed_retailers
+
+    modes = [
+        ("unlimited", {"ADMISSION_ENABLED": "false", "TALLY_FETCH_CONCURRENCY": "100000"}),
+        ("admission", {}),
+    ]
+    per_mode = args.slow + args.fast
+    ledger_names = make_ledger_names(per_mode * len(modes))
+    seed_retailers(ledger_names)
+    # Distinct retailers per mode; the last --fast of each mode have a cached balance
+    groups = [ledger_names[i * per_mode:(i + 1) * per_mode] for i in range(len(modes))]
+    seed_cached_balances([name for group in groups for name in group[args.slow:]])
+
+    simulator = multiprocessing.Process(target=serve_simulator, args=(ledger_names, tally_port, args.latency_ms), daemon=True)
+    simulator.start()
+    results, statuses = [], []
+    try:
+        wait_until_up(f"http://127.0.0.1:{tally_port}")
+        for (label, env), group in zip(modes, groups):
+            queue = multiprocessing.Queue()
+            child = multiprocessing.Process(
+                target=run_mode,
+                args=({**env, "LOG_LEVEL": "ERROR"}, group[:args.slow], group[args.slow:], args.rate, queue),
+            )
+            child.start()
+            burst, elapsed = queue.get()
+            child.join(timeout=30)
+            for kind, name in (("fast", "cached"), ("slow", "Tally-bound")):
+                rows = [r for r in burst if r[0] == kind]
+                answered = [r[1] for r in rows if r[2] == 200]
+                results.append(summarize(f"{label}: {name} (answered)", answered or [0.0], len(answered), elapsed))
+            rejected = [r[1] for r in burst if r[2] in (429, 503)]
+            if rejected:
+                results.append(summarize(f"{label}: rejected (429/503)", rejected, len(rejected), elapsed))
+            statuses.append((label, Counter(r[2] for r in burst if r[0] == "fast"), Counter(r[2] for r in burst if r[0] == "slow")))
+    finally:
+        simulator.terminate()
+        simulator.join(timeout=10)
+
+    print(f"\n{args.slow} Tally-bound + {args.fast} cached approvals at {args.rate:.0f}/s, Tally latency {args.latency_ms:.0f} ms\n")
+    print_table(results)
+    print()
+    for label, fast, slow in statuses:
+        print(f"{label}: cached {dict(sorted(fast.items()))}, Tally-bound {dict(sorted(slow.items()))}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+"""
+API concurrency benchmark: async vs sync request path
+
+Starts the Tally simulator (with a slow response time) and the API (one
+uvicorn worker) in their own processes, so the load generator does not
+compete with them for the GIL. For each mode it keeps many requests waiting on Tally
+(distinct, uncached ledgers) while timing cheap requests for an already
+cached ledger that arrive at the same time:
+
+- async: the real endpoint (AsyncSession + httpx)
+- sync:  the same lookup through a temporary def-endpoint using SessionLocal
+         and requests, as the API worked before (bounded by the threadpool)
+
+With the sync path the Tally waits occupy every threadpool thread and the
+cheap requests queue behind them; with the async path they are served
+immediately.
+
+Usage:
+    python -m benchmarks.api_concurrency --slow 200 --fast 200 --latency-ms 1000
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import time
+from datetime import datetime
+
+from benchmarks.common import free_port, print_table, summarize, use_temp_database
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Async vs sync endpoint concurrency benchmark")
+    parser.add_argument("--slow", type=int, default=200, help="Concurrent requests that wait on Tally")
+    parser.add_argument("--fast", type=int, default=200, help="Cached-ledger requests timed meanwhile")
+    parser.add_argument("--latency-ms", type=float, default=1000.0, help="Simulated Tally latency")
+    return parser.parse_args()
+
+
+def add_sync_route(app):
+    """Register the pre-async version of the endpoint for comparison"""
+    from fastapi import Depends, Query
+    from sqlalchemy.orm import Session
+    import database
+    from tally_cache import get_closing_balance_with_cache
+
+    def sync_closing_balance(ledger: str = Query(...), db: Session = Depends(database.get_db)):
+        return {"ledger": ledger, "closing_balance": get_closing_balance_with_cache(db, ledger)}
+
+    app.add_api_route("/bench/sync-closing-balance", sync_closing_balance, methods=["GET"])
+
+
+async def run_phase(base_url: str, path: str, slow_ledgers, cached_ledger: str, fast: int):
+    import httpx
+
+    limits = httpx.Limits(max_connections=len(slow_ledgers) + fast)
+    async with httpx.AsyncClient(base_url=base_url, timeout=300, limits=limits) as client:
+        async def timed(ledger):
+            start = time.perf_counter()
+            response = await client.get(path, params={"ledger": ledger})
+            return time.perf_counter() - start, response.status_code == 200
+
+        start = time.perf_counter()
+        slow_tasks = [asyncio.create_task(timed(ledger)) for ledger in slow_ledgers]
+        # Let the slow requests reach the server before the cheap ones arrive
+        await asyncio.sleep(0.2)
+        fast_results = await asyncio.gather(*(timed(cached_ledger) for _ in range(fast)))
+        fast_elapsed = time.perf_counter() - start
+        slow_results = await asyncio.gather(*slow_tasks)
+        slow_elapsed = time.perf_counter() - start
+
+    return slow_results, slow_elapsed, fast_results, fast_elapsed
+
+
+def serve_simulator(ledger_names, port: int, latency_ms: float) -> None:
+    from tally_simulator import TallySimulator
+
+    TallySimulator(ledger_names, port=port, latency_ms=latency_ms, vouchers=5).serve_forever()
+
+
+def serve_api(port: int) -> None:
+    import uvicorn
+    import main as api
+
+    add_sync_route(api.app)
+    uvicorn.run(api.app, host="127.0.0.1", port=port, log_level="warning")
+
+
+def wait_until_up(url: str, timeout: float = 30.0) -> None:
+    import requests
+
+    deadline = time.time() + timeout
+    while True:
+        try:
+            requests.get(url, timeout=1)
+            return
+        except requests.exceptions.RequestException:
+            if time.time() > deadline:
+                raise RuntimeError(f"{url} did not come up within {timeout}s")
+            time.sleep(0.1)
+
+
+def seed_cached_balance(ledger_name: str) -> None:
+    """A fresh tally_ledger_cache row, so requests for this ledger never reach Tally"""
+    import database
+    from models import Retailer, TallyLedgerCache
+
+    db = database.SessionLocal()
+    try:
+        retailer = db.query(Retailer).filter_by(retailer_code=ledger_name).one()
+        db.add(TallyLedgerCache(retailer_id=retailer.id, ledger_name=ledger_name, closing_balance=1000.0, as_of=datetime.now()))
+        db.commit()
+    finally:
+        db.close()
+    database.engine.dispose()
+
+
+def main():
+    args = parse_args()
+    tally_port = free_port()
+    api_port = free_port()
+
+    use_temp_database()
+    os.environ["TALLY_HOST"] = f"http://127.0.0.1:{tally_port}"
+    # Measure the request paths themselves, not admission control (see benchmarks.admission_burst)
+    os.environ["TALLY_FETCH_CONCURRENCY"] = str(args.slow * 2)
+
+    from tally_simulator import make_ledger_names
+    from benchmarks.tally_sync_load import seed_retailers
+
+    ledger_names = make_ledger_names(args.slow * 2 + 1)
+    cached_ledger = ledger_names[-1]
+    seed_retailers(ledger_names)
+    seed_cached_balance(cached_ledger)
+
+    processes = [
+        multiprocessing.Process(target=serve_simulator, args=(ledger_names, tally_port, args.latency_ms), daemon=True),
+        multiprocessing.Process(target=serve_api, args=(api_port,), daemon=True),
+    ]
+    for process in processes:
+        process.start()
+    base_url = f"http://127.0.0.1:{api_port}"
+
+    results = []
+    try:
+        wait_until_up(f"http://127.0.0.1:{tally_port}")
+        wait_until_up(f"{base_url}/health")
+
+        # Distinct ledgers per mode so neither benefits from the other's cache
+        modes = [
+            ("sync", "/bench/sync-closing-balance", ledger_names[:args.slow]),
+            ("async", "/tally/closing-balance", ledger_names[args.slow:args.slow * 2]),
+        ]
+        for label, path, slow_ledgers in modes:
+            slow, slow_elapsed, fast, fast_elapsed = asyncio.run(
+                run_phase(base_url, path, slow_ledgers, cached_ledger, args.fast)
+            )
+            results.append(summarize(f"{label}: cached requests", [r[0] for r in fast], len(fast), fast_elapsed))
+            results.append(summarize(f"{label}: Tally-bound requests", [r[0] for r in slow], len(slow), slow_elapsed))
+            failed = sum(1 for r in slow + fast if not r[1])
+            if failed:
+                print(f"⚠ {label}: {failed} failed requests")
+    finally:
+        for process in processes:
+            process.terminate()
+            process.join(timeout=10)
+
+    print(f"\n{args.slow} Tally-bound + {args.fast} cached requests, Tally latency {args.latency_ms:.0f} ms\n")
+    print_table(results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Cold start: time from a fresh interpreter to the first answered request
+
+Each run starts a new Python process that imports main, runs the startup
+events and serves GET /health through a TestClient, the same work a new
+worker does before it can take traffic. The database must already be
+migrated (startup only checks the schema version).
+
+    python -m benchmarks.cold_start --runs 5
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+from benchmarks.common import print_table, summarize, use_temp_database
+
+# Runs in the child: import time and import-to-ready time, as JSON on the last line
+CHILD = """
+import json, sys, time
+start = time.perf_counter()
+import main
+imported = time.perf_counter()
+from fastapi.testclient import TestClient
+with TestClient(main.app) as client:
+    assert client.get("/health").status_code == 200
+ready = time.perf_counter()
+print(json.dumps({"import": imported - start, "ready": ready - start, "pandas": "pandas" in sys.modules}))
+"""
+
+
+def measure_cold_start(runs: int = 5, env: dict = None) -> list:
+    """
+    Summaries for "cold start (import)" and "cold start (ready)" over runs processes
+
+    The ready latency also includes interpreter startup, as seen by whatever
+    launches the worker.
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = {**os.environ, **(env or {}), "LOG_LEVEL": "WARNING"}
+    imports, ready = [], []
+    total = 0.0
+    for _ in range(runs):
+        start = time.perf_counter()
+        proc = subprocess.run([sys.executable, "-c", CHILD], cwd=root, env=env, capture_output=True, text=True, timeout=120)
+        elapsed = time.perf_counter() - start
+        if proc.returncode != 0:
+            raise RuntimeError(f"cold start failed: {proc.stderr.strip()[-500:]}")
+        timings = json.loads(proc.stdout.strip().splitlines()[-1])
+        if timings["pandas"]:
+            print("⚠ pandas was imported at startup")
+        imports.append(timings["import"])
+        ready.append(elapsed)
+        total += elapsed
+    return [
+        summarize("cold start (import main)", imports, runs, sum(imports)),
+        summarize("cold start (process to ready)", ready, runs, total),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure worker cold start (import to first request)")
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    use_temp_database()
+    import database
+    database.init_db()
+    database.engine.dispose()
+
+    print_table(measure_cold_start(args.runs))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""Shared helpers for the benchmark scripts"""
+import os
+import socket
+import tempfile
+import time
+from typing import List, Optional
+
+
+def free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def use_temp_database(directory: Optional[str] = None) -> str:
+    """
+    Point DATABASE_URL at a fresh SQLite file
+
+    Must run before database (or anything importing it) is imported.
+    """
+    directory = directory or tempfile.mkdtemp(prefix="dist-bench-")
+    url = f"sqlite:///{os.path.join(directory, 'bench.db')}"
+    os.environ["DATABASE_URL"] = url
+    return url
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile; values need not be sorted"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered) + 0.5)) - 1))
+    return ordered[rank]
+
+
+def summarize(name: str, latencies: List[float], items: int, elapsed: float) -> dict:
+    """Throughput and latency summary for one benchmark phase (latencies in seconds)"""
+    return {
+        "phase": name,
+        "items": items,
+        "seconds": round(elapsed, 4),
+        "items_per_sec": round(items / elapsed, 1) if elapsed > 0 else None,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+    }
+
+
+def print_table(rows: List[dict]) -> None:
+    header = f"{'phase':<36}{'items':>8}{'seconds':>10}{'items/s':>12}{'p50 ms':>10}{'p99 ms':>10}"
+    print(header)
+    print("-" * len(header))
+    for row in rows:
+        print(
+            f"{row['phase']:<36}{row['items']:>8}{row['seconds']:>10.3f}"
+            f"{(row['items_per_sec'] or 0):>12.1f}{row['p50_ms']:>10.2f}{row['p99_ms']:>10.2f}"
+        )
+
+
+class Timer:
+    """Context manager measuring wall time with perf_counter"""
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self.start
+        return False
@@ -0,0 +1,289 @@
+"""
+Synthetic data generator for benchmarks
+
+Produces data shaped like production at a chosen scale, deterministically
+from a seed:
+
+- PRM IMEI Excel exports in the column layout prm_importer expects
+  (IMEI1 in column 0, Goods ID 2, Product Name 3, Status 4, Activation
+  Time 5, Retailer ID 18, Retailer Name 19)
+- seeded databases with the same retailers, products, inventory,
+  activations, fresh Tally balances and price history, inserted in bulk
+- price lists for /admin/products/prices
+
+Usage:
+    python -m benchmarks.datagen excel --scale small --out prm_small.xlsx
+    python -m benchmarks.datagen db --scale large --database-url sqlite:///./bench_large.db
+"""
+
+import argparse
+import os
+import random
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Iterator, List, Tuple
+
+
+@dataclass(frozen=True)
+class Scale:
+    retailers: int
+    products: int
+    imeis: int
+
+
+SCALES = {
+    "tiny": Scale(retailers=200, products=300, imeis=5_000),
+    "small": Scale(retailers=1_000, products=2_000, imeis=100_000),
+    "large": Scale(retailers=10_000, products=5_000, imeis=1_000_000),
+}
+
+PRM_COLUMNS = [
+    "IMEI1", "IMEI2", "Goods ID", "Product Name", "Status", "Activation Time", "Distributor Code",
+    "Distributor Name", "Inward Time", "Outward Time", "Invoice No", "Region", "State", "City",
+    "Channel", "Sales Person", "Model", "Color", "Retailer ID", "Retailer Name",
+]
+
+# (model, price band); names carry the keywords categorize_product looks for
+_MODELS = [
+    ("Redmi Note 13 5G", (15000, 22000)), ("Redmi 13C", (8000, 11000)), ("Redmi A3", (6000, 8000)),
+    ("Xiaomi 14", (60000, 75000)), ("Xiaomi 14 Ultra", (95000, 110000)), ("POCO X6 Pro", (23000, 28000)),
+    ("POCO M6 5G", (9000, 12000)), ("Redmi Pad SE", (12000, 16000)), ("Xiaomi Pad 6", (26000, 32000)),
+    ("Xiaomi Smart TV A 43", (22000, 28000)), ("Xiaomi TV X Pro 55", (45000, 55000)),
+    ("Xiaomi Power Bank 20000", (1800, 2500)), ("Redmi Buds 5", (2500, 3500)), ("Xiaomi Smart Band 8", (3000, 4000)),
+]
+_VARIANTS = ["4GB+64GB", "6GB+128GB", "8GB+128GB", "8GB+256GB", "12GB+256GB", "12GB+512GB"]
+_COLORS = ["Black", "Blue", "Green", "Silver", "Purple"]
+_CITIES = [
+    ("West", "Maharashtra", "Pune"), ("West", "Maharashtra", "Mumbai"), ("West", "Gujarat", "Ahmedabad"),
+    ("South", "Karnataka", "Bengaluru"), ("South", "Tamil Nadu", "Chennai"), ("North", "Delhi", "New Delhi"),
+    ("North", "Uttar Pradesh", "Lucknow"), ("East", "West Bengal", "Kolkata"),
+]
+_SHOP_WORDS = ["Mobiles", "Telecom", "Electronics", "Mobile World", "Communication", "Digital"]
+_OWNERS = ["Sharma", "Patel", "Reddy", "Khan", "Iyer", "Gupta", "Das", "Singh", "Mehta", "Nair"]
+# Status mix: roughly half the units sit in retailer stock, a third are activated
+_STATUSES = [("Inward by retailer", 0.5), ("Activated", 0.35), ("Outward to retailer", 0.1), ("Returned", 0.05)]
+
+
+def retailer_code(index: int) -> str:
+    return f"RT{100000 + index}"
+
+
+def goods_id(index: int) -> str:
+    return f"{60000000 + index}"
+
+
+def make_retailers(scale: Scale, seed: int = 1) -> List[Tuple[str, str, Tuple[str, str, str]]]:
+    """(retailer_code, name, (region, state, city)) for every retailer"""
+    rng = random.Random(seed)
+    retailers = []
+    for i in range(scale.retailers):
+        region, state, city = rng.choice(_CITIES)
+        name = f"{rng.choice(_OWNERS)} {rng.choice(_SHOP_WORDS)}, {city}"
+        retailers.append((retailer_code(i), name, (region, state, city)))
+    return retailers
+
+
+def make_products(scale: Scale, seed: int = 1) -> List[Tuple[str, str, float]]:
+    """(goods_id, name, price) for every product"""
+    rng = random.Random(seed + 1)
+    products = []
+    for i in range(scale.products):
+        model, (low, high) = _MODELS[i % len(_MODELS)]
+        variant = _VARIANTS[(i // len(_MODELS)) % len(_VARIANTS)]
+        color = _COLORS[(i // (len(_MODELS) * len(_VARIANTS))) % len(_COLORS)]
+        products.append((goods_id(i), f"{model} {variant} {color}", float(round(rng.uniform(low, high), -1))))
+    return products
+
+
+def _pick_status(rng: random.Random) -> str:
+    roll = rng.random()
+    for status, share in _STATUSES:
+        if roll < share:
+            return status
+        roll -= share
+    return _STATUSES[-1][0]
+
+
+def prm_rows(scale: Scale, seed: int = 1, now: datetime = None) -> Iterator[list]:
+    """
+    PRM export rows (PRM_COLUMNS order), generated lazily
+
+    Sales are skewed: a fifth of retailers and a tenth of products get most
+    of the volume, as in real distribution data.
+    """
+    rng = random.Random(seed + 2)
+    now = now or datetime.now().replace(microsecond=0)
+    retailers = make_retailers(scale, seed)
+    products = make_products(scale, seed)
+    hot_retailers = max(1, scale.retailers // 5)
+    hot_products = max(1, scale.products // 10)
+
+    for i in range(scale.imeis):
+        if rng.random() < 0.7:
+            r_index = rng.randrange(hot_retailers)
+        else:
+            r_index = rng.randrange(scale.retailers)
+        p_index = rng.randrange(hot_products) if rng.random() < 0.6 else rng.randrange(scale.products)
+        code, name, (region, state, city) = retailers[r_index]
+        gid, product_name, _ = products[p_index]
+        status = _pick_status(rng)
+        inward = now - timedelta(days=rng.randint(1, 365), minutes=rng.randint(0, 1439))
+        activation = inward + timedelta(days=rng.randint(0, 60)) if status == "Activated" else None
+        if activation is not None and activation > now:
+            activation = now
+        imei = 860000000000000 + i * 2
+        yield [
+            str(imei), str(imei + 1), gid, product_name, status,
+            activation.strftime("%Y-%m-%d %H:%M:%S") if activation else None,
+            "DIST001", "Benchmark Distributors", inward.strftime("%Y-%m-%d %H:%M:%S"), None,
+            f"INV{i // 20:08d}", region, state, city, "Retail", f"SP{r_index % 50:03d}",
+            product_name.rsplit(" ", 2)[0], product_name.rsplit(" ", 1)[-1], code, name,
+        ]
+
+
+def write_prm_excel(path: str, scale: Scale, seed: int = 1) -> str:
+    """Write a PRM IMEI export to path with openpyxl's streaming writer"""
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("PRM IMEI")
+    sheet.append(PRM_COLUMNS)
+    for row in prm_rows(scale, seed):
+        sheet.append(row)
+    workbook.save(path)
+    return path
+
+
+def price_list(scale: Scale, seed: int = 1, changed_share: float = 0.3, new_products: int = 100) -> List[dict]:
+    """/admin/products/prices payload: every product, a share repriced, plus some new SKUs"""
+    rng = random.Random(seed + 3)
+    updates = []
+    for gid, name, price in make_products(scale, seed):
+        if rng.random() < changed_share:
+            price = float(round(price * rng.uniform(0.9, 1.1), -1))
+        updates.append({"goods_id": gid, "name": name, "price": price})
+    for i in range(new_products):
+        updates.append({"goods_id": goods_id(scale.products + i), "name": f"Redmi Note 14 5G 8GB+256GB {_COLORS[i % 5]}", "price": 19990.0})
+    return updates
+
+
+def _insert_chunks(conn, table, rows: List[dict], size: int = 10_000) -> None:
+    from sqlalchemy import insert
+
+    for start in range(0, len(rows), size):
+        conn.execute(insert(table), rows[start:start + size])
+
+
+def seed_database(database, scale: Scale, seed: int = 1, price_history_per_product: int = 3) -> dict:
+    """
+    Fill an empty database with a scale's data using bulk inserts
+
+    Inventory and activations are derived from the same PRM rows the Excel
+    writer produces, the way prm_importer would store them. Every retailer
+    gets a fresh Tally balance (so reports need no Tally calls) spread
+    around its stock value, so a realistic share ends up in the OD report.
+    """
+    from models import Retailer, Product, PrmInventorySnapshot, Activation, TallyLedgerCache, PriceHistory
+    from prm_importer import categorize_product
+
+    rng = random.Random(seed + 4)
+    now = datetime.now().replace(microsecond=0)
+    retailers = make_retailers(scale, seed)
+    products = make_products(scale, seed)
+    retailer_ids = {code: i + 1 for i, (code, _, _) in enumerate(retailers)}
+    prices = {gid: price for gid, _, price in products}
+
+    inventory = {}
+    activations = []
+    for row in prm_rows(scale, seed, now):
+        code, gid, status = row[18], row[2], row[4].lower()
+        if "inward by retailer" in status:
+            key = (retailer_ids[code], gid)
+            inventory[key] = inventory.get(key, 0) + 1
+        if row[5]:
+            activations.append({
+                "goods_id": gid, "imei_sn": row[0], "retailer_id": retailer_ids[code],
+                "activation_status": "Activated", "activation_time": datetime.strptime(row[5], "%Y-%m-%d %H:%M:%S"),
+            })
+
+    stock_value = {}
+    for (retailer_id, gid), quantity in inventory.items():
+        stock_value[retailer_id] = stock_value.get(retailer_id, 0.0) + quantity * prices[gid]
+
+    history = []
+    for product_id, (gid, _, price) in enumerate(products, start=1):
+        old = None
+        for step in range(price_history_per_product, 0, -1):
+            new = price if step == 1 else float(round(price * rng.uniform(0.85, 1.15), -1))
+            history.append({
+                "product_id": product_id, "old_price": old, "new_price": new,
+                "changed_at": now - timedelta(days=30 * step), "source": "datagen",
+            })
+            old = new
+
+    with database.engine.begin() as conn:
+        _insert_chunks(conn, Retailer.__table__, [
+            {"id": retailer_ids[code], "retailer_code": code, "name": name, "tally_ledger_name": code}
+            for code, name, _ in retailers
+        ])
+        _insert_chunks(conn, Product.__table__, [
+            {"id": i, "goods_id": gid, "name": name, "category": categorize_product(name),
+             "current_price": price, "last_price_update": now}
+            for i, (gid, name, price) in enumerate(products, start=1)
+        ])
+        _insert_chunks(conn, PrmInventorySnapshot.__table__, [
+            {"retailer_id": retailer_id, "goods_id": gid, "quantity": quantity, "last_seen": now}
+            for (retailer_id, gid), quantity in inventory.items()
+        ])
+        _insert_chunks(conn, Activation.__table__, activations)
+        _insert_chunks(conn, TallyLedgerCache.__table__, [
+            {"retailer_id": retailer_id, "ledger_name": code,
+             "closing_balance": round(stock_value.get(retailer_id, 0.0) * rng.uniform(0.6, 1.4), 2), "as_of": now}
+            for code, retailer_id in retailer_ids.items()
+        ])
+        _insert_chunks(conn, PriceHistory.__table__, history)
+
+    return {
+        "retailers": len(retailers),
+        "products": len(products),
+        "inventory_rows": len(inventory),
+        "activations": len(activations),
+        "price_history": len(history),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate PRM Excel files and seeded databases")
+    parser.add_argument("target", choices=["excel", "db"])
+    parser.add_argument("--scale", choices=sorted(SCALES), default="small")
+    parser.add_argument("--retailers", type=int, help="Override the scale's retailer count")
+    parser.add_argument("--products", type=int, help="Override the scale's product count")
+    parser.add_argument("--imeis", type=int, help="Override the scale's IMEI row count")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", default="prm_benchmark.xlsx", help="Excel output path")
+    parser.add_argument("--database-url", help="Database to seed (must be empty); defaults to DATABASE_URL")
+    args = parser.parse_args()
+
+    base = SCALES[args.scale]
+    scale = Scale(
+        retailers=args.retailers or base.retailers,
+        products=args.products or base.products,
+        imeis=args.imeis or base.imeis,
+    )
+
+    if args.target == "excel":
+        write_prm_excel(args.out, scale, args.seed)
+        print(f"✓ Wrote {scale.imeis} PRM rows ({scale.retailers} retailers, {scale.products} products) to {args.out}")
+        return
+
+    if args.database_url:
+        os.environ["DATABASE_URL"] = args.database_url
+    import database
+
+    database.init_db()
+    counts = seed_database(database, scale, args.seed)
+    print(f"✓ Seeded {database.DATABASE_URL}: " + ", ".join(f"{v} {k}" for k, v in counts.items()))
+
+
+if __name__ == "__main__":
+    main()
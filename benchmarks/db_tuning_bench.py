@@ -0,0 +1,173 @@
+"""
+Database index and SQLite tuning benchmark
+
+Seeds a temporary SQLite database, then times the hot-path lookups with
+the hot-path indexes dropped ("before") and after database.ensure_indexes()
+recreates them ("after"):
+
+- Latest cached ledger balance per retailer (tally_ledger_cache)
+- Inventory lines per retailer and per goods_id (prm_inventory_snapshot)
+- 30-day activations per retailer (activations)
+
+It also compares small-transaction commit throughput with SQLite's
+defaults (rollback journal, synchronous=FULL) against the tuned
+connection settings (WAL, synchronous=NORMAL).
+
+Usage:
+    python -m benchmarks.db_tuning_bench --retailers 2000 --rows 300000
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import tempfile
+from datetime import datetime, timedelta
+
+from benchmarks.common import Timer, use_temp_database
+
+HOT_PATH_INDEXES = [
+    "ix_tally_ledger_cache_retailer_as_of",
+    "ix_activations_retailer_time",
+    "ix_prm_inventory_snapshot_retailer_id",
+    "ix_prm_inventory_snapshot_goods_id",
+]
+
+QUERIES = {
+    "latest ledger balance": (
+        "SELECT closing_balance FROM tally_ledger_cache WHERE retailer_id = ? ORDER BY as_of DESC LIMIT 1",
+        "retailer",
+    ),
+    "inventory by retailer": (
+        "SELECT goods_id, quantity FROM prm_inventory_snapshot WHERE retailer_id = ?",
+        "retailer",
+    ),
+    "inventory by goods_id": (
+        "SELECT retailer_id, quantity FROM prm_inventory_snapshot WHERE goods_id = ?",
+        "goods",
+    ),
+    "30d activations by retailer": (
+        "SELECT goods_id FROM activations WHERE retailer_id = ? AND activation_time IS NOT NULL AND activation_time >= ?",
+        "activation",
+    ),
+}
+
+
+def seed(database, retailers: int, products: int, rows: int, seed_value: int = 7) -> None:
+    rng = random.Random(seed_value)
+    now = datetime.now()
+    with database.engine.begin() as conn:
+        raw = conn.connection.driver_connection
+        raw.executemany(
+            "INSERT INTO retailers (id, retailer_code, name) VALUES (?, ?, ?)",
+            [(i, f"R{i:05d}", f"Retailer {i}") for i in range(1, retailers + 1)],
+        )
+        raw.executemany(
+            "INSERT INTO products (id, goods_id, name, current_price) VALUES (?, ?, ?, ?)",
+            [(i, f"G{i:05d}", f"Product {i}", rng.uniform(500, 50000)) for i in range(1, products + 1)],
+        )
+        raw.executemany(
+            "INSERT INTO prm_inventory_snapshot (retailer_id, goods_id, quantity, last_seen) VALUES (?, ?, ?, ?)",
+            [
+                (rng.randint(1, retailers), f"G{rng.randint(1, products):05d}", rng.randint(1, 5), now)
+                for _ in range(rows)
+            ],
+        )
+        raw.executemany(
+            "INSERT INTO activations (goods_id, imei_sn, retailer_id, activation_status, activation_time) "
+            "VALUES (?, ?, ?, ?, ?)",
+            [
+                (f"G{rng.randint(1, products):05d}", str(100000000 + i), rng.randint(1, retailers),
+                 "Activated", now - timedelta(days=rng.randint(0, 365)))
+                for i in range(rows)
+            ],
+        )
+        raw.executemany(
+            "INSERT INTO tally_ledger_cache (retailer_id, ledger_name, closing_balance, as_of) VALUES (?, ?, ?, ?)",
+            [
+                (r, f"R{r:05d}", rng.uniform(-50000, 250000), now - timedelta(hours=h))
+                for r in range(1, retailers + 1) for h in range(10)
+            ],
+        )
+
+
+def time_queries(database, retailers: int, products: int, lookups: int) -> dict:
+    rng = random.Random(11)
+    since = datetime.now() - timedelta(days=30)
+    results = {}
+    with database.engine.connect() as conn:
+        raw = conn.connection.driver_connection
+        for label, (sql, kind) in QUERIES.items():
+            if kind == "goods":
+                params = [(f"G{rng.randint(1, products):05d}",) for _ in range(lookups)]
+            elif kind == "activation":
+                params = [(rng.randint(1, retailers), since) for _ in range(lookups)]
+            else:
+                params = [(rng.randint(1, retailers),) for _ in range(lookups)]
+            with Timer() as timer:
+                for p in params:
+                    raw.execute(sql, p).fetchall()
+            results[label] = timer.elapsed / lookups * 1000
+    return results
+
+
+def commit_throughput(journal_mode: str, synchronous: str, commits: int) -> float:
+    """Commits per second for single-row transactions"""
+    path = os.path.join(tempfile.mkdtemp(prefix="dist-bench-"), "commits.db")
+    conn = sqlite3.connect(path, isolation_level=None)
+    conn.execute(f"PRAGMA journal_mode={journal_mode}")
+    conn.execute(f"PRAGMA synchronous={synchronous}")
+    conn.execute("CREATE TABLE t (id INTEGER PRIMARY KEY, value REAL)")
+    with Timer() as timer:
+        for i in range(commits):
+            conn.execute("BEGIN")
+            conn.execute("INSERT INTO t (value) VALUES (?)", (float(i),))
+            conn.execute("COMMIT")
+    conn.close()
+    return commits / timer.elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Hot-path index and SQLite tuning benchmark")
+    parser.add_argument("--retailers", type=int, default=2000)
+    parser.add_argument("--products", type=int, default=500)
+    parser.add_argument("--rows", type=int, default=300000, help="Inventory lines and activations to seed")
+    parser.add_argument("--lookups", type=int, default=200, help="Lookups timed per query")
+    parser.add_argument("--commits", type=int, default=2000)
+    args = parser.parse_args()
+
+    use_temp_database()
+    import database
+    database.init_db()
+
+    print(f"Seeding {args.retailers} retailers, {args.rows} inventory lines and activations...")
+    seed(database, args.retailers, args.products, args.rows)
+
+    with database.engine.begin() as conn:
+        for name in HOT_PATH_INDEXES:
+            conn.exec_driver_sql(f"DROP INDEX IF EXISTS {name}")
+        conn.exec_driver_sql("ANALYZE")
+    before = time_queries(database, args.retailers, args.products, args.lookups)
+
+    database.ensure_indexes()
+    with database.engine.begin() as conn:
+        conn.exec_driver_sql("ANALYZE")
+    after = time_queries(database, args.retailers, args.products, args.lookups)
+
+    print()
+    header = f"{'query':<32}{'before ms':>12}{'after ms':>12}{'speedup':>10}"
+    print(header)
+    print("-" * len(header))
+    for label in QUERIES:
+        speedup = before[label] / after[label] if after[label] else 0.0
+        print(f"{label:<32}{before[label]:>12.3f}{after[label]:>12.3f}{speedup:>9.1f}x")
+
+    print()
+    default_rate = commit_throughput("DELETE", "FULL", args.commits)
+    tuned_rate = commit_throughput(database.SQLITE_JOURNAL_MODE, database.SQLITE_SYNCHRONOUS, args.commits)
+    print(f"{'commits/s (DELETE, FULL)':<32}{default_rate:>12.0f}")
+    print(f"{f'commits/s ({database.SQLITE_JOURNAL_MODE}, {database.SQLITE_SYNCHRONOUS})':<32}{tuned_rate:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+Query budget check for the hot-path endpoints
+
+Seeds a temporary database large enough that a per-row query loop would
+show up (hundreds of retailers, products and cache rows), then calls each
+hot-path endpoint inside query_budget(). Every endpoint has a fixed
+statement budget independent of the data size; a regression that
+reintroduces an N+1 loop exceeds it and the script exits non-zero, so it
+can run in CI:
+
+    python -m benchmarks.query_budget_check --retailers 300
+"""
+
+import argparse
+import os
+import sys
+from datetime import datetime
+
+from benchmarks.common import use_temp_database
+
+# (method, path, payload builder, statement budget)
+CHECKS = [
+    ("GET", "/retailers", None, 2),
+    ("GET", "/reports/negative", None, 6),
+    ("GET", "/retailers/summary", None, 3),
+    ("GET", "/retailers/R00002/summary", None, 3),
+    ("GET", "/tally/closing-balance?ledger=R00001", None, 3),
+    ("POST", "/orders/auto-approval", "approval", 8),
+    ("POST", "/admin/products/prices", "prices", 12),
+    ("POST", "/tally-sync/bulk-ledger-balances", "tally_sync", 12),
+    ("GET", "/debug/price-history?limit=500", None, 2),
+    ("GET", "/debug/tally-cache?limit=500", None, 2),
+    ("GET", "/debug/sync-logs", None, 2),
+    ("GET", "/products/prices/as-of?at=2030-01-01T00:00:00", None, 2),
+    ("GET", "/inventory/as-of?at=2030-01-01T00:00:00&retailer_code=R00001", None, 3),
+    ("GET", "/inventory/trend?retailer_code=R00001", None, 3),
+    ("GET", "/analytics/inventory?view=lines", None, 6),
+    ("GET", "/search?q=shrma", None, 7),
+]
+
+
+def seed(database, retailers: int, products: int) -> None:
+    from models import Retailer, Product, PrmInventorySnapshot, TallyLedgerCache
+
+    now = datetime.now()
+    db = database.SessionLocal()
+    try:
+        db.add_all(Retailer(retailer_code=f"R{i:05d}", name=f"Retailer {i}") for i in range(1, retailers + 1))
+        db.add_all(Product(goods_id=f"G{i:05d}", name=f"Product {i}", current_price=1000.0 + i) for i in range(1, products + 1))
+        db.flush()
+        for retailer_id in range(1, retailers + 1):
+            db.add(TallyLedgerCache(
+                retailer_id=retailer_id, ledger_name=f"R{retailer_id:05d}", closing_balance=50000.0, as_of=now
+            ))
+            for goods in range(1, 6):
+                db.add(PrmInventorySnapshot(
+                    retailer_id=retailer_id, goods_id=f"G{(retailer_id + goods) % products + 1:05d}",
+                    quantity=goods, last_seen=now
+                ))
+        db.commit()
+    finally:
+        db.close()
+
+
+def payloads(retailers: int, products: int) -> dict:
+    return {
+        "approval": {
+            "retailer_code": "R00001",
+            "items": [{"goods_id": f"G{i:05d}", "quantity": 1} for i in range(1, min(products, 50) + 1)],
+        },
+        "prices": {
+            "updates": [{"goods_id": f"G{i:05d}", "price": 2000.0 + i} for i in range(1, products + 1)]
+            + [{"goods_id": f"NEW{i:05d}", "name": f"New {i}", "price": 10.0} for i in range(50)],
+        },
+        "tally_sync": {
+            "api_key": os.environ["TALLY_SYNC_API_KEY"],
+            "entries": [
+                {"retailer_code": f"R{i:05d}", "closing_balance": 1000.0 * i, "as_of": datetime.now().isoformat()}
+                for i in range(1, retailers + 1)
+            ],
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check hot-path endpoints against fixed SQL statement budgets")
+    parser.add_argument("--retailers", type=int, default=300)
+    parser.add_argument("--products", type=int, default=200)
+    args = parser.parse_args()
+
+    use_temp_database()
+    os.environ["TALLY_SYNC_API_KEY"] = "budget-check"
+    # Nothing listens here: any Tally call fails fast instead of hanging
+    os.environ["TALLY_HOST"] = "http://127.0.0.1:9"
+
+    from fastapi.testclient import TestClient
+    import database
+    import main as api
+    from query_budget import QueryBudgetExceeded, query_budget
+
+    database.init_db()
+    seed(database, args.retailers, args.products)
+    bodies = payloads(args.retailers, args.products)
+
+    failures = 0
+    print(f"{'endpoint':<48}{'statements':>12}{'budget':>8}  result")
+    with TestClient(api.app) as client:
+        for method, path, body, budget in CHECKS:
+            result = "ok"
+            try:
+                with query_budget(max_queries=budget) as tracker:
+                    response = client.request(method, path, json=bodies[body] if body else None)
+                if response.status_code >= 400:
+                    result = f"HTTP {response.status_code}"
+                    failures += 1
+            except QueryBudgetExceeded as e:
+                result = str(e)
+                failures += 1
+            print(f"{method + ' ' + path.split('?')[0]:<48}{tracker.count:>12}{budget:>8}  {result}")
+
+    if failures:
+        print(f"\n⚠ {failures} endpoint(s) over budget or failing")
+        sys.exit(1)
+    print("\n✓ All endpoints within their query budgets")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+JSON serialization and compression benchmark
+
+Builds a synthetic negative report and retailer list of the given size and
+times three ways of turning them into a response body:
+
+- response_model: what FastAPI did before (validate into the pydantic
+  response model, jsonable_encoder, then the standard JSONResponse)
+- fast (json):    responses.FastJSONResponse with the standard library encoder
+- fast (orjson):  responses.FastJSONResponse with orjson, when installed
+
+It also reports the gzip size and compression time of the body at the
+configured GZIP_LEVEL.
+
+Usage:
+    python -m benchmarks.serialization_bench --rows 20000 --repeat 5
+"""
+
+import argparse
+import gzip
+import random
+from datetime import datetime
+from typing import List
+
+from benchmarks.common import Timer
+
+
+def make_report(rows: int) -> dict:
+    rng = random.Random(3)
+    return {
+        "generated_at": datetime.now(),
+        "rows": [
+            {
+                "retailer_code": f"R{i:05d}",
+                "retailer_name": f"Retailer {i} Mobile Store",
+                "closing_balance": round(rng.uniform(-50000, 250000), 2),
+                "stock_value": round(rng.uniform(0, 500000), 2),
+                "od_amount": round(rng.uniform(0, 100000), 2),
+            }
+            for i in range(rows)
+        ],
+    }
+
+
+def make_retailers(rows: int) -> List[dict]:
+    return [{"id": i, "retailer_code": f"R{i:05d}", "name": f"Retailer {i} Mobile Store"} for i in range(1, rows + 1)]
+
+
+def best_of(repeat: int, fn) -> float:
+    best = None
+    for _ in range(repeat):
+        with Timer() as timer:
+            fn()
+        best = timer.elapsed if best is None else min(best, timer.elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="JSON serialization and gzip benchmark")
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per method; the best is reported")
+    args = parser.parse_args()
+
+    from fastapi.encoders import jsonable_encoder
+    from fastapi.responses import JSONResponse
+    from pydantic import TypeAdapter
+    import responses
+    import schemas
+
+    payloads = {
+        "negative report": (make_report(args.rows), TypeAdapter(schemas.NegativeReportResponse)),
+        "retailer list": (make_retailers(args.rows), TypeAdapter(List[schemas.RetailerOut])),
+    }
+    orjson = responses.orjson
+
+    def render_json(content):
+        responses.orjson = None
+        try:
+            return responses.dumps(content)
+        finally:
+            responses.orjson = orjson
+
+    print(f"{args.rows} rows, best of {args.repeat} (orjson {'installed' if orjson else 'not installed'})\n")
+    header = f"{'payload':<18}{'method':<18}{'ms':>10}{'speedup':>10}"
+    print(header)
+    print("-" * len(header))
+    for label, (content, adapter) in payloads.items():
+        methods = [
+            ("response_model", lambda: JSONResponse(jsonable_encoder(adapter.validate_python(content))).body),
+            ("fast (json)", lambda: render_json(content)),
+        ]
+        if orjson is not None:
+            methods.append(("fast (orjson)", lambda: responses.dumps(content)))
+
+        baseline = None
+        for method, fn in methods:
+            elapsed = best_of(args.repeat, fn)
+            baseline = baseline or elapsed
+            print(f"{label:<18}{method:<18}{elapsed * 1000:>10.1f}{baseline / elapsed:>9.1f}x")
+
+        body = responses.dumps(content)
+        with Timer() as timer:
+            compressed = gzip.compress(body, compresslevel=responses.GZIP_LEVEL)
+        print(
+            f"{'':<18}gzip level {responses.GZIP_LEVEL}: {len(body) / 1024:.0f} KB -> "
+            f"{len(compressed) / 1024:.0f} KB in {timer.elapsed * 1000:.1f} ms\n"
+        )
+
+
+if __name__ == "__main__":
+    main()
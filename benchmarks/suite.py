@@ -0,0 +1,261 @@
+"""
+Repeatable benchmark suite for the main workloads
+
+Seeds a temporary database at the chosen scale (benchmarks.datagen) and
+times:
+
+- prm import:        import_prm_imei_file on a generated PRM Excel file (own empty database)
+- negative report:   GET /reports/negative, cold (new data version, empty memory cache) and warm
+- retailer summary:  GET /retailers/summary, cold (new data version) and warm
+- inventory analytics: GET /analytics/inventory, cold (new data version) and warm
+- search:            GET /search, type-ahead keystrokes for retailer names, codes and products (with typos)
+- auto-approval:     POST /orders/auto-approval for random retailers and baskets
+- price upload:      POST /admin/products/prices with the full price list
+- bulk ledger sync:  POST /tally-sync/bulk-ledger-balances for every retailer, in batches
+- cold start:        a new process importing main and serving its first request (benchmarks.cold_start)
+
+Each run is appended as one JSON line to --output together with the git
+commit, so runs can be compared across commits; the table printed at the
+end shows the change in p50 against the previous run at the same scale.
+
+Usage:
+    python -m benchmarks.suite --scale tiny
+    python -m benchmarks.suite --scale small --repeat 5 --skip-import
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from benchmarks.cold_start import measure_cold_start
+from benchmarks.common import Timer, print_table, summarize, use_temp_database
+from benchmarks.datagen import SCALES, Scale, price_list, retailer_code, goods_id, seed_database, write_prm_excel
+
+DEFAULT_OUTPUT = os.path.join(os.path.dirname(__file__), "results.jsonl")
+
+
+def git_revision() -> dict:
+    def git(*args):
+        try:
+            return subprocess.run(["git", *args], capture_output=True, text=True, timeout=30).stdout.strip()
+        except (OSError, subprocess.SubprocessError):
+            return ""
+
+    return {"commit": git("rev-parse", "--short", "HEAD") or "unknown", "dirty": bool(git("status", "--porcelain", "--untracked-files=no"))}
+
+
+def time_prm_import(scale: Scale, seed: int, directory: str) -> dict:
+    """Import a generated Excel file into its own empty database"""
+    import database
+    from sqlalchemy.orm import sessionmaker
+    from prm_importer import import_prm_imei_file
+
+    path = os.path.join(directory, f"prm-{scale.imeis}.xlsx")
+    print(f"⟳ Writing {scale.imeis} PRM rows to {path}")
+    write_prm_excel(path, scale, seed)
+
+    engine = database.make_engine(f"sqlite:///{os.path.join(directory, 'import.db')}")
+    database.Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine, autoflush=False)()
+    try:
+        print("⟳ Timing PRM import")
+        with Timer() as timer:
+            import_prm_imei_file(path, db)
+    finally:
+        db.close()
+        engine.dispose()
+    return summarize("prm import", [timer.elapsed], scale.imeis, timer.elapsed)
+
+
+def time_requests(name: str, send, count: int, items: int = None) -> dict:
+    """Send count requests one after another; items is the work they cover (default: count)"""
+    latencies = []
+    with Timer() as total:
+        for i in range(count):
+            start = time.perf_counter()
+            response = send(i)
+            latencies.append(time.perf_counter() - start)
+            if response.status_code >= 400:
+                raise RuntimeError(f"{name}: HTTP {response.status_code} {response.text[:200]}")
+    return summarize(name, latencies, items or count, total.elapsed)
+
+
+def run_api_phases(client, scale: Scale, args) -> list:
+    import database
+    from data_version import bump_data_version
+    from tally_cache import ledger_cache
+
+    rng = random.Random(args.seed)
+    results = []
+
+    def cold_report(_):
+        # A new data version and an empty memory tier: the report is rebuilt from the database
+        db = database.SessionLocal()
+        try:
+            bump_data_version(db, "benchmark")
+            db.commit()
+        finally:
+            db.close()
+        ledger_cache.invalidate()
+        return client.get("/reports/negative")
+
+    results.append(time_requests("negative report (cold)", cold_report, args.repeat))
+    results.append(time_requests("negative report (warm)", lambda _: client.get("/reports/negative"), args.repeat * 10))
+
+    def cold_summary(_):
+        db = database.SessionLocal()
+        try:
+            bump_data_version(db, "benchmark")
+            db.commit()
+        finally:
+            db.close()
+        return client.get("/retailers/summary")
+
+    results.append(time_requests("retailer summary (cold)", cold_summary, args.repeat))
+    results.append(time_requests("retailer summary (warm)", lambda _: client.get("/retailers/summary"), args.repeat * 10))
+
+    def cold_analytics(_):
+        db = database.SessionLocal()
+        try:
+            bump_data_version(db, "benchmark")
+            db.commit()
+        finally:
+            db.close()
+        return client.get("/analytics/inventory")
+
+    results.append(time_requests("inventory analytics (cold)", cold_analytics, args.repeat))
+    results.append(time_requests("inventory analytics (warm)", lambda _: client.get("/analytics/inventory"), args.repeat * 10))
+
+    # Each keystroke of a few searches, as the type-ahead sends them
+    typed = ["sharma mobiles", retailer_code(scale.retailers // 2), "redmi note 13", "ptel telcom", goods_id(scale.products // 3)]
+    keystrokes = [term[:i] for term in typed for i in range(1, len(term) + 1)]
+    results.append(time_requests(
+        "search (type-ahead)", lambda i: client.get("/search", params={"q": keystrokes[i % len(keystrokes)]}), len(keystrokes) * 2
+    ))
+
+    def approval(_):
+        items = [
+            {"goods_id": goods_id(rng.randrange(scale.products)), "quantity": rng.randint(1, 5)}
+            for _ in range(rng.randint(1, 5))
+        ]
+        return client.post("/orders/auto-approval", json={
+            "retailer_code": retailer_code(rng.randrange(scale.retailers)), "items": items,
+        })
+
+    results.append(time_requests("auto-approval", approval, args.repeat * 20))
+
+    # A different seed per repeat, so every upload actually changes prices
+    uploads = [price_list(scale, seed=args.seed + i) for i in range(args.repeat)]
+    results.append(time_requests(
+        "price upload",
+        lambda i: client.post("/admin/products/prices", json={"updates": uploads[i]}),
+        args.repeat,
+        items=len(uploads[0]) * args.repeat,
+    ))
+
+    now = datetime.now().isoformat()
+    entries = [
+        {"retailer_code": retailer_code(i), "closing_balance": round(rng.uniform(-50000, 500000), 2), "as_of": now}
+        for i in range(scale.retailers)
+    ]
+    batches = [entries[i:i + args.batch_size] for i in range(0, len(entries), args.batch_size)]
+    results.append(time_requests(
+        f"bulk ledger sync x{args.batch_size}",
+        lambda i: client.post("/tally-sync/bulk-ledger-balances", json={"api_key": os.environ["TALLY_SYNC_API_KEY"], "entries": batches[i]}),
+        len(batches),
+        items=len(entries),
+    ))
+    return results
+
+
+def previous_run(path: str, scale_name: str):
+    if not os.path.exists(path):
+        return None
+    last = None
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                if record.get("scale") == scale_name:
+                    last = record
+    return last
+
+
+def print_comparison(results: list, previous: dict) -> None:
+    before = {row["phase"]: row for row in previous["results"]}
+    print(f"\nChange in p50 vs {previous['commit']} ({previous['timestamp']}):")
+    for row in results:
+        old = before.get(row["phase"])
+        if not old or not old["p50_ms"]:
+            continue
+        change = (row["p50_ms"] - old["p50_ms"]) / old["p50_ms"] * 100
+        print(f"  {row['phase']:<34}{old['p50_ms']:>10.2f} -> {row['p50_ms']:>10.2f} ms  ({change:+.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark suite for import, reports, approval, prices and ledger sync")
+    parser.add_argument("--scale", choices=sorted(SCALES), default="small")
+    parser.add_argument("--repeat", type=int, default=3, help="Repetitions of the heavy phases (light phases run more)")
+    parser.add_argument("--batch-size", type=int, default=500, help="Entries per bulk-ledger-balances POST")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--skip-import", action="store_true", help="Skip the PRM Excel import phase")
+    parser.add_argument("--skip-cold-start", action="store_true", help="Skip the worker cold start phase")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT, help="JSON-lines file the run is appended to")
+    args = parser.parse_args()
+    scale = SCALES[args.scale]
+
+    directory = tempfile.mkdtemp(prefix="dist-bench-")
+    use_temp_database(directory)
+    os.environ["TALLY_SYNC_API_KEY"] = "benchmark"
+    # Balances are seeded fresh; anything that still reaches Tally fails fast
+    os.environ["TALLY_HOST"] = "http://127.0.0.1:9"
+    os.environ["LOG_LEVEL"] = os.environ.get("LOG_LEVEL", "WARNING")
+    # Time the sync endpoint itself, not the report rebuild it would schedule
+    os.environ["REPORT_PRECOMPUTE_AFTER_SYNC"] = "false"
+
+    from fastapi.testclient import TestClient
+    import database
+    import main as api
+
+    database.init_db()
+    print(f"⟳ Seeding {args.scale} scale: {scale.retailers} retailers, {scale.products} products, {scale.imeis} IMEIs")
+    counts = seed_database(database, scale, args.seed)
+
+    results = []
+    if not args.skip_cold_start:
+        print("⟳ Timing cold start")
+        results.extend(measure_cold_start(args.repeat))
+    if not args.skip_import:
+        results.append(time_prm_import(scale, args.seed, directory))
+    with TestClient(api.app) as client:
+        results.extend(run_api_phases(client, scale, args))
+
+    record = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        **git_revision(),
+        "scale": args.scale,
+        "data": counts,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+    previous = previous_run(args.output, args.scale)
+    with open(args.output, "a") as f:
+        f.write(json.dumps(record) + "\n")
+
+    print()
+    print_table(results)
+    if previous:
+        print_comparison(results, previous)
+    print(f"\n✓ Appended results for {record['commit']}{' (dirty)' if record['dirty'] else ''} to {args.output}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
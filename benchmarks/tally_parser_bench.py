@@ -0,0 +1,108 @@
+"""
+Tally response parser microbenchmark
+
+Compares the shared incremental parser (tally_parser) with the previous
+approach in tally_client (ET.fromstring, four XPath finds, then a scan of
+every element) on large generated responses:
+
+- Ledger report with many voucher lines, balance at the end
+- Ledger report with the balance before the voucher lines (early exit)
+- Ledger collection export with many ledgers
+
+Usage:
+    python -m benchmarks.tally_parser_bench --vouchers 20000 --ledgers 20000
+"""
+
+import argparse
+import timeit
+import xml.etree.ElementTree as ET
+
+from tally_parser import parse_closing_balance, parse_ledger_balances
+from tally_simulator import TallySimulator, make_ledger_names
+
+CHUNK_SIZE = 64 * 1024
+
+
+def legacy_closing_balance(text: str) -> float:
+    """The parsing previously inlined in tally_client.get_closing_balance"""
+    root = ET.fromstring(text)
+    for tag in [".//CLOSINGBALANCE", ".//CLOSINGBALANCE-CREDIT", ".//CLOSINGBALANCE-DEBIT", ".//CURRBALANCE"]:
+        element = root.find(tag)
+        if element is not None and element.text:
+            try:
+                return float(element.text.strip().replace(",", "").replace("Rs.", "").replace("₹", ""))
+            except ValueError:
+                continue
+    for elem in root.iter():
+        if "BALANCE" in elem.tag.upper() and elem.text:
+            try:
+                return float(elem.text.strip().replace(",", "").replace("Rs.", "").replace("₹", ""))
+            except ValueError:
+                continue
+    raise ValueError("no balance")
+
+
+def legacy_ledger_balances(text: str) -> dict:
+    """Whole-tree parse of a collection export"""
+    root = ET.fromstring(text)
+    result = {}
+    for ledger in root.iter("LEDGER"):
+        value = ledger.findtext("CLOSINGBALANCE")
+        if value:
+            result[ledger.get("NAME")] = float(value.replace(",", ""))
+    return result
+
+
+def chunked(data: bytes):
+    return [data[i:i + CHUNK_SIZE] for i in range(0, len(data), CHUNK_SIZE)]
+
+
+def bench(label: str, func, repeat: int) -> float:
+    best = min(timeit.repeat(func, number=1, repeat=repeat))
+    print(f"  {label:<44}{best * 1000:>10.2f} ms")
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tally response parser microbenchmark")
+    parser.add_argument("--vouchers", type=int, default=20000, help="Voucher lines in the ledger report")
+    parser.add_argument("--ledgers", type=int, default=20000, help="Ledgers in the collection export")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    simulator = TallySimulator(make_ledger_names(args.ledgers), port=0, vouchers=args.vouchers)
+    try:
+        name = next(iter(simulator.balances))
+        report = simulator.ledger_report(name)
+        balance_tag = report[report.index("<LEDGERNAME>"):report.index("</ENVELOPE>")]
+        early = "<ENVELOPE>" + balance_tag + report[len("<ENVELOPE>"):report.index("<LEDGERNAME>")] + "</ENVELOPE>"
+        collection = simulator.ledger_collection()
+    finally:
+        simulator.stop()
+
+    report_chunks = chunked(report.encode("utf-8"))
+    early_chunks = chunked(early.encode("utf-8"))
+    collection_chunks = chunked(collection.encode("utf-8"))
+
+    assert legacy_closing_balance(report) == parse_closing_balance(report_chunks)
+    assert legacy_closing_balance(early) == parse_closing_balance(early_chunks)
+    assert legacy_ledger_balances(collection) == parse_ledger_balances(collection_chunks)
+
+    print(f"\nLedger report, balance last ({len(report) / 1e6:.1f} MB, {args.vouchers} vouchers)")
+    old = bench("legacy ET.fromstring + XPath", lambda: legacy_closing_balance(report), args.repeat)
+    new = bench("tally_parser.parse_closing_balance", lambda: parse_closing_balance(report_chunks), args.repeat)
+    print(f"  speedup: {old / new:.1f}x")
+
+    print(f"\nLedger report, balance first ({len(early) / 1e6:.1f} MB)")
+    old = bench("legacy ET.fromstring + XPath", lambda: legacy_closing_balance(early), args.repeat)
+    new = bench("tally_parser.parse_closing_balance", lambda: parse_closing_balance(early_chunks), args.repeat)
+    print(f"  speedup: {old / new:.1f}x")
+
+    print(f"\nLedger collection ({len(collection) / 1e6:.1f} MB, {args.ledgers} ledgers)")
+    old = bench("legacy ET.fromstring + iter", lambda: legacy_ledger_balances(collection), args.repeat)
+    new = bench("tally_parser.parse_ledger_balances", lambda: parse_ledger_balances(collection_chunks), args.repeat)
+    print(f"  speedup: {old / new:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+"""
+End-to-end Tally sync load benchmark
+
+Starts the bundled Tally simulator and the API (uvicorn, temporary SQLite
+database seeded with matching retailers), then drives tally_sync_agent the
+way it runs in production:
+
+1) GET /retailers
+2) per-ledger Ledger report fetches from Tally
+3) POST /tally-sync/bulk-ledger-balances in batches
+
+It also times the single-request ledger collection export from tally_client.
+
+Usage:
+    python -m benchmarks.tally_sync_load --ledgers 2000 --latency-ms 5 --error-rate 0.01
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+
+from benchmarks.common import Timer, free_port, print_table, summarize, use_temp_database
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Tally sync load benchmark against the local simulator")
+    parser.add_argument("--ledgers", type=int, default=1000)
+    parser.add_argument("--latency-ms", type=float, default=5.0, help="Simulated Tally latency per request")
+    parser.add_argument("--jitter-ms", type=float, default=2.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--vouchers", type=int, default=20, help="Voucher lines per simulated Ledger report")
+    parser.add_argument("--batch-size", type=int, default=500, help="Entries per bulk-ledger-balances POST")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    return parser.parse_args()
+
+
+def start_api(port: int):
+    import uvicorn
+    import main as api
+
+    server = uvicorn.Server(uvicorn.Config(api.app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, name="api", daemon=True)
+    thread.start()
+    deadline = time.time() + 30
+    while not server.started:
+        if time.time() > deadline:
+            raise RuntimeError("API did not start within 30s")
+        time.sleep(0.05)
+    return server, thread
+
+
+def seed_retailers(ledger_names):
+    import database
+    from models import Retailer
+
+    database.init_db()
+    db = database.SessionLocal()
+    try:
+        db.bulk_insert_mappings(
+            Retailer,
+            [{"retailer_code": name, "name": f"Retailer {name}"} for name in ledger_names],
+        )
+        db.commit()
+    finally:
+        db.close()
+
+
+def run(args) -> list:
+    tally_port = free_port()
+    api_port = free_port()
+
+    # Configure everything before the app and agent modules read their environment
+    use_temp_database()
+    os.environ["TALLY_HOST"] = f"http://127.0.0.1:{tally_port}"
+    os.environ["BACKEND_BASE_URL"] = f"http://127.0.0.1:{api_port}"
+    os.environ["TALLY_SYNC_API_KEY"] = os.environ.get("TALLY_SYNC_API_KEY") or "bench-key"
+
+    from tally_simulator import TallySimulator, make_ledger_names
+
+    ledger_names = make_ledger_names(args.ledgers)
+    simulator = TallySimulator(
+        ledger_names,
+        port=tally_port,
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate,
+        vouchers=args.vouchers,
+        seed=args.seed,
+    ).start()
+
+    seed_retailers(ledger_names)
+    server, thread = start_api(api_port)
+
+    import requests
+    import tally_client
+    import tally_sync_agent as agent
+
+    results = []
+    try:
+        # 1) Retailer list from the backend
+        with Timer() as t:
+            codes = agent.get_all_retailer_codes()
+        results.append(summarize("agent: GET /retailers", [t.elapsed], len(codes), t.elapsed))
+
+        # 2) Per-ledger Tally fetches, serially like the agent's main loop
+        latencies = []
+        entries = []
+        errors = 0
+        now_iso = datetime.utcnow().isoformat() + "Z"
+        with Timer() as total:
+            for code in codes:
+                start = time.perf_counter()
+                try:
+                    balance = agent.get_closing_balance_from_tally(code)
+                    entries.append({"retailer_code": code, "closing_balance": float(balance), "as_of": now_iso})
+                except Exception:
+                    errors += 1
+                latencies.append(time.perf_counter() - start)
+        results.append(summarize("agent: Tally ledger fetch", latencies, len(codes), total.elapsed))
+
+        # 3) Bulk ledger balance upload in batches
+        url = f"{agent.BACKEND_BASE_URL}/tally-sync/bulk-ledger-balances"
+        latencies = []
+        with Timer() as total:
+            for i in range(0, len(entries), args.batch_size):
+                batch = entries[i:i + args.batch_size]
+                start = time.perf_counter()
+                resp = requests.post(url, json={"api_key": agent.TALLY_SYNC_API_KEY, "entries": batch}, timeout=120)
+                resp.raise_for_status()
+                latencies.append(time.perf_counter() - start)
+        results.append(summarize(f"api: bulk-ledger-balances x{args.batch_size}", latencies, len(entries), total.elapsed))
+
+        # 4) Single collection export covering every ledger
+        with Timer() as t:
+            try:
+                balances = tally_client.get_closing_balances()
+            except Exception:
+                balances = {}
+        results.append(summarize("client: ledger collection export", [t.elapsed], len(balances), t.elapsed))
+
+        if errors:
+            print(f"(Tally fetch errors: {errors}/{len(codes)})", file=sys.stderr)
+    finally:
+        server.should_exit = True
+        thread.join(timeout=10)
+        simulator.stop()
+
+    return results
+
+
+def main():
+    args = parse_args()
+    results = run(args)
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(
+            f"\nTally sync load: {args.ledgers} ledgers, latency {args.latency_ms}±{args.jitter_ms} ms, "
+            f"error rate {args.error_rate}\n"
+        )
+        print_table(results)
+
+
+if __name__ == "__main__":
+    main()
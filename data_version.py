@@ -0,0 +1,101 @@
+"""Data Version - change counter and versioned snapshots for cached responses"""
+import threading
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session
+from models import DataVersion
+
+# The single data_version row, created by the migrations (migrate.py)
+DATA_VERSION_ROW_ID = 1
+
+
+def get_data_version(db: Session) -> int:
+    """Current data version (0 before anything has been bumped)"""
+    version = db.execute(select(DataVersion.version).where(DataVersion.id == DATA_VERSION_ROW_ID)).scalar()
+    return version or 0
+
+
+def bump_data_version(db: Session, reason: str) -> None:
+    """
+    Increment the data version in the caller's transaction
+
+    Call this alongside any write that changes report inputs (inventory
+    import, price update, ledger balance sync); the caller commits. A
+    plain UPDATE of the row the migrations seed, so concurrent first
+    writes never race to insert it.
+    """
+    db.execute(
+        update(DataVersion)
+        .where(DataVersion.id == DATA_VERSION_ROW_ID)
+        .values(version=DataVersion.version + 1, updated_at=datetime.now(), reason=reason)
+    )
+
+
+def make_etag(name: str, version: int, built_at: datetime) -> str:
+    return f'"{name}-{version}-{int(built_at.timestamp())}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """True if an If-None-Match header matches the ETag (weak comparison)"""
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*":
+            return True
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+
+class VersionedSnapshotCache:
+    """
+    Process-local cache of computed responses keyed by name and data version
+
+    A snapshot is reused while the data version is unchanged and it is
+    younger than max_age_seconds (0 means no age limit).
+    """
+
+    def __init__(self):
+        self._snapshots: Dict[str, Tuple[int, datetime, Any, str]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.builds = 0
+
+    def get(self, name: str, version: int, max_age_seconds: float = 0) -> Optional[Tuple[Any, str]]:
+        with self._lock:
+            snapshot = self._snapshots.get(name)
+            if snapshot is None or snapshot[0] != version:
+                return None
+            if max_age_seconds and (datetime.now() - snapshot[1]).total_seconds() > max_age_seconds:
+                return None
+            self.hits += 1
+            return snapshot[2], snapshot[3]
+
+    def put(self, name: str, version: int, value: Any) -> str:
+        built_at = datetime.now()
+        etag = make_etag(name, version, built_at)
+        with self._lock:
+            current = self._snapshots.get(name)
+            # Never replace a snapshot of newer data with an older computation
+            if current is None or current[0] <= version:
+                self._snapshots[name] = (version, built_at, value, etag)
+            self.builds += 1
+        return etag
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "builds": self.builds,
+                "snapshots": {
+                    name: {"version": version, "built_at": built_at.isoformat()}
+                    for name, (version, built_at, _, _) in self._snapshots.items()
+                },
+            }
+
+
+snapshot_cache = VersionedSnapshotCache()
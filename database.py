@@ -1,17 +1,154 @@
 """Database connection and session management"""
 import os
-from sqlalchemy import create_engine
+from typing import Optional
+from sqlalchemy import create_engine, event, inspect, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from dotenv import load_dotenv
 
 load_dotenv()
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./dist_backend.db")
+# Reports, exports and debug views read from here: a replica for PostgreSQL/MySQL.
+# Unset, SQLite reads use a read-only connection to the same file; other
+# databases share the main engine.
+DATABASE_READ_URL = os.getenv("DATABASE_READ_URL", "")
 
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+# Async drivers for the async session, by sync URL scheme
+_ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+    "postgres": "postgresql+asyncpg",
+    "mysql": "mysql+aiomysql",
+}
+
+# SQLite tuning, applied on every new connection
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", "65536"))
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+
+# Connection pool for server databases (PostgreSQL/MySQL)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+
+
+def is_sqlite(url: str) -> bool:
+    return url.startswith("sqlite")
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    try:
+        # WAL lets readers run alongside the writer; NORMAL is durable in WAL mode
+        # except for the last transactions on power loss
+        cursor.execute(f"PRAGMA journal_mode={SQLITE_JOURNAL_MODE}")
+        cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+        # Negative cache_size is in KiB rather than pages
+        cursor.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}")
+        cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    finally:
+        cursor.close()
+
+
+def _set_sqlite_read_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    try:
+        # The journal mode belongs to the writer; a read connection only refuses writes
+        cursor.execute("PRAGMA query_only=ON")
+        cursor.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}")
+        cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    finally:
+        cursor.close()
+
+
+def sqlite_read_only_url(url: str) -> Optional[str]:
+    """sqlite:///x.db -> sqlite:///file:x.db?mode=ro&uri=true (None for in-memory databases)"""
+    parsed = make_url(url)
+    database = parsed.database
+    if not database or database == ":memory:" or database.startswith("file:"):
+        return None
+    read_only = parsed.set(database=f"file:{database}", query={**parsed.query, "mode": "ro", "uri": "true"})
+    return read_only.render_as_string(hide_password=False)
+
+
+def make_engine(url: str, read_only: bool = False, **kwargs):
+    """
+    Engine with per-backend tuning
+
+    SQLite gets check_same_thread=False and the PRAGMAs above on connect
+    (query_only instead of the journal settings when read_only); other
+    databases get a sized, pre-pinged, recycled connection pool.
+    """
+    if is_sqlite(url):
+        connect_args = {"check_same_thread": False}
+        connect_args.update(kwargs.pop("connect_args", {}))
+        engine = create_engine(url, connect_args=connect_args, **kwargs)
+        event.listen(engine, "connect", _set_sqlite_read_pragmas if read_only else _set_sqlite_pragmas)
+        return engine
+
+    return create_engine(
+        url,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=DB_POOL_PRE_PING,
+        **kwargs
+    )
+
+
+def to_async_url(url: str) -> str:
+    """sqlite:///x.db -> sqlite+aiosqlite:///x.db, postgresql://... -> postgresql+asyncpg://..."""
+    scheme, sep, rest = url.partition("://")
+    driver = _ASYNC_DRIVERS.get(scheme.split("+", 1)[0])
+    return f"{driver}{sep}{rest}" if driver else url
+
+
+def make_async_engine(url: str, read_only: bool = False, **kwargs):
+    """Async engine with the same per-backend tuning as make_engine"""
+    if is_sqlite(url):
+        engine = create_async_engine(url, **kwargs)
+        event.listen(engine.sync_engine, "connect", _set_sqlite_read_pragmas if read_only else _set_sqlite_pragmas)
+        return engine
+
+    return create_async_engine(
+        url,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=DB_POOL_PRE_PING,
+        **kwargs
+    )
+
+
+engine = make_engine(DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+# Async engine/session for the async endpoints (aiosqlite / asyncpg)
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or to_async_url(DATABASE_URL)
+async_engine = make_async_engine(ASYNC_DATABASE_URL)
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+# Read-only engines/sessions for reports, exports and debug views, so long
+# reads neither hold write-pool connections nor wait on the PRM import
+READ_DATABASE_URL = DATABASE_READ_URL or (sqlite_read_only_url(DATABASE_URL) if is_sqlite(DATABASE_URL) else None)
+if READ_DATABASE_URL:
+    read_engine = make_engine(READ_DATABASE_URL, read_only=True)
+    async_read_engine = make_async_engine(os.getenv("ASYNC_DATABASE_READ_URL") or to_async_url(READ_DATABASE_URL), read_only=True)
+else:
+    read_engine = engine
+    async_read_engine = async_engine
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+AsyncReadSessionLocal = async_sessionmaker(async_read_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+
 def get_db():
     db = SessionLocal()
     try:
@@ -19,7 +156,62 @@ def get_db():
     finally:
         db.close()
 
+
+def get_read_db():
+    """Session on the read-only engine, for endpoints that never write"""
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+async def get_async_read_db():
+    async with AsyncReadSessionLocal() as db:
+        yield db
+
+
 def init_db():
-    from models import Retailer, Product, PrmInventorySnapshot, Activation, TallyLedgerCache, PrmSyncRunLog
-    Base.metadata.create_all(bind=engine)
-    print("Database tables created")
\ No newline at end of file
+    """Create or upgrade the schema; same as `python migrate.py`"""
+    from migrate import migrate
+    migrate()
+    print("Database tables created")
+
+
+def _index_names(bind, inspector, table_name: str) -> set:
+    """Index names on a table, including expression indexes SQLite reflection skips"""
+    if bind.dialect.name == "sqlite":
+        with bind.connect() as conn:
+            return set(conn.execute(
+                text("SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = :table"), {"table": table_name}
+            ).scalars())
+    return {index["name"] for index in inspector.get_indexes(table_name)}
+
+
+def ensure_indexes(bind=None) -> list:
+    """
+    Create indexes declared on the models that an existing database is missing
+
+    create_all only creates indexes together with new tables, so this is
+    the migration path for indexes added to existing tables. Returns the
+    names of the indexes created.
+    """
+    bind = bind or engine
+    inspector = inspect(bind)
+    existing_tables = set(inspector.get_table_names())
+    created = []
+    for table in Base.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing = _index_names(bind, inspector, table.name)
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(bind=bind)
+                created.append(index.name)
+                print(f"✓ Created index {index.name} on {table.name}")
+    return created
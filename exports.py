@@ -0,0 +1,142 @@
+"""Exports - streaming CSV/NDJSON downloads of reports and inventory"""
+import csv
+import io
+import json
+import os
+from datetime import date, datetime
+from typing import Any, Iterable, Iterator, Sequence
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+import database
+from models import Retailer, Product, PrmInventorySnapshot, Activation
+
+# Rows fetched per round trip and written per chunk
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "2000"))
+
+EXPORT_FORMATS = ("csv", "ndjson")
+_MEDIA_TYPES = {
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson",
+}
+
+NEGATIVE_REPORT_COLUMNS = ["retailer_code", "retailer_name", "closing_balance", "stock_value", "od_amount"]
+INVENTORY_COLUMNS = [
+    "retailer_code", "retailer_name", "goods_id", "product_name", "category",
+    "quantity", "current_price", "stock_value", "last_seen",
+]
+ACTIVATION_COLUMNS = [
+    "id", "imei_sn", "goods_id", "product_name", "retailer_code", "retailer_name",
+    "activation_status", "activation_time",
+]
+
+
+def inventory_export_select():
+    """Inventory snapshot rows joined with retailer and product, in INVENTORY_COLUMNS order"""
+    return (
+        select(
+            Retailer.retailer_code,
+            Retailer.name,
+            PrmInventorySnapshot.goods_id,
+            Product.name,
+            Product.category,
+            PrmInventorySnapshot.quantity,
+            Product.current_price,
+            PrmInventorySnapshot.quantity * Product.current_price,
+            PrmInventorySnapshot.last_seen,
+        )
+        .join(Retailer, Retailer.id == PrmInventorySnapshot.retailer_id)
+        .outerjoin(Product, Product.goods_id == PrmInventorySnapshot.goods_id)
+        .order_by(PrmInventorySnapshot.id)
+    )
+
+
+def activation_export_select():
+    """Activations joined with product and retailer, in ACTIVATION_COLUMNS order"""
+    return (
+        select(
+            Activation.id,
+            Activation.imei_sn,
+            Activation.goods_id,
+            Product.name,
+            Retailer.retailer_code,
+            Retailer.name,
+            Activation.activation_status,
+            Activation.activation_time,
+        )
+        .outerjoin(Product, Product.goods_id == Activation.goods_id)
+        .outerjoin(Retailer, Retailer.id == Activation.retailer_id)
+        .order_by(Activation.id)
+    )
+
+
+def _json_default(value: Any):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return str(value)
+
+
+def _csv_value(value: Any):
+    if value is None:
+        return ""
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+def encode_rows(rows: Iterable[Sequence[Any]], columns: Sequence[str], fmt: str) -> Iterator[bytes]:
+    """
+    Encode rows as CSV (with header) or NDJSON, one chunk per EXPORT_BATCH_SIZE rows
+
+    Only one batch is ever held in memory.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer) if fmt == "csv" else None
+    if writer is not None:
+        writer.writerow(columns)
+
+    pending = 0
+    for row in rows:
+        if writer is not None:
+            writer.writerow([_csv_value(value) for value in row])
+        else:
+            buffer.write(json.dumps(dict(zip(columns, row)), default=_json_default, separators=(",", ":")))
+            buffer.write("\n")
+        pending += 1
+        if pending >= EXPORT_BATCH_SIZE:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+
+def stream_query(statement, columns: Sequence[str], fmt: str) -> Iterator[bytes]:
+    """
+    Run a select with a server-side cursor and encode rows as they are fetched
+
+    Opens its own read-only session: the request's session is closed
+    before a streaming response body is sent.
+    """
+    db = database.ReadSessionLocal()
+    try:
+        result = db.execute(statement.execution_options(yield_per=EXPORT_BATCH_SIZE))
+        yield from encode_rows(result, columns, fmt)
+    finally:
+        db.close()
+
+
+def export_response(chunks: Iterator[bytes], name: str, fmt: str) -> StreamingResponse:
+    """StreamingResponse that downloads as <name>-<timestamp>.<fmt>"""
+    filename = f"{name}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.{fmt}"
+    return StreamingResponse(
+        chunks,
+        media_type=_MEDIA_TYPES[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+def negative_report_rows(report: dict) -> Iterator[list]:
+    for row in report["rows"]:
+        yield [row[column] for column in NEGATIVE_REPORT_COLUMNS]
@@ -1,11 +1,67 @@
 import api from "./client";
 
-export async function getRetailers() {
-  const res = await api.get("/retailers");
-  return res.data;
+export async function getRetailersPage(cursor?: string | null, limit = 500) {
+  const params: Record<string, string | number> = { limit };
+  if (cursor) params.cursor = cursor;
+  const res = await api.get("/retailers", { params });
+  return {
+    items: res.data,
+    nextCursor: (res.headers["x-next-cursor"] as string | undefined) ?? null,
+  };
+}
+
+export async function getAllRetailers() {
+  const all = [];
+  let cursor: string | null = null;
+  do {
+    const page = await getRetailersPage(cursor, 5000);
+    all.push(...page.items);
+    cursor = page.nextCursor;
+  } while (cursor);
+  return all;
 }
 
 export async function getNegativeReport() {
   const res = await api.get("/reports/negative");
   return res.data;
 }
+
+export interface RetailerSummaryRow {
+  retailer_id: number;
+  retailer_code: string;
+  retailer_name: string;
+  stock_value: number;
+  inventory_lines: number;
+  closing_balance: number | null;
+  balance_as_of: string | null;
+  balance_age_minutes: number | null;
+  balance_expired: boolean;
+  od_amount: number | null;
+  sales_30d_value: number;
+  last_activation: string | null;
+}
+
+export interface RetailerSummary {
+  generated_at: string;
+  last_sync_at: string | null;
+  totals: {
+    retailers: number;
+    with_inventory: number;
+    od_retailers: number;
+    total_od_amount: number;
+    total_stock_value: number;
+    balances_missing_or_expired: number;
+  };
+  rows: RetailerSummaryRow[];
+}
+
+// Everything the Dashboard and Retailers pages show, in one request
+export async function getRetailerSummary(): Promise<RetailerSummary> {
+  const res = await api.get("/retailers/summary");
+  return res.data;
+}
+
+export async function getRetailerSummaryFor(retailerCode: string): Promise<RetailerSummaryRow> {
+  const res = await api.get(`/retailers/${encodeURIComponent(retailerCode)}/summary`);
+  return res.data;
+}
@@ -0,0 +1,43 @@
+import { useEffect, useState } from "react";
+import api from "./client";
+
+export type SearchType = "all" | "retailer" | "product";
+
+export interface SearchResult {
+  type: "retailer" | "product";
+  code: string;
+  name: string | null;
+  score: number;
+  match: "exact" | "prefix" | "word_prefix" | "substring" | "fuzzy";
+}
+
+// Ranked retailers/products by code or name, typos included
+export async function searchCatalog(q: string, type: SearchType = "all", limit = 10): Promise<SearchResult[]> {
+  const res = await api.get("/search", { params: { q, type, limit } });
+  return res.data.results;
+}
+
+// Type-ahead results for term, fetched once typing pauses; null while term is empty
+export function useSearch(term: string, type: SearchType = "all", limit = 10, delayMs = 150) {
+  const [results, setResults] = useState<SearchResult[] | null>(null);
+
+  useEffect(() => {
+    const q = term.trim();
+    if (!q) {
+      setResults(null);
+      return;
+    }
+    let cancelled = false;
+    const timer = setTimeout(() => {
+      searchCatalog(q, type, limit)
+        .then((found) => !cancelled && setResults(found))
+        .catch(() => !cancelled && setResults([]));
+    }, delayMs);
+    return () => {
+      cancelled = true;
+      clearTimeout(timer);
+    };
+  }, [term, type, limit, delayMs]);
+
+  return results;
+}
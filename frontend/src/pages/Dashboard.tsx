@@ -1,14 +1,5 @@
 import { useEffect, useState } from 'react';
-import { getRetailers, getNegativeReport } from '../api/retailers';
-import api from '../api/client';
-
-interface NegativeReportRow {
-  retailer_code: string;
-  retailer_name: string;
-  closing_balance: number;
-  stock_value: number;
-  od_amount: number;
-}
+import { getRetailerSummary, RetailerSummaryRow } from '../api/retailers';
 
 interface Stats {
   totalRetailers: number;
@@ -19,7 +10,7 @@ interface Stats {
 
 export default function Dashboard() {
   const [stats, setStats] = useState<Stats | null>(null);
-  const [topOdRetailers, setTopOdRetailers] = useState<NegativeReportRow[]>([]);
+  const [topOdRetailers, setTopOdRetailers] = useState<RetailerSummaryRow[]>([]);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState('');
 
@@ -32,24 +23,21 @@ export default function Dashboard() {
       setLoading(true);
       setError('');
 
-      const [retailers, report, syncLogsRes] = await Promise.all([
-        getRetailers(),
-        getNegativeReport(),
-        api.get('/debug/sync-logs?limit=1'),
-      ]);
-
-      const syncLogs = syncLogsRes.data;
-      const totalOd = report.rows.reduce((sum: number, row: NegativeReportRow) => sum + row.od_amount, 0);
-      const lastSync = syncLogs.logs[0]?.finished_at || 'Never';
+      const summary = await getRetailerSummary();
 
       setStats({
-        totalRetailers: retailers.length,
-        odRetailers: report.rows.length,
-        totalOdAmount: totalOd,
-        lastSyncTime: lastSync,
+        totalRetailers: summary.totals.retailers,
+        odRetailers: summary.totals.od_retailers,
+        totalOdAmount: summary.totals.total_od_amount,
+        lastSyncTime: summary.last_sync_at || 'Never',
       });
 
-      setTopOdRetailers(report.rows.slice(0, 5));
+      setTopOdRetailers(
+        summary.rows
+          .filter((row) => (row.od_amount ?? 0) > 0)
+          .sort((a, b) => (b.od_amount ?? 0) - (a.od_amount ?? 0))
+          .slice(0, 5)
+      );
     } catch (err: unknown) {
       setError((err as Error).message || 'Failed to load dashboard');
     } finally {
@@ -120,10 +108,10 @@ export default function Dashboard() {
                 <tr key={row.retailer_code}>
                   <td style={{ fontWeight: '600' }}>{row.retailer_code}</td>
                   <td>{row.retailer_name}</td>
-                  <td>₹{row.closing_balance.toLocaleString()}</td>
+                  <td>₹{(row.closing_balance ?? 0).toLocaleString()}</td>
                   <td>₹{row.stock_value.toLocaleString()}</td>
                   <td style={{ color: 'var(--color-danger)', fontWeight: '600' }}>
-                    ₹{row.od_amount.toLocaleString()}
+                    ₹{(row.od_amount ?? 0).toLocaleString()}
                   </td>
                 </tr>
               ))}
@@ -1,5 +1,6 @@
 import { useState } from 'react';
 import { autoApproval } from '../api/orders';
+import { useSearch } from '../api/search';
 
 interface OrderItem {
   goods_id: string;
@@ -26,6 +27,9 @@ export default function Orders() {
   const [result, setResult] = useState<AutoApprovalDecision | null>(null);
   const [loading, setLoading] = useState(false);
   const [error, setError] = useState('');
+  const [activeItem, setActiveItem] = useState(0);
+  const retailerMatches = useSearch(retailerCode, 'retailer');
+  const productMatches = useSearch(items[activeItem]?.goods_id ?? '', 'product');
 
   function addItem() {
     setItems([...items, { goods_id: '', quantity: 1 }]);
@@ -93,7 +97,13 @@ export default function Orders() {
               placeholder="Enter retailer code"
               value={retailerCode}
               onChange={(e) => setRetailerCode(e.target.value)}
+              list="retailer-suggestions"
             />
+            <datalist id="retailer-suggestions">
+              {(retailerMatches ?? []).map((m) => (
+                <option key={m.code} value={m.code}>{m.name}</option>
+              ))}
+            </datalist>
           </div>
 
           <div style={{ marginBottom: '24px' }}>
@@ -104,6 +114,12 @@ export default function Orders() {
               </button>
             </div>
 
+            <datalist id="product-suggestions">
+              {(productMatches ?? []).map((m) => (
+                <option key={m.code} value={m.code}>{m.name}</option>
+              ))}
+            </datalist>
+
             {items.map((item, index) => (
               <div key={index} style={{ display: 'flex', gap: '12px', marginBottom: '12px' }}>
                 <input
@@ -112,6 +128,8 @@ export default function Orders() {
                   placeholder="Goods ID"
                   value={item.goods_id}
                   onChange={(e) => updateItem(index, 'goods_id', e.target.value)}
+                  onFocus={() => setActiveItem(index)}
+                  list="product-suggestions"
                   style={{ flex: 2 }}
                 />
                 <input
@@ -1,17 +1,17 @@
 import { useEffect, useState } from 'react';
-import { getRetailers } from '../api/retailers';
+import { getRetailerSummary, RetailerSummaryRow } from '../api/retailers';
+import { useSearch } from '../api/search';
 
-interface Retailer {
-  id: number;
-  retailer_code: string;
-  name: string;
-}
+const PAGE_SIZE = 500;
+const SEARCH_LIMIT = 50;
 
 export default function Retailers() {
-  const [retailers, setRetailers] = useState<Retailer[]>([]);
+  const [retailers, setRetailers] = useState<RetailerSummaryRow[]>([]);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState('');
   const [searchTerm, setSearchTerm] = useState('');
+  const [visible, setVisible] = useState(PAGE_SIZE);
+  const matches = useSearch(searchTerm, 'retailer', SEARCH_LIMIT);
 
   useEffect(() => {
     loadRetailers();
@@ -21,8 +21,8 @@ export default function Retailers() {
     try {
       setLoading(true);
       setError('');
-      const data = await getRetailers();
-      setRetailers(data);
+      const summary = await getRetailerSummary();
+      setRetailers(summary.rows);
     } catch (err: unknown) {
       setError((err as Error).message || 'Failed to load retailers');
     } finally {
@@ -30,11 +30,11 @@ export default function Retailers() {
     }
   }
 
-  const filteredRetailers = retailers.filter(
-    (r) =>
-      r.retailer_code.toLowerCase().includes(searchTerm.toLowerCase()) ||
-      r.name.toLowerCase().includes(searchTerm.toLowerCase())
-  );
+  // Server-side ranked search (prefix, then substring, then typos), best match first
+  const byCode = new Map(retailers.map((r) => [r.retailer_code, r]));
+  const filteredRetailers = matches === null
+    ? retailers
+    : matches.flatMap((m) => byCode.get(m.code) ?? []);
 
   if (loading) {
     return <div className="loading">Loading retailers...</div>;
@@ -67,23 +67,47 @@ export default function Retailers() {
         <table className="table">
           <thead>
             <tr>
-              <th>ID</th>
               <th>Retailer Code</th>
               <th>Name</th>
+              <th>Stock Value</th>
+              <th>Closing Balance</th>
+              <th>OD Amount</th>
+              <th>30-day Sales</th>
+              <th>Last Activation</th>
             </tr>
           </thead>
           <tbody>
-            {filteredRetailers.map((retailer) => (
-              <tr key={retailer.id}>
-                <td>{retailer.id}</td>
+            {filteredRetailers.slice(0, visible).map((retailer) => (
+              <tr key={retailer.retailer_id}>
                 <td style={{ fontWeight: '600', color: 'var(--color-primary)' }}>
                   {retailer.retailer_code}
                 </td>
-                <td>{retailer.name}</td>
+                <td>{retailer.retailer_name}</td>
+                <td>₹{retailer.stock_value.toLocaleString()}</td>
+                <td title={retailer.balance_as_of ? `As of ${new Date(retailer.balance_as_of).toLocaleString()}` : 'Not cached yet'}>
+                  {retailer.closing_balance === null ? '—' : `₹${retailer.closing_balance.toLocaleString()}`}
+                  {retailer.closing_balance !== null && retailer.balance_expired && (
+                    <span style={{ color: 'var(--color-warning)', marginLeft: '6px' }}>
+                      ({Math.round((retailer.balance_age_minutes || 0) / 60)}h old)
+                    </span>
+                  )}
+                </td>
+                <td style={(retailer.od_amount ?? 0) > 0 ? { color: 'var(--color-danger)', fontWeight: '600' } : undefined}>
+                  {(retailer.od_amount ?? 0) > 0 ? `₹${(retailer.od_amount ?? 0).toLocaleString()}` : '—'}
+                </td>
+                <td>₹{retailer.sales_30d_value.toLocaleString()}</td>
+                <td>{retailer.last_activation ? new Date(retailer.last_activation).toLocaleDateString() : 'Never'}</td>
               </tr>
             ))}
           </tbody>
         </table>
+        {filteredRetailers.length > visible && (
+          <div style={{ marginTop: '16px', textAlign: 'center' }}>
+            <button className="btn btn-secondary" onClick={() => setVisible((count) => count + PAGE_SIZE)}>
+              Show more
+            </button>
+          </div>
+        )}
       </div>
     </div>
   );
@@ -0,0 +1,162 @@
+"""Inventory History - append-only dated inventory snapshots stored as deltas, with point-in-time and trend queries"""
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import and_, func, insert, select
+from sqlalchemy.orm import Session
+from models import InventoryHistoryDelta, InventoryHistoryRun, PrmInventorySnapshot, Retailer
+
+# Delta rows per INSERT statement
+HISTORY_INSERT_CHUNK = 5000
+
+
+def record_inventory_history(
+    db: Session,
+    inventory: Dict[Tuple[int, str], int],
+    taken_at: datetime,
+    sync_run_id: Optional[int] = None,
+) -> dict:
+    """
+    Record an import's inventory as a history run plus the lines that changed
+
+    inventory maps (retailer_id, goods_id) to quantity. It is compared with
+    prm_inventory_snapshot, which still holds the previous import, so this
+    must run before the snapshot table is rebuilt; lines that disappeared
+    are stored with quantity 0. The first run ever recorded stores every
+    line as its baseline. Does not commit, so the history and the rebuilt
+    snapshot land in the same transaction.
+    """
+    previous: Dict[Tuple[int, str], int] = {}
+    if db.execute(select(InventoryHistoryRun.id).limit(1)).first() is not None:
+        for retailer_id, goods_id, quantity in db.execute(
+            select(PrmInventorySnapshot.retailer_id, PrmInventorySnapshot.goods_id, PrmInventorySnapshot.quantity)
+        ):
+            previous[(retailer_id, goods_id)] = previous.get((retailer_id, goods_id), 0) + quantity
+
+    changes = [
+        (key, inventory.get(key, 0))
+        for key in inventory.keys() | previous.keys()
+        if inventory.get(key, 0) != previous.get(key, 0)
+    ]
+
+    run = InventoryHistoryRun(
+        taken_at=taken_at,
+        sync_run_id=sync_run_id,
+        lines=sum(1 for quantity in inventory.values() if quantity > 0),
+        units=sum(inventory.values()),
+        changed_lines=len(changes),
+    )
+    db.add(run)
+    db.flush()
+
+    rows = [
+        {"run_id": run.id, "retailer_id": retailer_id, "goods_id": goods_id, "quantity": quantity}
+        for (retailer_id, goods_id), quantity in sorted(changes)
+    ]
+    for start in range(0, len(rows), HISTORY_INSERT_CHUNK):
+        db.execute(insert(InventoryHistoryDelta), rows[start:start + HISTORY_INSERT_CHUNK])
+    return {"run_id": run.id, "changed_lines": len(changes)}
+
+
+def run_as_of(db: Session, at: datetime) -> Optional[InventoryHistoryRun]:
+    """The latest history run taken at or before at"""
+    return (
+        db.query(InventoryHistoryRun)
+        .filter(InventoryHistoryRun.taken_at <= at)
+        .order_by(InventoryHistoryRun.taken_at.desc(), InventoryHistoryRun.id.desc())
+        .first()
+    )
+
+
+def _filtered(statement, retailer_id: Optional[int], goods_id: Optional[str]):
+    if retailer_id is not None:
+        statement = statement.where(InventoryHistoryDelta.retailer_id == retailer_id)
+    if goods_id is not None:
+        statement = statement.where(InventoryHistoryDelta.goods_id == goods_id)
+    return statement
+
+
+def inventory_at_run(
+    db: Session, run_id: int, retailer_id: Optional[int] = None, goods_id: Optional[str] = None
+) -> List[dict]:
+    """
+    Inventory lines held as of a history run, in one statement
+
+    Each line's quantity is its latest delta at or before the run; lines
+    whose latest delta is 0 had left the inventory by then.
+    """
+    latest = _filtered(
+        select(
+            InventoryHistoryDelta.retailer_id,
+            InventoryHistoryDelta.goods_id,
+            func.max(InventoryHistoryDelta.run_id).label("run_id"),
+        ).where(InventoryHistoryDelta.run_id <= run_id),
+        retailer_id,
+        goods_id,
+    ).group_by(InventoryHistoryDelta.retailer_id, InventoryHistoryDelta.goods_id).subquery()
+
+    rows = db.execute(
+        select(Retailer.retailer_code, InventoryHistoryDelta.goods_id, InventoryHistoryDelta.quantity)
+        .join(latest, and_(
+            InventoryHistoryDelta.retailer_id == latest.c.retailer_id,
+            InventoryHistoryDelta.goods_id == latest.c.goods_id,
+            InventoryHistoryDelta.run_id == latest.c.run_id,
+        ))
+        .join(Retailer, Retailer.id == InventoryHistoryDelta.retailer_id)
+        .where(InventoryHistoryDelta.quantity > 0)
+        .order_by(Retailer.retailer_code, InventoryHistoryDelta.goods_id)
+    ).all()
+    return [{"retailer_code": code, "goods_id": goods, "quantity": quantity} for code, goods, quantity in rows]
+
+
+def inventory_trend(
+    db: Session,
+    retailer_id: Optional[int] = None,
+    goods_id: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+) -> List[dict]:
+    """
+    Lines and units held at each history run between start and end
+
+    Without filters the totals stored on each run are returned directly.
+    Otherwise the matching deltas up to end are read in one query and
+    replayed in run order, so the cost grows with the number of changes
+    for that retailer/product rather than with the snapshot size.
+    """
+    runs_query = select(InventoryHistoryRun.id, InventoryHistoryRun.taken_at, InventoryHistoryRun.lines, InventoryHistoryRun.units)
+    if end is not None:
+        runs_query = runs_query.where(InventoryHistoryRun.taken_at <= end)
+    runs = db.execute(runs_query.order_by(InventoryHistoryRun.id)).all()
+    if not runs:
+        return []
+
+    def point(run_id, taken_at, lines, units):
+        return {"run_id": run_id, "taken_at": taken_at, "lines": lines, "units": units}
+
+    if retailer_id is None and goods_id is None:
+        return [point(*run) for run in runs if start is None or run.taken_at >= start]
+
+    deltas = db.execute(
+        _filtered(
+            select(InventoryHistoryDelta.run_id, InventoryHistoryDelta.retailer_id, InventoryHistoryDelta.goods_id, InventoryHistoryDelta.quantity)
+            .where(InventoryHistoryDelta.run_id <= runs[-1].id),
+            retailer_id,
+            goods_id,
+        ).order_by(InventoryHistoryDelta.run_id)
+    ).all()
+
+    held: Dict[Tuple[int, str], int] = {}
+    lines = units = 0
+    points = []
+    position = 0
+    for run_id, taken_at, _, _ in runs:
+        while position < len(deltas) and deltas[position].run_id <= run_id:
+            _, delta_retailer, delta_goods, quantity = deltas[position]
+            old = held.get((delta_retailer, delta_goods), 0)
+            lines += (quantity > 0) - (old > 0)
+            units += quantity - old
+            held[(delta_retailer, delta_goods)] = quantity
+            position += 1
+        if start is None or taken_at >= start:
+            points.append(point(run_id, taken_at, lines, units))
+    return points
@@ -0,0 +1,50 @@
+"""Logging Config - level-controlled text or JSON logging for the API"""
+import json
+import logging
+import os
+from datetime import datetime
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# "text" for humans, "json" for one object per line (log shippers)
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower()
+
+# Third-party loggers that are chatty at DEBUG/INFO; kept at WARNING whatever LOG_LEVEL is
+_QUIET_LOGGERS = ("aiosqlite", "asyncio", "httpcore", "httpx", "urllib3", "multipart")
+
+# LogRecord attributes that are not extra=... fields
+_RECORD_FIELDS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record, including any extra={...} fields"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_FIELDS:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+def configure_logging() -> None:
+    """Configure the root logger once, from LOG_LEVEL and LOG_FORMAT"""
+    root = logging.getLogger()
+    if getattr(root, "_dist_backend_configured", False):
+        return
+    handler = logging.StreamHandler()
+    if LOG_FORMAT == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)-7s %(name)s: %(message)s"))
+    root.addHandler(handler)
+    root.setLevel(LOG_LEVEL)
+    for name in _QUIET_LOGGERS:
+        logging.getLogger(name).setLevel(logging.WARNING)
+    root._dist_backend_configured = True
@@ -1,16 +1,46 @@
 """Main FastAPI application"""
+import logging
 import os
-from typing import List
-from fastapi import FastAPI, Depends, HTTPException, Query
+from typing import List, Optional
+from fastapi import FastAPI, Depends, HTTPException, Query, Request, Response, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from datetime import datetime
 import database
 import schemas
-from models import Retailer, Product, PrmInventorySnapshot, PrmSyncRunLog, PriceHistory, TallyLedgerCache
+import reports
+import analytics
+import exports
+import metrics
+from admission import ADMISSION_ENABLED, AdmissionMiddleware, AdmissionRejected
+from query_budget import QUERY_BUDGET_ENABLED, QueryBudgetMiddleware
+from logging_config import configure_logging
+from responses import FastJSONResponse, GZIP_LEVEL, GZIP_MIN_SIZE
+from data_version import bump_data_version, etag_matches
+from pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, apply_keyset, finish_page, paginate
+from models import Retailer, Product, PrmSyncRunLog, PriceHistory, TallyLedgerCache, TallyPrewarmRunLog, InventoryHistoryRun
 from prm_importer import import_prm_imei_file
-from tally_cache import get_closing_balance_with_cache
-from approval_engine import run_auto_approval
+from price_updates import apply_price_updates, price_history_query, get_prices_as_of
+from inventory_history import inventory_at_run, inventory_trend, run_as_of
+from search import SEARCH_TYPES, search
+from tally_client import TallyCircuitOpenError, close_async_client, tally_breaker
+from tally_cache import (
+    get_closing_balance_with_cache_async,
+    ledger_cache,
+    cache_stats,
+    to_local_naive,
+    upsert_cache_rows,
+    CACHE_TTL_MINUTES,
+)
+from approval_engine import run_auto_approval_async
+from migrate import check_schema
+from tally_prewarm import PREWARM_ENABLED, PrewarmInProgress, execute_run, prewarm_scheduler, start_prewarm
+
+configure_logging()
+logger = logging.getLogger(__name__)
 
 # FIXED: Single app initialization with proper configuration
 app = FastAPI(
@@ -19,6 +49,11 @@ app = FastAPI(
     description="Distribution Backend Service - Phase 1.5"
 )
 
+# Per-route concurrency limits (ADMISSION_LIMITS): excess requests get a 429 before routing.
+# Added first, so it runs innermost and rejections still get CORS headers and metrics
+if ADMISSION_ENABLED:
+    app.add_middleware(AdmissionMiddleware)
+
 # FIXED: CORS middleware configured properly BEFORE routes
 app.add_middleware(
     CORSMiddleware,
@@ -26,23 +61,53 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Next-Cursor", "X-Query-Count", "Retry-After"],
 )
 
+# Compress larger responses (reports, lists, exports) for slow branch links
+app.add_middleware(GZipMiddleware, minimum_size=GZIP_MIN_SIZE, compresslevel=GZIP_LEVEL)
+
+# Debug mode: flag requests that run too many SQL statements (N+1 loops)
+if QUERY_BUDGET_ENABLED:
+    app.add_middleware(QueryBudgetMiddleware)
+
+# Outermost, so latency covers compression and streamed bodies
+app.add_middleware(metrics.MetricsMiddleware)
+
 # NEW: Read Tally Sync API Key from environment
 TALLY_SYNC_API_KEY = os.getenv("TALLY_SYNC_API_KEY", "")
 
 
+def _paginate_or_400(query, columns, cursor, limit, descending=False):
+    """Keyset-paginate a query, turning a bad cursor into a 400"""
+    try:
+        return paginate(query, columns, cursor, limit, descending=descending)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
 @app.on_event("startup")
 def startup_event():
-    """Initialize database on application startup"""
+    """Check the database schema is current (migrations run via `python migrate.py`)"""
     print("=" * 60)
     print("Distribution Backend Service - Phase 1.5")
     print("=" * 60)
-    database.init_db()
+    check_schema()
+    if PREWARM_ENABLED:
+        prewarm_scheduler.start()
     print("Application ready!")
     print("=" * 60)
 
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop the pre-warm scheduler and close pooled async connections (Tally HTTP client, async DB engines)"""
+    prewarm_scheduler.stop()
+    await close_async_client()
+    await database.async_engine.dispose()
+    await database.async_read_engine.dispose()
+
+
 @app.get("/")
 def root():
     """Root endpoint - API information"""
@@ -56,11 +121,21 @@ def root():
 @app.get("/health")
 def health_check():
     """Health check endpoint"""
-    return {"status": "ok", "timestamp": datetime.now().isoformat()}
+    return {
+        "status": "ok",
+        "timestamp": datetime.now().isoformat(),
+        "tally_circuit": tally_breaker.state
+    }
+
+
+@app.get("/metrics", include_in_schema=False)
+def get_metrics():
+    """Prometheus scrape endpoint (counters are per worker process)"""
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
 
 
 @app.post("/run/prm-sync", response_model=schemas.PrmSyncResponse)
-def run_prm_sync(db: Session = Depends(database.get_db)):
+def run_prm_sync(background_tasks: BackgroundTasks, db: Session = Depends(database.get_db)):
     """
     Run PRM IMEI file import synchronization
     
@@ -78,7 +153,7 @@ def run_prm_sync(db: Session = Depends(database.get_db)):
     
     try:
         # Execute import
-        result = import_prm_imei_file("prm_imei_sample.xlsx", db)
+        result = import_prm_imei_file("prm_imei_sample.xlsx", db, sync_run_id=run_log.id)
         
         # Update run log with success
         run_log.finished_at = datetime.now()
@@ -89,7 +164,13 @@ def run_prm_sync(db: Session = Depends(database.get_db)):
             result['inventory_rows'],
             result['activations_rows']
         ])
+        bump_data_version(db, "prm_import")
         db.commit()
+        metrics.prm_import_seconds.observe((run_log.finished_at - run_log.started_at).total_seconds(), status="success")
+        metrics.prm_import_rows.inc(run_log.rows_imported)
+
+        if reports.REPORT_PRECOMPUTE_AFTER_SYNC:
+            background_tasks.add_task(reports.warm_negative_report)
         
         return {"run_id": run_log.id, "status": "success", **result}
         
@@ -98,7 +179,11 @@ def run_prm_sync(db: Session = Depends(database.get_db)):
         run_log.finished_at = datetime.now()
         run_log.status = "error"
         run_log.error_message = str(e)
+        # The importer commits in stages, so a failed run may still have changed data
+        bump_data_version(db, "prm_import")
         db.commit()
+        metrics.prm_import_seconds.observe((run_log.finished_at - run_log.started_at).total_seconds(), status="error")
+        logger.error("PRM sync failed: %s", e)
         raise HTTPException(status_code=500, detail=f"PRM sync failed: {str(e)}")
 
 
@@ -112,76 +197,41 @@ def update_product_prices(
     
     - Updates existing products or creates new ones
     - Tracks price changes in price_history table
-    - Supports bulk updates
+    - Supports bulk updates: all products are loaded with a few IN queries
+      and written with bulk statements in one transaction
     """
-    updated_count = 0
-    price_changes = 0
-    
-    for update in request.updates:
-        product = db.query(Product).filter_by(goods_id=update.goods_id).first()
-        
-        if product:
-            # Update existing product
-            if update.name is not None:
-                product.name = update.name
-            if update.category is not None:
-                product.category = update.category
-            if update.price is not None and product.current_price != update.price:
-                # Log price change
-                history = PriceHistory(
-                    product_id=product.id,
-                    old_price=product.current_price,
-                    new_price=update.price,
-                    source='admin_api'
-                )
-                db.add(history)
-                price_changes += 1
-                print(f"Price changed: {product.goods_id} from {product.current_price} to {update.price}")
-                product.current_price = update.price
-                product.last_price_update = datetime.now()
-            updated_count += 1
-        else:
-            # Create new product
-            product = Product(
-                goods_id=update.goods_id,
-                name=update.name,
-                category=update.category,
-                current_price=update.price,
-                last_price_update=datetime.now()
-            )
-            db.add(product)
-            db.flush()
-            
-            # Log initial price
-            if update.price is not None:
-                history = PriceHistory(
-                    product_id=product.id,
-                    old_price=None,
-                    new_price=update.price,
-                    source='admin_api'
-                )
-                db.add(history)
-                price_changes += 1
-            updated_count += 1
-    
+    result = apply_price_updates(db, request.updates)
     db.commit()
-    print(f"Updated {updated_count} products, logged {price_changes} price changes")
-    return {"updated": updated_count}
+    logger.info(
+        "Updated %d products (%d created, %d changed), logged %d price changes",
+        result["updated"], result["created"], result["changed"], result["price_changed"],
+        extra={"price_update": result}
+    )
+    return result
 
 
 @app.get("/tally/closing-balance", response_model=schemas.TallyClosingBalanceResponse)
-def get_tally_closing_balance(
+async def get_tally_closing_balance(
     ledger: str = Query(..., description="Ledger name to query"),
-    db: Session = Depends(database.get_db)
+    db: AsyncSession = Depends(database.get_async_db)
 ):
     """
     Get closing balance for a Tally ledger
     
-    Uses caching to reduce Tally API calls (2-hour TTL)
+    Uses caching to reduce Tally API calls (2-hour TTL). Async: the cache
+    read and any Tally request are awaited rather than holding a thread.
     """
     try:
-        balance = get_closing_balance_with_cache(db, ledger)
+        balance = await get_closing_balance_with_cache_async(db, ledger)
         return {"ledger": ledger, "closing_balance": balance}
+    except AdmissionRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except TallyCircuitOpenError as e:
+        raise HTTPException(
+            status_code=503,
+            detail=f"Tally unavailable and no cached balance for '{ledger}': {str(e)}",
+            headers={"Retry-After": str(int(tally_breaker.reset_seconds))}
+        )
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -190,81 +240,125 @@ def get_tally_closing_balance(
 
 
 @app.get("/reports/negative", response_model=schemas.NegativeReportResponse)
-def get_negative_report(db: Session = Depends(database.get_db)):
+async def get_negative_report(request: Request, db: AsyncSession = Depends(database.get_async_read_db)):
     """
     Generate negative/OD report
     
     Compares Tally closing balance vs stock value for each retailer
     Returns retailers where closing_balance > stock_value (OD situation)
+
+    Runs in a fixed number of queries: one aggregate for stock values, one
+    bulk read of cached balances and at most one batched Tally fetch.
+    The result is cached per data version and served with an ETag;
+    clients sending a matching If-None-Match get 304 Not Modified.
     """
-    report_rows = []
-    
-    # Get all retailers that have inventory
-    retailers = db.query(Retailer)\
-        .join(PrmInventorySnapshot, Retailer.id == PrmInventorySnapshot.retailer_id)\
-        .distinct()\
-        .all()
-    
-    for retailer in retailers:
-        try:
-            # Calculate stock value
-            stock_value = 0.0
-            items = db.query(PrmInventorySnapshot).filter_by(retailer_id=retailer.id).all()
-            
-            for item in items:
-                product = db.query(Product).filter_by(goods_id=item.goods_id).first()
-                if product and product.current_price:
-                    stock_value += item.quantity * product.current_price
-            
-            # Get Tally closing balance
-            ledger_name = retailer.retailer_code
-            try:
-                balance = get_closing_balance_with_cache(db, ledger_name)
-            except Exception as e:
-                print(f"Warning: Could not get balance for {ledger_name}: {str(e)}")
-                continue
-            
-            # Calculate OD amount (positive means retailer owes money)
-            od_amount = balance - stock_value
-            
-            # Only include retailers with positive OD
-            if od_amount > 0:
-                report_rows.append({
-                    "retailer_code": retailer.retailer_code,
-                    "retailer_name": retailer.name,
-                    "closing_balance": round(balance, 2),
-                    "stock_value": round(stock_value, 2),
-                    "od_amount": round(od_amount, 2)
-                })
-        except Exception as e:
-            print(f"Warning: Error processing retailer {retailer.retailer_code}: {str(e)}")
-            continue
-    
-    return {
-        "generated_at": datetime.now(),
-        "rows": sorted(report_rows, key=lambda x: x['od_amount'], reverse=True)
-    }
+    report, etag = await reports.get_negative_report_snapshot_async(db)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    # The snapshot is already plain dicts; skip re-validating every row
+    return FastJSONResponse(report, headers=headers)
+
+
+ExportFormat = Query("csv", pattern="^(csv|ndjson)$", description="csv or ndjson")
+
+
+@app.get("/exports/negative-report")
+def export_negative_report(format: str = ExportFormat, db: Session = Depends(database.get_read_db)):
+    """Download the negative/OD report (same snapshot as /reports/negative)"""
+    report, etag = reports.get_negative_report_snapshot(db)
+    response = exports.export_response(
+        exports.encode_rows(exports.negative_report_rows(report), exports.NEGATIVE_REPORT_COLUMNS, format),
+        "negative-report",
+        format
+    )
+    response.headers["ETag"] = etag
+    return response
+
+
+@app.get("/exports/inventory")
+def export_inventory(format: str = ExportFormat):
+    """
+    Download the full inventory snapshot joined with retailer and product
+
+    Rows are streamed from a server-side cursor, so memory use does not
+    grow with the size of the table.
+    """
+    return exports.export_response(
+        exports.stream_query(exports.inventory_export_select(), exports.INVENTORY_COLUMNS, format),
+        "inventory",
+        format
+    )
+
+
+@app.get("/exports/activations")
+def export_activations(format: str = ExportFormat):
+    """Download all activations joined with product and retailer (streamed)"""
+    return exports.export_response(
+        exports.stream_query(exports.activation_export_select(), exports.ACTIVATION_COLUMNS, format),
+        "activations",
+        format
+    )
+
+
+@app.get("/retailers/summary", response_model=schemas.RetailerSummaryResponse)
+async def get_retailers_summary(request: Request, db: AsyncSession = Depends(database.get_async_read_db)):
+    """
+    Dashboard summary for every retailer in one call
+
+    Per retailer: stock value, inventory lines, latest cached closing
+    balance and its age, OD (balance minus stock value), 30-day sales and
+    last activation; plus totals and the last successful PRM sync. Built
+    with set-based queries (balances come from the cache table, never from
+    Tally), cached per data version and served with an ETag.
+    """
+    summary, etag = await db.run_sync(reports.get_retailer_summary_snapshot)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return FastJSONResponse(summary, headers=headers)
+
+
+@app.get("/retailers/{retailer_code}/summary", response_model=schemas.RetailerSummaryRow)
+async def get_retailer_summary(retailer_code: str, db: AsyncSession = Depends(database.get_async_read_db)):
+    """One retailer's summary row (same fields as /retailers/summary)"""
+    row = await db.run_sync(reports.get_retailer_summary, retailer_code)
+    if row is None:
+        raise HTTPException(status_code=404, detail=f"Retailer '{retailer_code}' not found")
+    return FastJSONResponse(row)
 
 
 # NEW: Retailer list endpoint
 @app.get("/retailers", response_model=List[schemas.RetailerOut])
-def list_retailers(db: Session = Depends(database.get_db)):
-    retailers = db.query(Retailer).order_by(Retailer.retailer_code).all()
-    return [
-        schemas.RetailerOut(
-            id=r.id,
-            retailer_code=r.retailer_code,
-            name=r.name,
-        )
-        for r in retailers
-    ]
+async def list_retailers(
+    db: AsyncSession = Depends(database.get_async_db),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE, description="Page size"),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor value from the previous page")
+):
+    """
+    List retailers ordered by retailer_code, one page at a time
 
+    The cursor for the next page is returned in the X-Next-Cursor header
+    (absent on the last page).
+    """
+    columns = [Retailer.retailer_code]
+    try:
+        statement = apply_keyset(select(Retailer.id, Retailer.retailer_code, Retailer.name), columns, cursor, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    retailers, next_cursor = finish_page((await db.execute(statement)).all(), columns, limit)
+    return FastJSONResponse(
+        [{"id": r.id, "retailer_code": r.retailer_code, "name": r.name} for r in retailers],
+        headers={"X-Next-Cursor": next_cursor} if next_cursor else None
+    )
 
 
 # NEW: Bulk Tally sync endpoint
 @app.post("/tally-sync/bulk-ledger-balances", response_model=schemas.TallySyncResponse)
 def sync_tally_balances(
     payload: schemas.TallySyncRequest,
+    background_tasks: BackgroundTasks,
     db: Session = Depends(database.get_db),
 ):
     """
@@ -279,78 +373,237 @@ def sync_tally_balances(
     if TALLY_SYNC_API_KEY and payload.api_key != TALLY_SYNC_API_KEY:
         raise HTTPException(status_code=401, detail="Invalid API key")
 
-    synced = 0
+    # Later entries for the same retailer win, as when rows were applied one by one
+    values = {
+        entry.retailer_code: (entry.closing_balance, to_local_naive(entry.as_of))
+        for entry in payload.entries
+    }
+    # Unknown retailer codes, and balances older than the one stored, are skipped
+    written, _ = upsert_cache_rows(db, values)
+    written = set(written)
+    synced = sum(1 for entry in payload.entries if entry.retailer_code in written)
 
-    for entry in payload.entries:
-        retailer = (
-            db.query(Retailer)
-            .filter(Retailer.retailer_code == entry.retailer_code)
-            .first()
-        )
-        if not retailer:
-            # Skip unknown retailer codes
-            continue
-
-        cache_entry = (
-            db.query(TallyLedgerCache)
-            .filter(TallyLedgerCache.retailer_id == retailer.id)
-            .order_by(TallyLedgerCache.as_of.desc())
-            .first()
-        )
+    if synced:
+        bump_data_version(db, "ledger_sync")
+    db.commit()
 
-        if cache_entry:
-            cache_entry.closing_balance = entry.closing_balance
-            cache_entry.as_of = entry.as_of
-            cache_entry.ledger_name = entry.retailer_code
-        else:
-            cache_entry = TallyLedgerCache(
-                retailer_id=retailer.id,
-                ledger_name=entry.retailer_code,
-                closing_balance=entry.closing_balance,
-                as_of=entry.as_of,
-            )
-            db.add(cache_entry)
-
-        synced += 1
+    # Populate the in-memory tier only once the rows are committed
+    for ledger_name in written:
+        balance, as_of = values[ledger_name]
+        ledger_cache.set(ledger_name, balance, as_of)
+
+    if synced and reports.REPORT_PRECOMPUTE_AFTER_SYNC:
+        background_tasks.add_task(reports.warm_negative_report)
 
-    db.commit()
     return schemas.TallySyncResponse(synced=synced)
 
 
 @app.get("/debug/price-history")
 def get_price_history(
-    db: Session = Depends(database.get_db),
-    limit: int = Query(50, ge=1, le=500, description="Number of records to return")
+    db: Session = Depends(database.get_read_db),
+    goods_id: Optional[str] = Query(None, description="Only this product's timeline"),
+    start: Optional[datetime] = Query(None, alias="from", description="Changes at or after this time"),
+    end: Optional[datetime] = Query(None, alias="to", description="Changes before this time"),
+    limit: int = Query(50, ge=1, le=500, description="Number of records to return"),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page")
 ):
-    """Get recent price change history"""
-    history = db.query(PriceHistory)\
-        .order_by(PriceHistory.changed_at.desc())\
-        .limit(limit)\
-        .all()
+    """Get price change history (newest first), joined with the product in one query"""
+    history, next_cursor = _paginate_or_400(
+        price_history_query(
+            db,
+            goods_id,
+            to_local_naive(start) if start else None,
+            to_local_naive(end) if end else None
+        ),
+        [PriceHistory.changed_at, PriceHistory.id],
+        cursor,
+        limit,
+        descending=True
+    )
     
     result = []
     for entry in history:
-        product = db.query(Product).filter_by(id=entry.product_id).first()
         result.append({
             "id": entry.id,
             "product_id": entry.product_id,
-            "goods_id": product.goods_id if product else None,
-            "product_name": product.name if product else None,
+            "goods_id": entry.goods_id,
+            "product_name": entry.name,
             "old_price": entry.old_price,
             "new_price": entry.new_price,
             "changed_at": entry.changed_at.isoformat(),
             "source": entry.source
         })
     
-    return {"total": len(result), "entries": result}
+    return {"total": len(result), "entries": result, "next_cursor": next_cursor}
+
+
+@app.get("/products/prices/as-of")
+def get_prices_at(
+    at: datetime = Query(..., description="Point in time to value prices at"),
+    goods_id: Optional[List[str]] = Query(None, description="Products to look up (all when omitted)"),
+    db: Session = Depends(database.get_read_db)
+):
+    """Product prices as they stood at a point in time, from price history"""
+    at = to_local_naive(at)
+    prices = get_prices_as_of(db, at, goods_id)
+    return {"as_of": at.isoformat(), "total": len(prices), "prices": prices}
+
+
+@app.get("/search", response_model=schemas.SearchResponse)
+def search_catalog(
+    q: str = Query(..., min_length=1, max_length=100, description="Code or name, or part of one"),
+    type: str = Query("all", pattern="^(all|retailer|product)$", description="all, retailer or product"),
+    limit: int = Query(10, ge=1, le=50, description="Number of results"),
+    db: Session = Depends(database.get_read_db)
+):
+    """
+    Type-ahead search over retailers (code, name) and products (goods_id, name)
+
+    Results are ranked exact, code/name prefix, word prefix, substring,
+    then fuzzy (trigram similarity, so small typos still match). Backed by
+    an FTS5 trigram index on SQLite and pg_trgm on PostgreSQL, with a
+    LIKE fallback; a fixed number of indexed queries per type.
+    """
+    types = list(SEARCH_TYPES) if type == "all" else [type]
+    return {"query": q, "results": search(db, q, types, limit)}
+
+
+@app.get("/analytics/inventory")
+def get_inventory_analytics(
+    request: Request,
+    view: str = Query("retailers", pattern="^(retailers|products|lines)$", description="retailers, products or lines"),
+    retailer_code: Optional[str] = Query(None, description="Only this retailer's rows"),
+    goods_id: Optional[str] = Query(None, description="Only this product's rows"),
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE, description="Number of rows to return"),
+    db: Session = Depends(database.get_read_db)
+):
+    """
+    Inventory aging, sell-through and stock cover
+
+    Age buckets (days since a line's current holding started, from the
+    inventory history), units sold in the sales window, sell-through and
+    days of stock cover, per retailer, product or retailer/product line.
+    Computed with pandas over whole tables once per data version; rows
+    are sorted by aged stock value (retailers), stock cover (products) or
+    days in stock (lines). The ETag covers the whole computation, so a
+    matching If-None-Match gets 304 Not Modified for any view.
+    """
+    result, etag = analytics.get_inventory_analytics_snapshot(db)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    rows = result[view]
+    if retailer_code is not None and view != "products":
+        rows = [row for row in rows if row["retailer_code"] == retailer_code]
+    if goods_id is not None and view != "retailers":
+        rows = [row for row in rows if row["goods_id"] == goods_id]
+    return FastJSONResponse({
+        "generated_at": result["generated_at"],
+        "sales_window_days": result["sales_window_days"],
+        "buckets": result["buckets"],
+        "view": view,
+        "total": len(rows),
+        "rows": rows[:limit]
+    }, headers=headers)
+
+
+def _retailer_id_or_404(db: Session, retailer_code: Optional[str]) -> Optional[int]:
+    if retailer_code is None:
+        return None
+    retailer_id = db.execute(select(Retailer.id).where(Retailer.retailer_code == retailer_code)).scalar()
+    if retailer_id is None:
+        raise HTTPException(status_code=404, detail=f"Retailer '{retailer_code}' not found")
+    return retailer_id
+
+
+@app.get("/inventory/history/runs")
+def get_inventory_history_runs(
+    db: Session = Depends(database.get_read_db),
+    limit: int = Query(50, ge=1, le=500, description="Number of runs to return"),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page")
+):
+    """Recorded inventory snapshots (newest first) with their size and number of changed lines"""
+    runs, next_cursor = _paginate_or_400(
+        db.query(InventoryHistoryRun),
+        [InventoryHistoryRun.taken_at, InventoryHistoryRun.id],
+        cursor,
+        limit,
+        descending=True
+    )
+    result = [{
+        "run_id": run.id,
+        "taken_at": run.taken_at.isoformat(),
+        "sync_run_id": run.sync_run_id,
+        "lines": run.lines,
+        "units": run.units,
+        "changed_lines": run.changed_lines
+    } for run in runs]
+    return {"total": len(result), "runs": result, "next_cursor": next_cursor}
+
+
+@app.get("/inventory/as-of")
+def get_inventory_as_of(
+    at: datetime = Query(..., description="Point in time to look at"),
+    retailer_code: Optional[str] = Query(None, description="Only this retailer's lines"),
+    goods_id: Optional[str] = Query(None, description="Only this product's lines"),
+    db: Session = Depends(database.get_read_db)
+):
+    """
+    Inventory as recorded by the last PRM import at or before a point in time
+
+    Rebuilt from the append-only inventory history, so it answers "what did
+    this retailer hold last month" after the live snapshot has moved on.
+    """
+    at = to_local_naive(at)
+    retailer_id = _retailer_id_or_404(db, retailer_code)
+    run = run_as_of(db, at)
+    if run is None:
+        return {"as_of": at.isoformat(), "run_id": None, "taken_at": None, "total": 0, "rows": []}
+    rows = inventory_at_run(db, run.id, retailer_id, goods_id)
+    return FastJSONResponse({
+        "as_of": at.isoformat(),
+        "run_id": run.id,
+        "taken_at": run.taken_at.isoformat(),
+        "total": len(rows),
+        "rows": rows
+    })
+
+
+@app.get("/inventory/trend")
+def get_inventory_trend(
+    retailer_code: Optional[str] = Query(None, description="Only this retailer"),
+    goods_id: Optional[str] = Query(None, description="Only this product"),
+    start: Optional[datetime] = Query(None, alias="from", description="Snapshots taken at or after this time"),
+    end: Optional[datetime] = Query(None, alias="to", description="Snapshots taken at or before this time"),
+    db: Session = Depends(database.get_read_db)
+):
+    """Inventory lines and units held at each recorded PRM import, oldest first"""
+    retailer_id = _retailer_id_or_404(db, retailer_code)
+    points = inventory_trend(
+        db,
+        retailer_id,
+        goods_id,
+        to_local_naive(start) if start else None,
+        to_local_naive(end) if end else None
+    )
+    return FastJSONResponse({"retailer_code": retailer_code, "goods_id": goods_id, "points": points})
 
 
 @app.get("/debug/tally-cache")
-def get_tally_cache(db: Session = Depends(database.get_db)):
-    """View Tally cache status and entries"""
-    entries = db.query(TallyLedgerCache)\
-        .order_by(TallyLedgerCache.as_of.desc())\
-        .all()
+def get_tally_cache(
+    db: Session = Depends(database.get_read_db),
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE, description="Number of entries to return"),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page")
+):
+    """View Tally cache status and entries (newest first)"""
+    entries, next_cursor = _paginate_or_400(
+        db.query(TallyLedgerCache),
+        [TallyLedgerCache.as_of, TallyLedgerCache.id],
+        cursor,
+        limit,
+        descending=True
+    )
     
     result = []
     now = datetime.now()
@@ -363,26 +616,38 @@ def get_tally_cache(db: Session = Depends(database.get_db)):
             "closing_balance": entry.closing_balance,
             "cached_at": entry.as_of.isoformat(),
             "age_minutes": age_minutes,
-            "expired": age_minutes > 120
+            "expired": age_minutes > CACHE_TTL_MINUTES
         })
     
-    return {
+    return FastJSONResponse({
         "total": len(result),
-        "cache_ttl_minutes": 120,
-        "entries": result
-    }
+        "cache_ttl_minutes": CACHE_TTL_MINUTES,
+        "memory_cache": cache_stats(),
+        "entries": result,
+        "next_cursor": next_cursor
+    })
+
+
+@app.get("/debug/tally-circuit")
+def get_tally_circuit():
+    """View Tally circuit breaker state and trip counts"""
+    return tally_breaker.stats()
 
 
 @app.get("/debug/sync-logs")
 def get_sync_logs(
-    db: Session = Depends(database.get_db),
-    limit: int = Query(20, ge=1, le=100, description="Number of logs to return")
+    db: Session = Depends(database.get_read_db),
+    limit: int = Query(20, ge=1, le=100, description="Number of logs to return"),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page")
 ):
-    """Get PRM sync run logs"""
-    logs = db.query(PrmSyncRunLog)\
-        .order_by(PrmSyncRunLog.started_at.desc())\
-        .limit(limit)\
-        .all()
+    """Get PRM sync run logs (newest first)"""
+    logs, next_cursor = _paginate_or_400(
+        db.query(PrmSyncRunLog),
+        [PrmSyncRunLog.started_at, PrmSyncRunLog.id],
+        cursor,
+        limit,
+        descending=True
+    )
 
     result = []
     for log in logs:
@@ -400,13 +665,71 @@ def get_sync_logs(
             "error_message": log.error_message
         })
 
-    return {"total": len(result), "logs": result}
+    return {"total": len(result), "logs": result, "next_cursor": next_cursor}
+
+
+@app.post("/run/tally-prewarm", status_code=202)
+def run_tally_prewarm(
+    background_tasks: BackgroundTasks,
+    due_only: bool = Query(False, description="Only ledgers missing or about to expire"),
+):
+    """
+    Start refreshing cached Tally balances, busiest retailers first
+
+    Same as a scheduled pre-warm run. Returns the run id at once; the run
+    continues in the background and its outcome appears in
+    /debug/prewarm-runs. 409 while another run is in progress.
+    """
+    try:
+        run_id = start_prewarm(trigger="api")
+    except PrewarmInProgress as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    background_tasks.add_task(execute_run, run_id, due_only)
+    return {"run_id": run_id, "status": "running"}
+
+
+@app.get("/debug/prewarm-runs")
+def get_prewarm_runs(
+    db: Session = Depends(database.get_read_db),
+    limit: int = Query(20, ge=1, le=100, description="Number of runs to return"),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page")
+):
+    """Get Tally pre-warm run logs (newest first)"""
+    runs, next_cursor = _paginate_or_400(
+        db.query(TallyPrewarmRunLog),
+        [TallyPrewarmRunLog.started_at, TallyPrewarmRunLog.id],
+        cursor,
+        limit,
+        descending=True
+    )
+
+    result = []
+    for run in runs:
+        duration = None
+        if run.finished_at and run.started_at:
+            duration = round((run.finished_at - run.started_at).total_seconds(), 1)
+
+        result.append({
+            "id": run.id,
+            "started_at": run.started_at.isoformat(),
+            "finished_at": run.finished_at.isoformat() if run.finished_at else None,
+            "trigger": run.trigger,
+            "slot": run.slot,
+            "status": run.status,
+            "ledgers_requested": run.ledgers_requested,
+            "ledgers_refreshed": run.ledgers_refreshed,
+            "ledgers_failed": run.ledgers_failed,
+            "duration_seconds": duration,
+            "error_message": run.error_message
+        })
+
+    return {"total": len(result), "runs": result, "next_cursor": next_cursor}
 
 
 @app.post("/orders/auto-approval", response_model=schemas.AutoApprovalDecision)
-def auto_approval(
+async def auto_approval(
     request: schemas.AutoApprovalRequest,
-    db: Session = Depends(database.get_db),
+    db: AsyncSession = Depends(database.get_async_db),
 ):
     """
     Simulate / run auto-approval decision for a potential order.
@@ -418,14 +741,20 @@ def auto_approval(
     - od_amount
     - recent_sales_30d_value
     - rules_triggered[]
+
+    Limited by ADMISSION_LIMITS (429 when full); a Tally fetch that cannot
+    get a TALLY_FETCH_CONCURRENCY slot in time fails with 503. Both carry
+    Retry-After.
     """
     try:
-        result = run_auto_approval(
+        result = await run_auto_approval_async(
             db=db,
             retailer_code=request.retailer_code,
             items=[item.dict() for item in request.items],
         )
         return result
+    except AdmissionRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e), headers={"Retry-After": str(e.retry_after)})
     except ValueError as ve:
         raise HTTPException(status_code=404, detail=str(ve))
     except Exception as e:
@@ -0,0 +1,268 @@
+"""Metrics - in-process counters and histograms exposed in Prometheus text format"""
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+
+# Response appends "; charset=utf-8"
+CONTENT_TYPE = "text/plain; version=0.0.4"
+
+# Seconds; the Prometheus client defaults, stretched for slow Tally calls and imports
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: LabelValues, extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic counter with optional labels"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values: Dict[LabelValues, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = tuple(str(labels[name]) for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}" for key, value in items]
+
+
+class Histogram:
+    """Cumulative-bucket histogram with optional labels"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [per-bucket counts..., +Inf count, sum]
+        self._values: Dict[LabelValues, List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(str(labels[name]) for name in self.labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted((key, list(series)) for key, series in self._values.items())
+        lines = []
+        for key, series in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), series[:-1]):
+                cumulative += bucket_count
+                le = 'le="' + _format_value(float(bound)) + '"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {_format_value(series[-1])}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {cumulative}")
+        return lines
+
+
+class Gauge:
+    """
+    Value read at scrape time from a callback returning a number or {label value: number}
+
+    kind="counter" exposes counts another component already keeps (cache
+    and refresh statistics) as a counter instead of copying them.
+    """
+
+    def __init__(self, name: str, help: str, callback: Callable, label: Optional[str] = None, kind: str = "gauge"):
+        self.name = name
+        self.help = help
+        self.callback = callback
+        self.label = label
+        self.kind = kind
+
+    def render(self) -> List[str]:
+        value = self.callback()
+        if value is None:
+            return []
+        if self.label is None:
+            return [f"{self.name} {_format_value(value)}"]
+        return [
+            f"{self.name}{_format_labels((self.label,), (key,))} {_format_value(item)}"
+            for key, item in sorted(value.items()) if item is not None
+        ]
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+
+    def register(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, help, labels))
+
+    def histogram(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help, labels, buckets))
+
+    def gauge(self, name: str, help: str, callback: Callable, label: Optional[str] = None, kind: str = "gauge") -> Gauge:
+        return self.register(Gauge(name, help, callback, label, kind))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+http_requests = registry.counter(
+    "http_requests_total", "HTTP requests by route template, method and status", ("method", "route", "status")
+)
+http_request_seconds = registry.histogram(
+    "http_request_duration_seconds", "HTTP request latency by route template", ("method", "route")
+)
+http_request_queries = registry.histogram(
+    "http_request_sql_queries", "SQL statements executed per request", ("method", "route"), QUERY_COUNT_BUCKETS
+)
+http_request_sql_seconds = registry.histogram(
+    "http_request_sql_duration_seconds", "Time spent in SQL per request", ("method", "route")
+)
+sql_queries = registry.counter("sql_queries_total", "SQL statements executed (all callers)")
+sql_seconds = registry.counter("sql_query_seconds_total", "Time spent executing SQL statements (all callers)")
+tally_requests = registry.counter(
+    "tally_requests_total", "Tally requests by kind (ledger/collection) and outcome (ok/error/rejected)", ("kind", "outcome")
+)
+tally_request_seconds = registry.histogram(
+    "tally_request_duration_seconds", "Tally request latency including reading the response", ("kind",)
+)
+tally_cache_db_lookups = registry.counter(
+    "tally_cache_db_lookups_total", "tally_ledger_cache table lookups by result (hit/stale/expired/miss)", ("result",)
+)
+prm_import_seconds = registry.histogram(
+    "prm_import_duration_seconds", "PRM IMEI import duration by status", ("status",)
+)
+prm_import_rows = registry.counter("prm_import_rows_total", "Rows written by successful PRM imports")
+tally_prewarm_seconds = registry.histogram(
+    "tally_prewarm_duration_seconds", "Tally balance pre-warm run duration by status", ("status",)
+)
+tally_prewarm_ledgers = registry.counter(
+    "tally_prewarm_ledgers_total", "Ledgers handled by pre-warm runs by result (refreshed/failed)", ("result",)
+)
+admission_rejections = registry.counter(
+    "admission_rejections_total", "Requests rejected by admission control by limiter and reason (queue_full/timeout)", ("limiter", "reason")
+)
+admission_wait_seconds = registry.histogram(
+    "admission_wait_seconds", "Time queued requests waited for an admission slot", ("limiter",)
+)
+
+
+# --- SQL accounting via engine events -------------------------------------------
+
+# [statements, seconds] for the request being served; None outside a request
+_request_sql: ContextVar[Optional[list]] = ContextVar("request_sql", default=None)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get("query_start")
+    if not starts:
+        return
+    elapsed = time.perf_counter() - starts.pop()
+    sql_queries.inc()
+    sql_seconds.inc(elapsed)
+    current = _request_sql.get()
+    if current is not None:
+        current[0] += 1
+        current[1] += elapsed
+
+
+# --- Request middleware -------------------------------------------------------------
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording count, latency and SQL statements per route
+
+    Routes are labelled by their path template (/retailers, not the raw
+    URL), so cardinality stays bounded; unmatched paths share one label.
+    Latency runs until the last body chunk is sent, which includes
+    streaming exports. The SQL tally travels in a context variable, which
+    Starlette copies into threadpool calls and AnyIO tasks.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        sql = [0, 0.0]
+        token = _request_sql.set(sql)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            _request_sql.reset(token)
+            route = scope.get("route")
+            labels = {"method": scope["method"], "route": getattr(route, "path", "unmatched")}
+            http_requests.inc(status=status["code"], **labels)
+            http_request_seconds.observe(elapsed, **labels)
+            http_request_queries.observe(sql[0], **labels)
+            http_request_sql_seconds.observe(sql[1], **labels)
+
+
+def render() -> str:
+    return registry.render()
\ No newline at end of file
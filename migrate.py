@@ -0,0 +1,151 @@
+"""Migrate - creates and upgrades the database schema, tracked in the schema_version table
+
+Usage:
+    python migrate.py           apply pending migrations
+    python migrate.py --check   exit 1 if migrations are pending
+"""
+import argparse
+import os
+import sys
+from datetime import datetime
+from typing import Callable, List, Tuple
+from sqlalchemy import inspect, select, text
+from sqlalchemy.exc import OperationalError, ProgrammingError
+import database
+
+# Apply pending migrations in startup_event instead of refusing to start
+AUTO_MIGRATE = os.getenv("AUTO_MIGRATE", "false").lower() in ("1", "true", "yes")
+
+
+def _create_schema(engine) -> None:
+    """Tables and indexes declared on the models (safe on existing databases)"""
+    import models  # noqa: F401  - registers every table on Base.metadata
+    database.Base.metadata.create_all(bind=engine)
+    database.ensure_indexes(bind=engine)
+
+
+def _seed_data_version(engine) -> None:
+    """The single data_version row, so bump_data_version is a plain UPDATE"""
+    from data_version import DATA_VERSION_ROW_ID
+    from models import DataVersion
+
+    with engine.begin() as conn:
+        found = conn.execute(select(DataVersion.id).where(DataVersion.id == DATA_VERSION_ROW_ID)).first()
+        if found is None:
+            conn.execute(DataVersion.__table__.insert().values(
+                id=DATA_VERSION_ROW_ID, version=0, updated_at=datetime.now(), reason="created"
+            ))
+
+
+def _create_baseline(engine) -> None:
+    _create_schema(engine)
+    _seed_data_version(engine)
+
+
+def _add_prewarm_slot(engine) -> None:
+    """tally_prewarm_run_log.slot plus its unique index (create_all does not add columns)"""
+    columns = {column["name"] for column in inspect(engine).get_columns("tally_prewarm_run_log")}
+    if "slot" not in columns:
+        with engine.begin() as conn:
+            conn.execute(text("ALTER TABLE tally_prewarm_run_log ADD COLUMN slot VARCHAR(64)"))
+    _create_schema(engine)
+
+
+def _create_search_index(engine) -> None:
+    """Name prefix indexes plus the trigram search index (search.py)"""
+    from search import create_search_index
+
+    _create_schema(engine)
+    create_search_index(engine)
+
+
+# (version, description, upgrade(engine)), in order. create_all/ensure_indexes
+# only add what is missing, so a migration that adds tables or indexes can
+# reuse _create_schema; data changes get their own function.
+MIGRATIONS: List[Tuple[int, str, Callable]] = [
+    (1, "Baseline schema with hot-path indexes", _create_baseline),
+    (2, "Tally pre-warm run log", _create_schema),
+    (3, "Append-only inventory history", _create_schema),
+    (4, "Retailer and product search index", _create_search_index),
+    # Databases created before migration 1 seeded it
+    (5, "Seed the data_version row", _seed_data_version),
+    (6, "Pre-warm run slots claimed once across workers", _add_prewarm_slot),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def current_version(engine=None) -> int:
+    """Latest applied version, 0 for a database that has never been migrated (one cheap query)"""
+    from models import SchemaVersion
+
+    engine = engine or database.engine
+    try:
+        with engine.connect() as conn:
+            versions = conn.execute(select(SchemaVersion.version).order_by(SchemaVersion.version.desc()).limit(1)).first()
+    except (OperationalError, ProgrammingError):
+        # No schema_version table yet
+        return 0
+    return versions[0] if versions else 0
+
+
+def migrate(engine=None) -> List[int]:
+    """Apply pending migrations in order; returns the versions applied"""
+    from models import SchemaVersion
+
+    engine = engine or database.engine
+    if "schema_version" not in inspect(engine).get_table_names():
+        SchemaVersion.__table__.create(bind=engine)
+
+    applied = []
+    current = current_version(engine)
+    for version, description, upgrade in MIGRATIONS:
+        if version <= current:
+            continue
+        print(f"⟳ Applying migration {version}: {description}")
+        upgrade(engine)
+        with engine.begin() as conn:
+            conn.execute(SchemaVersion.__table__.insert().values(
+                version=version, applied_at=datetime.now(), description=description
+            ))
+        applied.append(version)
+    if applied:
+        print(f"✓ Database schema at version {SCHEMA_VERSION}")
+    return applied
+
+
+def check_schema(auto_migrate: bool = AUTO_MIGRATE) -> None:
+    """
+    Startup check: one query when the schema is current
+
+    Pending migrations are applied when auto_migrate is set; otherwise
+    startup fails with instructions, so a worker never serves an old schema.
+    """
+    version = current_version()
+    if version >= SCHEMA_VERSION:
+        return
+    if auto_migrate:
+        migrate()
+        return
+    raise RuntimeError(
+        f"Database schema is at version {version}, this code needs {SCHEMA_VERSION}. "
+        "Run `python migrate.py` (or set AUTO_MIGRATE=true)."
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply database schema migrations")
+    parser.add_argument("--check", action="store_true", help="Exit 1 if migrations are pending, without applying them")
+    args = parser.parse_args()
+
+    version = current_version()
+    if args.check:
+        print(f"Schema version {version}, code expects {SCHEMA_VERSION}")
+        sys.exit(0 if version >= SCHEMA_VERSION else 1)
+
+    if not migrate():
+        print(f"✓ Database schema already at version {version}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,5 @@
 """Database ORM Models - defines all tables"""
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Text
+from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Text, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from database import Base
@@ -17,6 +17,11 @@ class Retailer(Base):
     activations = relationship("Activation", back_populates="retailer")
     ledger_cache = relationship("TallyLedgerCache", back_populates="retailer")
 
+    __table_args__ = (
+        # Name prefix search (search.py)
+        Index("ix_retailers_name_lower", func.lower(name)),
+    )
+
 
 class Product(Base):
     __tablename__ = "products"
@@ -30,12 +35,17 @@ class Product(Base):
     activations = relationship("Activation", back_populates="product")
     price_history = relationship("PriceHistory", back_populates="product")  # FIXED: Added missing relationship
 
+    __table_args__ = (
+        # Name prefix search (search.py)
+        Index("ix_products_name_lower", func.lower(name)),
+    )
+
 
 class PrmInventorySnapshot(Base):
     __tablename__ = "prm_inventory_snapshot"
     id = Column(Integer, primary_key=True, index=True)
-    retailer_id = Column(Integer, ForeignKey("retailers.id"), nullable=False)
-    goods_id = Column(String, ForeignKey("products.goods_id"), nullable=False)
+    retailer_id = Column(Integer, ForeignKey("retailers.id"), nullable=False, index=True)
+    goods_id = Column(String, ForeignKey("products.goods_id"), nullable=False, index=True)
     quantity = Column(Integer, nullable=False)
     last_seen = Column(DateTime, default=func.now())
     retailer = relationship("Retailer", back_populates="inventory_snapshots")
@@ -53,6 +63,11 @@ class Activation(Base):
     product = relationship("Product", back_populates="activations")
     retailer = relationship("Retailer", back_populates="activations")
 
+    __table_args__ = (
+        # Recent sales per retailer (approval engine)
+        Index("ix_activations_retailer_time", "retailer_id", "activation_time"),
+    )
+
 
 class TallyLedgerCache(Base):
     __tablename__ = "tally_ledger_cache"
@@ -60,9 +75,14 @@ class TallyLedgerCache(Base):
     retailer_id = Column(Integer, ForeignKey("retailers.id"), nullable=False)
     ledger_name = Column(Text, nullable=False)
     closing_balance = Column(Float, nullable=True)
-    as_of = Column(DateTime, default=func.now())
+    as_of = Column(DateTime, default=func.now(), index=True)
     retailer = relationship("Retailer", back_populates="ledger_cache")
 
+    __table_args__ = (
+        # Latest cached balance per retailer
+        Index("ix_tally_ledger_cache_retailer_as_of", "retailer_id", "as_of"),
+    )
+
 
 class PriceHistory(Base):
     """Price History - tracks all price changes"""
@@ -78,12 +98,83 @@ class PriceHistory(Base):
     # Relationships
     product = relationship("Product", back_populates="price_history")
 
+    __table_args__ = (
+        # Per-product timelines and as-of lookups
+        Index("ix_price_history_product_changed", "product_id", "changed_at"),
+        # Recent changes across all products
+        Index("ix_price_history_changed_at", "changed_at"),
+    )
+
 
 class PrmSyncRunLog(Base):
     __tablename__ = "prm_sync_run_log"
     id = Column(Integer, primary_key=True, index=True)
-    started_at = Column(DateTime, default=func.now())
+    started_at = Column(DateTime, default=func.now(), index=True)
     finished_at = Column(DateTime, nullable=True)
     status = Column(String, nullable=True)
     rows_imported = Column(Integer, nullable=True)
     error_message = Column(Text, nullable=True)
+
+
+class InventoryHistoryRun(Base):
+    """One dated inventory snapshot recorded by a PRM import (inventory_history.py)"""
+    __tablename__ = "inventory_history_run"
+    id = Column(Integer, primary_key=True, index=True)
+    taken_at = Column(DateTime, nullable=False, index=True)
+    sync_run_id = Column(Integer, ForeignKey("prm_sync_run_log.id"), nullable=True)
+    lines = Column(Integer, nullable=False, default=0)
+    units = Column(Integer, nullable=False, default=0)
+    changed_lines = Column(Integer, nullable=False, default=0)
+
+
+class InventoryHistoryDelta(Base):
+    """
+    Append-only inventory changes: the new quantity of a retailer/goods line
+    at a run, written only when it differs from the previous run (0 = gone)
+    """
+    __tablename__ = "inventory_history_delta"
+    id = Column(Integer, primary_key=True)
+    run_id = Column(Integer, ForeignKey("inventory_history_run.id"), nullable=False)
+    retailer_id = Column(Integer, ForeignKey("retailers.id"), nullable=False)
+    goods_id = Column(String, nullable=False)
+    quantity = Column(Integer, nullable=False)
+
+    __table_args__ = (
+        # Latest change per line at or before a run, per retailer
+        Index("ix_inventory_history_delta_retailer_goods_run", "retailer_id", "goods_id", "run_id"),
+        # Per-product history across retailers
+        Index("ix_inventory_history_delta_goods_run", "goods_id", "run_id"),
+    )
+
+
+class TallyPrewarmRunLog(Base):
+    """One scheduled or manual Tally balance pre-warm run (tally_prewarm.py)"""
+    __tablename__ = "tally_prewarm_run_log"
+    id = Column(Integer, primary_key=True, index=True)
+    started_at = Column(DateTime, default=func.now(), index=True)
+    finished_at = Column(DateTime, nullable=True)
+    trigger = Column(String, nullable=True)
+    # Scheduled runs only, e.g. "schedule:2026-10-19T07:30"; unique so one worker claims each slot
+    slot = Column(String(64), nullable=True, unique=True, index=True)
+    status = Column(String, nullable=True)
+    ledgers_requested = Column(Integer, nullable=True)
+    ledgers_refreshed = Column(Integer, nullable=True)
+    ledgers_failed = Column(Integer, nullable=True)
+    error_message = Column(Text, nullable=True)
+
+
+class SchemaVersion(Base):
+    """Schema version applied by migrate.py, one row per migration"""
+    __tablename__ = "schema_version"
+    version = Column(Integer, primary_key=True)
+    applied_at = Column(DateTime, default=func.now())
+    description = Column(String, nullable=True)
+
+
+class DataVersion(Base):
+    """Single-row counter bumped whenever report inputs (inventory, prices, balances) change"""
+    __tablename__ = "data_version"
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=func.now())
+    reason = Column(String, nullable=True)
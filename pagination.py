@@ -0,0 +1,122 @@
+"""Pagination - opaque cursors for keyset (seek) pagination"""
+import base64
+import json
+import os
+from datetime import datetime
+from typing import Any, List, Optional, Sequence
+from sqlalchemy import and_, or_
+
+DEFAULT_PAGE_SIZE = int(os.getenv("DEFAULT_PAGE_SIZE", "500"))
+MAX_PAGE_SIZE = int(os.getenv("MAX_PAGE_SIZE", "5000"))
+
+_DATETIME_PREFIX = "dt:"
+
+
+def encode_cursor(values: Sequence[Any]) -> str:
+    """Encode the sort-key values of the last row on a page"""
+    payload = [
+        _DATETIME_PREFIX + value.isoformat() if isinstance(value, datetime) else value
+        for value in values
+    ]
+    raw = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def _key_type(column) -> Optional[type]:
+    """Python type of a sort column, None when SQLAlchemy cannot tell"""
+    try:
+        return column.type.python_type
+    except (AttributeError, NotImplementedError):
+        return None
+
+
+def _decode_value(value: Any, key_type: Optional[type]) -> Any:
+    """One cursor value checked against its column's type (ValueError when it does not fit)"""
+    if key_type is datetime:
+        if not isinstance(value, str) or not value.startswith(_DATETIME_PREFIX):
+            raise ValueError("Invalid cursor")
+        try:
+            return datetime.fromisoformat(value[len(_DATETIME_PREFIX):])
+        except ValueError:
+            raise ValueError("Invalid cursor")
+    if isinstance(value, bool) and key_type is not bool:
+        raise ValueError("Invalid cursor")
+    if key_type is int and isinstance(value, int):
+        return value
+    if key_type is float and isinstance(value, (int, float)):
+        return value
+    if key_type is str and isinstance(value, str):
+        return value
+    if key_type is None and isinstance(value, (str, int, float)):
+        return value
+    raise ValueError("Invalid cursor")
+
+
+def decode_cursor(cursor: str, key_types: Sequence[Optional[type]]) -> List[Any]:
+    """
+    Decode a cursor produced by encode_cursor
+
+    key_types are the Python types of the sort columns (int, str, float,
+    datetime; None accepts any scalar). Every value must match its type,
+    so a forged cursor is rejected here instead of failing in SQL.
+
+    Raises:
+        ValueError: If the cursor is malformed or for a different ordering
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if not isinstance(values, list) or len(values) != len(key_types):
+        raise ValueError("Invalid cursor")
+    return [_decode_value(value, key_type) for value, key_type in zip(values, key_types)]
+
+
+def keyset_condition(columns: Sequence, values: Sequence[Any], descending: bool = False):
+    """
+    WHERE clause selecting rows strictly after the cursor in (columns) order
+
+    Expanded to (a > x) OR (a = x AND b > y) ... rather than a row-value
+    comparison, so every database can use the leading index column.
+    """
+    clauses = []
+    for i, column in enumerate(columns):
+        equal_prefix = [columns[j] == values[j] for j in range(i)]
+        step = column < values[i] if descending else column > values[i]
+        clauses.append(and_(*equal_prefix, step) if equal_prefix else step)
+    return or_(*clauses)
+
+
+def apply_keyset(statement, columns: Sequence, cursor: str, limit: int, descending: bool = False):
+    """
+    Add the cursor condition, ordering and limit+1 to an ORM query or select()
+
+    Raises:
+        ValueError: If the cursor is invalid
+    """
+    if cursor:
+        statement = statement.where(keyset_condition(columns, decode_cursor(cursor, [_key_type(column) for column in columns]), descending))
+    order = [column.desc() for column in columns] if descending else list(columns)
+    return statement.order_by(*order).limit(limit + 1)
+
+
+def finish_page(rows: list, columns: Sequence, limit: int):
+    """Trim the extra row fetched by apply_keyset; returns (rows, next_cursor)"""
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor([getattr(last, column.key) for column in columns])
+    return rows, next_cursor
+
+
+def paginate(query, columns: Sequence, cursor: str, limit: int, descending: bool = False):
+    """
+    Apply keyset pagination to an ORM query
+
+    Returns (rows, next_cursor); next_cursor is None on the last page.
+    columns must end with a unique column so the ordering is total.
+    """
+    rows = apply_keyset(query, columns, cursor, limit, descending).all()
+    return finish_page(rows, columns, limit)
@@ -0,0 +1,204 @@
+"""Price Updates - bulk apply of product price uploads and price history lookups"""
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence
+from sqlalchemy import func, insert, select, update
+from sqlalchemy.orm import Session
+from data_version import bump_data_version
+from models import Product, PriceHistory
+
+# goods_ids per IN (...) lookup; keeps well under every database's bind-parameter limit
+PRICE_LOOKUP_CHUNK = 900
+
+
+def _chunks(items: Sequence, size: int):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _load_products(db: Session, goods_ids: List[str]) -> Dict[str, dict]:
+    """Current state of the given products, keyed by goods_id"""
+    products = {}
+    for chunk in _chunks(goods_ids, PRICE_LOOKUP_CHUNK):
+        rows = db.execute(
+            select(
+                Product.id, Product.goods_id, Product.name, Product.category,
+                Product.current_price, Product.last_price_update,
+            )
+            .where(Product.goods_id.in_(chunk))
+        ).all()
+        for product_id, goods_id, name, category, price, price_updated in rows:
+            products[goods_id] = {
+                "id": product_id,
+                "name": name,
+                "category": category,
+                "current_price": price,
+                "last_price_update": price_updated,
+            }
+    return products
+
+
+def apply_price_updates(db: Session, updates: list, source: str = "admin_api") -> dict:
+    """
+    Apply a price list in a handful of statements
+
+    Existing products are loaded with chunked IN queries, changes are worked
+    out in memory (entries are applied in order, so a goods_id repeated in
+    one upload behaves as it did row by row), then products and price
+    history are written with bulk INSERT/UPDATE statements. The caller
+    commits.
+
+    last_price_update moves only when the price itself changes. Returns
+    counts: updated (entries applied), created, changed (existing products
+    whose fields changed) and price_changed (history rows written).
+    """
+    now = datetime.now()
+    goods_ids = list(dict.fromkeys(u.goods_id for u in updates))
+    existing = _load_products(db, goods_ids)
+
+    created: Dict[str, dict] = {}
+    changed: Dict[str, dict] = {}
+    history: List[tuple] = []  # (goods_id, old_price, new_price)
+
+    for u in updates:
+        product = existing.get(u.goods_id)
+        if product is None:
+            product = created.get(u.goods_id)
+
+        if product is None:
+            created[u.goods_id] = {
+                "goods_id": u.goods_id,
+                "name": u.name,
+                "category": u.category,
+                "current_price": u.price,
+                "last_price_update": now,
+            }
+            if u.price is not None:
+                history.append((u.goods_id, None, u.price))
+            continue
+
+        dirty = False
+        if u.name is not None and product["name"] != u.name:
+            product["name"] = u.name
+            dirty = True
+        if u.category is not None and product["category"] != u.category:
+            product["category"] = u.category
+            dirty = True
+        if u.price is not None and product["current_price"] != u.price:
+            history.append((u.goods_id, product["current_price"], u.price))
+            product["current_price"] = u.price
+            # Only a new price moves it; renames and recategorisations do not
+            product["last_price_update"] = now
+            dirty = True
+        if dirty and "id" in product:
+            changed[u.goods_id] = product
+
+    if created:
+        db.execute(insert(Product), list(created.values()))
+    if changed:
+        db.execute(update(Product), [
+            {
+                "id": p["id"],
+                "name": p["name"],
+                "category": p["category"],
+                "current_price": p["current_price"],
+                "last_price_update": p["last_price_update"],
+            }
+            for p in changed.values()
+        ])
+
+    if history:
+        product_ids = {goods_id: p["id"] for goods_id, p in existing.items()}
+        if created:
+            product_ids.update(
+                (goods_id, p["id"]) for goods_id, p in _load_products(db, list(created)).items()
+            )
+        db.execute(insert(PriceHistory), [
+            {
+                "product_id": product_ids[goods_id],
+                "old_price": old_price,
+                "new_price": new_price,
+                "changed_at": now,
+                "source": source,
+            }
+            for goods_id, old_price, new_price in history
+        ])
+
+    if created or changed:
+        bump_data_version(db, "price_update")
+
+    return {
+        "updated": len(updates),
+        "created": len(created),
+        "changed": len(changed),
+        "price_changed": len(history),
+    }
+
+
+def price_history_query(
+    db: Session,
+    goods_id: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+):
+    """
+    Price history joined with its product, optionally for one goods_id and/or a time range
+
+    Rows carry id, product_id, goods_id, name, old_price, new_price,
+    changed_at and source. Filtering by goods_id is resolved through the
+    products unique index and then the (product_id, changed_at) index.
+    """
+    query = db.query(
+        PriceHistory.id,
+        PriceHistory.product_id,
+        Product.goods_id,
+        Product.name,
+        PriceHistory.old_price,
+        PriceHistory.new_price,
+        PriceHistory.changed_at,
+        PriceHistory.source,
+    ).join(Product, Product.id == PriceHistory.product_id)
+    if goods_id is not None:
+        query = query.filter(Product.goods_id == goods_id)
+    if start is not None:
+        query = query.filter(PriceHistory.changed_at >= start)
+    if end is not None:
+        query = query.filter(PriceHistory.changed_at < end)
+    return query
+
+
+def get_prices_as_of(db: Session, as_of: datetime, goods_ids: Optional[List[str]] = None) -> Dict[str, float]:
+    """
+    Price of each product as it stood at as_of: {goods_id: price}
+
+    Uses the latest price history entry at or before as_of (ties broken by
+    id, as several entries can share a timestamp within one upload).
+    Products with no history before as_of are left out.
+    """
+    latest = (
+        select(
+            PriceHistory.product_id,
+            PriceHistory.new_price,
+            func.row_number().over(
+                partition_by=PriceHistory.product_id,
+                order_by=(PriceHistory.changed_at.desc(), PriceHistory.id.desc()),
+            ).label("rank"),
+        )
+        .where(PriceHistory.changed_at <= as_of)
+    )
+
+    prices: Dict[str, float] = {}
+    id_chunks = [None] if goods_ids is None else list(_chunks(goods_ids, PRICE_LOOKUP_CHUNK))
+    for chunk in id_chunks:
+        statement = latest
+        if chunk is not None:
+            statement = statement.where(
+                PriceHistory.product_id.in_(select(Product.id).where(Product.goods_id.in_(chunk)))
+            )
+        ranked = statement.subquery()
+        rows = db.execute(
+            select(Product.goods_id, ranked.c.new_price)
+            .join(ranked, ranked.c.product_id == Product.id)
+            .where(ranked.c.rank == 1)
+        ).all()
+        prices.update(rows)
+    return prices
@@ -1,9 +1,13 @@
 """PRM IMEI Importer - reads Excel file and populates database"""
-import pandas as pd
+import logging
 from datetime import datetime
+from typing import Optional
 from sqlalchemy.orm import Session
+from inventory_history import record_inventory_history
 from models import Retailer, Product, PrmInventorySnapshot, Activation
 
+logger = logging.getLogger(__name__)
+
 
 def categorize_product(name: str) -> str:
     """
@@ -29,13 +33,14 @@ def categorize_product(name: str) -> str:
     return 'eco'
 
 
-def import_prm_imei_file(path: str, db_session: Session) -> dict:
+def import_prm_imei_file(path: str, db_session: Session, sync_run_id: Optional[int] = None) -> dict:
     """
     Import PRM IMEI Excel file into database
     
     Args:
         path: Path to Excel file
         db_session: SQLAlchemy database session
+        sync_run_id: PrmSyncRunLog id the inventory history run is linked to
         
     Returns:
         dict: Import statistics
@@ -43,7 +48,10 @@ def import_prm_imei_file(path: str, db_session: Session) -> dict:
     Raises:
         Exception: If file read fails or data is invalid
     """
-    print(f"\nReading Excel file: {path}")
+    # Loaded on first import, not at API startup: pandas/openpyxl take a few hundred ms to import
+    import pandas as pd
+
+    logger.info("Reading Excel file: %s", path)
     
     try:
         df = pd.read_excel(path, engine='openpyxl')
@@ -52,8 +60,8 @@ def import_prm_imei_file(path: str, db_session: Session) -> dict:
     except Exception as e:
         raise Exception(f"Failed to read Excel file: {str(e)}")
     
-    print(f"Found {len(df)} rows in Excel file")
-    print(f"Columns: {list(df.columns)}")
+    logger.info("Found %d rows in Excel file", len(df))
+    logger.debug("Columns: %s", list(df.columns))
     
     # FIXED: Define column indices based on actual Excel structure
     # These indices are 0-based and match the typical PRM IMEI export format
@@ -67,15 +75,17 @@ def import_prm_imei_file(path: str, db_session: Session) -> dict:
     
     # Validate that we have enough columns
     if len(df.columns) < 20:
-        print(f"⚠ Warning: Expected at least 20 columns, found {len(df.columns)}")
-        print("Attempting import anyway, but results may be incorrect...")
+        logger.warning(
+            "⚠ Expected at least 20 columns, found %d; attempting import anyway, but results may be incorrect",
+            len(df.columns)
+        )
     
     retailers_upserted = 0
     products_upserted = 0
     inventory_dict = {}
     activations_list = []
     
-    print("\nProcessing rows...")
+    logger.info("Processing rows...")
     processed_count = 0
     error_count = 0
     
@@ -158,21 +168,26 @@ def import_prm_imei_file(path: str, db_session: Session) -> dict:
             
             # Progress indicator
             if (idx + 1) % 100 == 0:
-                print(f"  Processed {idx + 1}/{len(df)} rows...")
+                logger.debug("Processed %d/%d rows", idx + 1, len(df))
                 
         except Exception as e:
             error_count += 1
-            print(f"Warning: Error processing row {idx}: {str(e)}")
+            logger.warning("Error processing row %s: %s", idx, e)
             continue
     
     # Commit retailer and product changes
     db_session.commit()
-    print(f"\n✓ Processed {processed_count} rows ({error_count} errors)")
-    print(f"✓ Upserted {retailers_upserted} retailers")
-    print(f"✓ Upserted {products_upserted} products")
-    
+    logger.info(
+        "✓ Processed %d rows (%d errors), upserted %d retailers and %d products",
+        processed_count, error_count, retailers_upserted, products_upserted
+    )
+    
+    # Record what changed since the last import (reads the snapshot table before the rebuild)
+    snapshot_time = datetime.now()
+    history = record_inventory_history(db_session, inventory_dict, snapshot_time, sync_run_id)
+
     # Rebuild inventory snapshot (replace all existing data)
-    print("\n⟳ Rebuilding inventory snapshot...")
+    logger.info("⟳ Rebuilding inventory snapshot...")
     db_session.query(PrmInventorySnapshot).delete()
     
     for (retailer_id, goods_id), quantity in inventory_dict.items():
@@ -180,15 +195,18 @@ def import_prm_imei_file(path: str, db_session: Session) -> dict:
             retailer_id=retailer_id,
             goods_id=goods_id,
             quantity=quantity,
-            last_seen=datetime.now()
+            last_seen=snapshot_time
         )
         db_session.add(snapshot)
     
     db_session.commit()
-    print(f"✓ Created {len(inventory_dict)} inventory snapshot records")
+    logger.info(
+        "✓ Created %d inventory snapshot records (%d changed lines in history run %d)",
+        len(inventory_dict), history["changed_lines"], history["run_id"]
+    )
     
     # Clear and insert activations
-    print("\n⟳ Inserting activations...")
+    logger.info("⟳ Inserting activations...")
     db_session.query(Activation).delete()
     
     for activation_data in activations_list:
@@ -196,15 +214,13 @@ def import_prm_imei_file(path: str, db_session: Session) -> dict:
         db_session.add(activation)
     
     db_session.commit()
-    print(f"✓ Inserted {len(activations_list)} activation records")
-    
-    print("\n" + "=" * 60)
-    print("Import completed successfully!")
-    print("=" * 60)
+    logger.info("✓ Inserted %d activation records", len(activations_list))
+    logger.info("Import completed successfully")
     
     return {
         "retailers_upserted": retailers_upserted,
         "products_upserted": products_upserted,
         "inventory_rows": len(inventory_dict),
+        "inventory_changes": history["changed_lines"],
         "activations_rows": len(activations_list)
     }
@@ -0,0 +1,175 @@
+"""Query Budget - per-request SQL statement budgets and N+1 detection for debugging and tests"""
+import json
+import logging
+import os
+import re
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import List, Optional
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Off by default: shape normalisation costs a regex pass per statement
+QUERY_BUDGET_ENABLED = os.getenv("QUERY_BUDGET_ENABLED", "false").lower() in ("1", "true", "yes")
+# Statements one request may run before it is flagged
+QUERY_BUDGET = int(os.getenv("QUERY_BUDGET", "50"))
+# Executions of one statement shape in a request that count as an N+1 loop
+QUERY_REPEAT_LIMIT = int(os.getenv("QUERY_REPEAT_LIMIT", "10"))
+# Fail flagged requests with a 500 instead of only logging them (for test runs)
+QUERY_BUDGET_STRICT = os.getenv("QUERY_BUDGET_STRICT", "false").lower() in ("1", "true", "yes")
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE = re.compile(r"\s+")
+_NUMBER = re.compile(r"(?<![\w.])-?\d+(\.\d+)?\b")
+_STRING = re.compile(r"'(?:[^']|'')*'")
+# Expanded IN lists and multi-row VALUES differ only in length
+_PARAM_LIST = re.compile(r"\((?:\s*(?:\?|%\(\w+\)s|%s|:\w+|\$\d+)\s*,)+\s*(?:\?|%\(\w+\)s|%s|:\w+|\$\d+)\s*\)")
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Raised by query_budget() (and strict mode) when a budget is exceeded"""
+
+
+def statement_shape(statement: str) -> str:
+    """SQL with literals and parameter lists collapsed, so one query in a loop has one shape"""
+    shape = _STRING.sub("?", statement)
+    shape = _NUMBER.sub("?", shape)
+    shape = _PARAM_LIST.sub("(?)", shape)
+    return _WHITESPACE.sub(" ", shape).strip()
+
+
+def _abbreviate(shape: str, head: int = 120, tail: int = 100) -> str:
+    """Keep the start (columns) and end (FROM/WHERE) of long statements"""
+    if len(shape) <= head + tail:
+        return shape
+    return f"{shape[:head]} ... {shape[-tail:]}"
+
+
+class QueryTracker:
+    """Counts statements and their shapes for one request or block"""
+
+    def __init__(self):
+        self.count = 0
+        self.shapes: Counter = Counter()
+        self._lock = threading.Lock()
+
+    def record(self, statement: str) -> None:
+        shape = statement_shape(statement)
+        with self._lock:
+            self.count += 1
+            self.shapes[shape] += 1
+
+    def repeated(self, limit: int = QUERY_REPEAT_LIMIT) -> List[tuple]:
+        """(shape, executions) for shapes run at least limit times, most frequent first"""
+        return [(shape, n) for shape, n in self.shapes.most_common() if n >= limit]
+
+    def problems(self, max_queries: Optional[int] = QUERY_BUDGET, max_repeats: Optional[int] = QUERY_REPEAT_LIMIT) -> List[str]:
+        """Human-readable budget violations; empty when within budget"""
+        found = []
+        if max_queries is not None and self.count > max_queries:
+            found.append(f"{self.count} SQL statements (budget {max_queries})")
+        if max_repeats is not None:
+            for shape, n in self.repeated(max_repeats):
+                found.append(f"{n}x {_abbreviate(shape)}")
+        return found
+
+
+# Tracker for the request being served (set by QueryBudgetMiddleware)
+_request_tracker: ContextVar[Optional[QueryTracker]] = ContextVar("query_tracker", default=None)
+# Trackers opened with query_budget(); they see statements from every thread
+_block_trackers: List[QueryTracker] = []
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _count_statement(conn, cursor, statement, parameters, context, executemany):
+    tracker = _request_tracker.get()
+    if tracker is not None:
+        tracker.record(statement)
+    for block_tracker in _block_trackers:
+        block_tracker.record(statement)
+
+
+@contextmanager
+def query_budget(max_queries: Optional[int] = None, max_repeats: Optional[int] = QUERY_REPEAT_LIMIT):
+    """
+    Fail a block that runs too many statements or repeats one shape too often
+
+        with query_budget(max_queries=5):
+            client.get("/reports/negative")
+
+    Counts every statement in the process while the block runs (including
+    those from the TestClient's server thread), so use it one block at a
+    time. Raises QueryBudgetExceeded on exit; yields the tracker.
+    """
+    tracker = QueryTracker()
+    _block_trackers.append(tracker)
+    try:
+        yield tracker
+    finally:
+        _block_trackers.remove(tracker)
+    problems = tracker.problems(max_queries, max_repeats)
+    if problems:
+        raise QueryBudgetExceeded("Query budget exceeded: " + "; ".join(problems))
+
+
+class QueryBudgetMiddleware:
+    """
+    ASGI middleware counting the SQL statements each request runs
+
+    Adds an X-Query-Count header and logs a warning (with the repeated
+    statement shapes) when a request exceeds QUERY_BUDGET or repeats a
+    shape QUERY_REPEAT_LIMIT times. In strict mode such a request gets a
+    500 describing the violation instead of its normal response, which
+    fails any test that calls it. The check runs when the response starts,
+    so statements run while streaming a body are not included.
+    """
+
+    def __init__(self, app, max_queries: int = QUERY_BUDGET, max_repeats: int = QUERY_REPEAT_LIMIT, strict: bool = QUERY_BUDGET_STRICT):
+        self.app = app
+        self.max_queries = max_queries
+        self.max_repeats = max_repeats
+        self.strict = strict
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        tracker = QueryTracker()
+        token = _request_tracker.set(tracker)
+        state = {"rejected": False}
+
+        async def send_wrapper(message):
+            if state["rejected"]:
+                return
+            if message["type"] == "http.response.start":
+                problems = tracker.problems(self.max_queries, self.max_repeats)
+                if problems:
+                    logger.warning(
+                        "⚠ %s %s: %s", scope["method"], scope["path"], "; ".join(problems),
+                        extra={"query_count": tracker.count, "path": scope["path"]}
+                    )
+                if problems and self.strict:
+                    state["rejected"] = True
+                    body = json.dumps({"detail": "Query budget exceeded", "problems": problems}).encode("utf-8")
+                    await send({
+                        "type": "http.response.start",
+                        "status": 500,
+                        "headers": [
+                            (b"content-type", b"application/json"),
+                            (b"content-length", str(len(body)).encode()),
+                            (b"x-query-count", str(tracker.count).encode()),
+                        ],
+                    })
+                    await send({"type": "http.response.body", "body": body})
+                    return
+                message["headers"] = list(message.get("headers", [])) + [(b"x-query-count", str(tracker.count).encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _request_tracker.reset(token)
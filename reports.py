@@ -0,0 +1,279 @@
+"""Reports - set-based report queries shared by the API endpoints"""
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import Optional, Tuple
+from sqlalchemy import and_, case, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+import database
+from data_version import get_data_version, snapshot_cache
+from models import Retailer, Product, PrmInventorySnapshot, Activation, TallyLedgerCache, PrmSyncRunLog
+from tally_cache import CACHE_TTL_MINUTES, get_closing_balances_with_cache, get_closing_balances_with_cache_async
+
+# Recompute even without data changes after this long, so balance refreshes show up
+REPORT_SNAPSHOT_MAX_AGE_SECONDS = int(os.getenv("REPORT_SNAPSHOT_MAX_AGE_SECONDS", "600"))
+REPORT_PRECOMPUTE_AFTER_SYNC = os.getenv("REPORT_PRECOMPUTE_AFTER_SYNC", "true").lower() in ("1", "true", "yes")
+
+# Sales window of the retailer summary, as in the approval engine
+SUMMARY_SALES_DAYS = 30
+
+logger = logging.getLogger(__name__)
+
+
+def stock_value_select():
+    """
+    Stock value per retailer with inventory: (retailer_id, retailer_code, name, stock_value)
+
+    Products without a price contribute nothing, as in compute_stock_value.
+    """
+    return (
+        select(
+            Retailer.id,
+            Retailer.retailer_code,
+            Retailer.name,
+            func.coalesce(func.sum(PrmInventorySnapshot.quantity * Product.current_price), 0.0),
+        )
+        .join(PrmInventorySnapshot, PrmInventorySnapshot.retailer_id == Retailer.id)
+        .outerjoin(Product, Product.goods_id == PrmInventorySnapshot.goods_id)
+        .group_by(Retailer.id, Retailer.retailer_code, Retailer.name)
+    )
+
+
+def build_negative_report(db: Session) -> dict:
+    """
+    Negative/OD report in a fixed number of queries
+
+    One aggregate query for stock values, one bulk read of cached balances,
+    and at most one Tally collection export for balances still missing.
+    Retailers whose balance cannot be resolved are left out, as before.
+    """
+    stock_rows = db.execute(stock_value_select()).all()
+    balances = get_closing_balances_with_cache(db, [row[1] for row in stock_rows])
+    return _negative_report_from(stock_rows, balances)
+
+
+async def build_negative_report_async(db: AsyncSession) -> dict:
+    """build_negative_report with awaited database reads and Tally fetch"""
+    stock_rows = (await db.execute(stock_value_select())).all()
+    balances = await get_closing_balances_with_cache_async(db, [row[1] for row in stock_rows])
+    return _negative_report_from(stock_rows, balances)
+
+
+def _negative_report_from(stock_rows, balances: dict) -> dict:
+    report_rows = []
+    unresolved = 0
+    for _, retailer_code, retailer_name, stock_value in stock_rows:
+        # Ledger name is the retailer code
+        balance = balances.get(retailer_code)
+        if balance is None:
+            unresolved += 1
+            continue
+
+        # Calculate OD amount (positive means retailer owes money)
+        od_amount = balance - stock_value
+
+        # Only include retailers with positive OD
+        if od_amount > 0:
+            report_rows.append({
+                "retailer_code": retailer_code,
+                "retailer_name": retailer_name,
+                "closing_balance": round(balance, 2),
+                "stock_value": round(stock_value, 2),
+                "od_amount": round(od_amount, 2)
+            })
+
+    if unresolved:
+        logger.warning("Could not get balance for %d retailers", unresolved)
+
+    return {
+        "generated_at": datetime.now(),
+        "rows": sorted(report_rows, key=lambda x: x['od_amount'], reverse=True)
+    }
+
+
+def get_negative_report_snapshot(db: Session) -> Tuple[dict, str]:
+    """
+    Negative report computed once per data version, with its ETag
+
+    The version is read before building, so a report that itself pulls new
+    balances from Tally (bumping the version) is simply rebuilt on the next
+    request rather than served under a version it may not reflect.
+    """
+    version = get_data_version(db)
+    snapshot = snapshot_cache.get("negative-report", version, REPORT_SNAPSHOT_MAX_AGE_SECONDS)
+    if snapshot is not None:
+        return snapshot
+
+    report = build_negative_report(db)
+    etag = snapshot_cache.put("negative-report", version, report)
+    return report, etag
+
+
+async def get_negative_report_snapshot_async(db: AsyncSession) -> Tuple[dict, str]:
+    """Async get_negative_report_snapshot"""
+    version = await db.run_sync(get_data_version)
+    snapshot = snapshot_cache.get("negative-report", version, REPORT_SNAPSHOT_MAX_AGE_SECONDS)
+    if snapshot is not None:
+        return snapshot
+
+    report = await build_negative_report_async(db)
+    etag = snapshot_cache.put("negative-report", version, report)
+    return report, etag
+
+
+def warm_negative_report() -> None:
+    """Precompute the report snapshot in the background after a sync"""
+    db = database.ReadSessionLocal()
+    try:
+        get_negative_report_snapshot(db)
+        logger.info("✓ Negative report snapshot precomputed")
+    except Exception as e:
+        logger.warning("Could not precompute negative report: %s", e)
+    finally:
+        db.close()
+
+
+# --- Retailer summary (dashboard) -------------------------------------------------
+
+def retailer_summary_select(since: datetime, retailer_code: Optional[str] = None):
+    """
+    One row per retailer with everything the dashboard shows, in one statement
+
+    (id, retailer_code, name, stock_value, inventory_lines, sales_value,
+    last_activation, closing_balance, balance_as_of). Stock value and sales
+    use current prices as in the negative report and the approval engine;
+    the balance is the latest tally_ledger_cache row (no Tally call).
+    """
+    def scoped(query, column):
+        if retailer_code is None:
+            return query
+        return query.where(column == select(Retailer.id).where(Retailer.retailer_code == retailer_code).scalar_subquery())
+
+    stock = scoped(
+        select(
+            PrmInventorySnapshot.retailer_id,
+            func.sum(PrmInventorySnapshot.quantity * func.coalesce(Product.current_price, 0.0)).label("stock_value"),
+            func.count().label("lines"),
+        )
+        .outerjoin(Product, Product.goods_id == PrmInventorySnapshot.goods_id),
+        PrmInventorySnapshot.retailer_id,
+    ).group_by(PrmInventorySnapshot.retailer_id).subquery()
+
+    sales = scoped(
+        select(
+            Activation.retailer_id,
+            func.sum(case((Activation.activation_time >= since, Product.current_price), else_=0.0)).label("sales_value"),
+            func.max(Activation.activation_time).label("last_activation"),
+        )
+        .join(Product, Product.goods_id == Activation.goods_id)
+        .where(Activation.activation_time != None),  # noqa: E711
+        Activation.retailer_id,
+    ).group_by(Activation.retailer_id).subquery()
+
+    latest = scoped(
+        select(
+            TallyLedgerCache.retailer_id,
+            TallyLedgerCache.closing_balance,
+            TallyLedgerCache.as_of,
+            func.row_number().over(
+                partition_by=TallyLedgerCache.retailer_id,
+                order_by=(TallyLedgerCache.as_of.desc(), TallyLedgerCache.id.desc()),
+            ).label("position"),
+        ),
+        TallyLedgerCache.retailer_id,
+    ).subquery()
+
+    stmt = (
+        select(
+            Retailer.id,
+            Retailer.retailer_code,
+            Retailer.name,
+            func.coalesce(stock.c.stock_value, 0.0),
+            func.coalesce(stock.c.lines, 0),
+            func.coalesce(sales.c.sales_value, 0.0),
+            sales.c.last_activation,
+            latest.c.closing_balance,
+            latest.c.as_of,
+        )
+        .outerjoin(stock, stock.c.retailer_id == Retailer.id)
+        .outerjoin(sales, sales.c.retailer_id == Retailer.id)
+        .outerjoin(latest, and_(latest.c.retailer_id == Retailer.id, latest.c.position == 1))
+        .order_by(Retailer.retailer_code)
+    )
+    if retailer_code is not None:
+        stmt = stmt.where(Retailer.retailer_code == retailer_code)
+    return stmt
+
+
+def _summary_row(row, now: datetime) -> dict:
+    retailer_id, code, name, stock_value, lines, sales_value, last_activation, balance, as_of = row
+    age_minutes = int((now - as_of).total_seconds() / 60) if as_of is not None else None
+    return {
+        "retailer_id": retailer_id,
+        "retailer_code": code,
+        "retailer_name": name,
+        "stock_value": round(stock_value, 2),
+        "inventory_lines": lines,
+        "closing_balance": round(balance, 2) if balance is not None else None,
+        "balance_as_of": as_of,
+        "balance_age_minutes": age_minutes,
+        "balance_expired": age_minutes is None or age_minutes > CACHE_TTL_MINUTES,
+        # Positive means the retailer owes more than their stock covers, as in the negative report
+        "od_amount": round(balance - stock_value, 2) if balance is not None else None,
+        "sales_30d_value": round(sales_value, 2),
+        "last_activation": last_activation,
+    }
+
+
+def build_retailer_summary(db: Session) -> dict:
+    """All-retailer summary with dashboard totals: two statements, no Tally calls"""
+    now = datetime.now()
+    rows = [_summary_row(row, now) for row in db.execute(retailer_summary_select(now - timedelta(days=SUMMARY_SALES_DAYS)))]
+    last_sync = db.execute(
+        select(func.max(PrmSyncRunLog.finished_at)).where(PrmSyncRunLog.status == "success")
+    ).scalar()
+
+    od_rows = [row for row in rows if row["od_amount"] is not None and row["od_amount"] > 0]
+    return {
+        "generated_at": now,
+        "last_sync_at": last_sync,
+        "totals": {
+            "retailers": len(rows),
+            "with_inventory": sum(1 for row in rows if row["inventory_lines"]),
+            "od_retailers": len(od_rows),
+            "total_od_amount": round(sum(row["od_amount"] for row in od_rows), 2),
+            "total_stock_value": round(sum(row["stock_value"] for row in rows), 2),
+            "balances_missing_or_expired": sum(1 for row in rows if row["balance_expired"]),
+        },
+        "rows": rows,
+    }
+
+
+def get_retailer_summary_snapshot(db: Session) -> Tuple[dict, str]:
+    """Retailer summary computed once per data version (and REPORT_SNAPSHOT_MAX_AGE_SECONDS), with its ETag"""
+    version = get_data_version(db)
+    snapshot = snapshot_cache.get("retailer-summary", version, REPORT_SNAPSHOT_MAX_AGE_SECONDS)
+    if snapshot is not None:
+        return snapshot
+
+    summary = build_retailer_summary(db)
+    etag = snapshot_cache.put("retailer-summary", version, summary)
+    return summary, etag
+
+
+def get_retailer_summary(db: Session, retailer_code: str) -> Optional[dict]:
+    """
+    One retailer's summary row, None for an unknown retailer
+
+    Taken from the all-retailer snapshot when it is current; otherwise one
+    statement scoped to the retailer (not cached, so a single lookup never
+    pays for building the full summary).
+    """
+    snapshot = snapshot_cache.get("retailer-summary", get_data_version(db), REPORT_SNAPSHOT_MAX_AGE_SECONDS)
+    if snapshot is not None:
+        return next((row for row in snapshot[0]["rows"] if row["retailer_code"] == retailer_code), None)
+
+    now = datetime.now()
+    row = db.execute(retailer_summary_select(now - timedelta(days=SUMMARY_SALES_DAYS), retailer_code)).first()
+    return _summary_row(row, now) if row is not None else None
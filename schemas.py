@@ -13,6 +13,7 @@ class PrmSyncResponse(BaseModel):
     retailers_upserted: int
     products_upserted: int
     inventory_rows: int
+    inventory_changes: int = 0  # lines recorded in the inventory history run
     activations_rows: int
     status: str
 
@@ -29,7 +30,10 @@ class ProductPriceUpdateRequest(BaseModel):
 
 
 class ProductPriceUpdateResponse(BaseModel):
-    updated: int
+    updated: int  # entries applied
+    created: int = 0
+    changed: int = 0  # existing products whose fields changed
+    price_changed: int = 0
 
 
 class TallyClosingBalanceResponse(BaseModel):
@@ -50,6 +54,50 @@ class NegativeReportResponse(BaseModel):
     rows: List[NegativeReportRow]
 
 
+class RetailerSummaryRow(BaseModel):
+    retailer_id: int
+    retailer_code: str
+    retailer_name: str
+    stock_value: float
+    inventory_lines: int
+    closing_balance: Optional[float] = None
+    balance_as_of: Optional[datetime] = None
+    balance_age_minutes: Optional[int] = None
+    balance_expired: bool
+    od_amount: Optional[float] = None
+    sales_30d_value: float
+    last_activation: Optional[datetime] = None
+
+
+class RetailerSummaryTotals(BaseModel):
+    retailers: int
+    with_inventory: int
+    od_retailers: int
+    total_od_amount: float
+    total_stock_value: float
+    balances_missing_or_expired: int
+
+
+class RetailerSummaryResponse(BaseModel):
+    generated_at: datetime
+    last_sync_at: Optional[datetime] = None
+    totals: RetailerSummaryTotals
+    rows: List[RetailerSummaryRow]
+
+
+class SearchResult(BaseModel):
+    type: str
+    code: str
+    name: Optional[str] = None
+    score: float
+    match: str
+
+
+class SearchResponse(BaseModel):
+    query: str
+    results: List[SearchResult]
+
+
 # NEW: Retailer list API schema
 class RetailerOut(BaseModel):
     id: int
@@ -0,0 +1,286 @@
+"""Search - ranked prefix, substring and fuzzy search over retailers and products for type-ahead"""
+import os
+from typing import Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import and_, func, or_, select, text
+from sqlalchemy.exc import OperationalError, ProgrammingError
+from sqlalchemy.orm import Session
+from models import Product, Retailer
+
+# Rows fetched from the substring/fuzzy index per type before ranking
+SEARCH_CANDIDATES = int(os.getenv("SEARCH_CANDIDATES", "200"))
+# Lowest trigram similarity (0-1) kept as a fuzzy match
+SEARCH_FUZZY_THRESHOLD = float(os.getenv("SEARCH_FUZZY_THRESHOLD", "0.3"))
+MAX_QUERY_LENGTH = 100
+# Trigram terms sent to FTS5 for one query
+MAX_QUERY_TRIGRAMS = 32
+
+# type -> (model, code column, SQLite FTS5 table)
+SEARCH_TYPES = {
+    "retailer": (Retailer, Retailer.retailer_code, "retailer_search"),
+    "product": (Product, Product.goods_id, "product_search"),
+}
+
+# Index backend per database URL: fts5 (SQLite), trigram (PostgreSQL pg_trgm) or like
+_backends: Dict[str, str] = {}
+
+
+def _sqlite_ddl(table: str, code: str, fts: str) -> List[str]:
+    """FTS5 trigram table keyed by the row id, filled from the table and kept in step by triggers"""
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5({code}, name, tokenize='trigram')",
+        f"DELETE FROM {fts}",
+        f"INSERT INTO {fts}(rowid, {code}, name) SELECT id, {code}, coalesce(name, '') FROM {table}",
+        f"""CREATE TRIGGER IF NOT EXISTS {fts}_insert AFTER INSERT ON {table} BEGIN
+            INSERT INTO {fts}(rowid, {code}, name) VALUES (new.id, new.{code}, coalesce(new.name, ''));
+        END""",
+        # Bulk updates set name on every row (price uploads); only real changes touch the index
+        f"""CREATE TRIGGER IF NOT EXISTS {fts}_update AFTER UPDATE OF {code}, name ON {table}
+        WHEN old.{code} IS NOT new.{code} OR old.name IS NOT new.name BEGIN
+            UPDATE {fts} SET {code} = new.{code}, name = coalesce(new.name, '') WHERE rowid = old.id;
+        END""",
+        f"""CREATE TRIGGER IF NOT EXISTS {fts}_delete AFTER DELETE ON {table} BEGIN
+            DELETE FROM {fts} WHERE rowid = old.id;
+        END""",
+    ]
+
+
+def _postgres_ddl(table: str, code: str) -> List[str]:
+    return [
+        f"CREATE INDEX IF NOT EXISTS ix_{table}_{code}_trgm ON {table} USING gin ({code} gin_trgm_ops)",
+        f"CREATE INDEX IF NOT EXISTS ix_{table}_name_trgm ON {table} USING gin (name gin_trgm_ops)",
+    ]
+
+
+def create_search_index(engine) -> str:
+    """
+    Create the search index for this database and return the backend it enables
+
+    SQLite: FTS5 tables with the trigram tokenizer (SQLite 3.34+).
+    PostgreSQL: pg_trgm GIN indexes. Where neither is available (or the
+    extension cannot be created) search falls back to LIKE scans.
+    """
+    dialect = engine.dialect.name
+    try:
+        if dialect == "sqlite":
+            statements = [
+                statement
+                for model, code, fts in SEARCH_TYPES.values()
+                for statement in _sqlite_ddl(model.__tablename__, code.name, fts)
+            ]
+            backend = "fts5"
+        elif dialect == "postgresql":
+            statements = ["CREATE EXTENSION IF NOT EXISTS pg_trgm"] + [
+                statement
+                for model, code, _ in SEARCH_TYPES.values()
+                for statement in _postgres_ddl(model.__tablename__, code.name)
+            ]
+            backend = "trigram"
+        else:
+            print(f"⚠ No search index for {dialect}, search uses LIKE scans")
+            return "like"
+        with engine.begin() as conn:
+            for statement in statements:
+                conn.execute(text(statement))
+    except (OperationalError, ProgrammingError) as e:
+        print(f"⚠ Search index not created, search uses LIKE scans: {e}")
+        return "like"
+    _backends.pop(str(engine.url), None)
+    print(f"✓ Created {backend} search index")
+    return backend
+
+
+def search_backend(db: Session) -> str:
+    """The index backend for db's database, detected once per URL"""
+    bind = db.get_bind()
+    key = str(bind.url)
+    backend = _backends.get(key)
+    if backend is None:
+        if bind.dialect.name == "sqlite":
+            found = db.execute(text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'retailer_search'")).first()
+            backend = "fts5" if found else "like"
+        elif bind.dialect.name == "postgresql":
+            found = db.execute(text("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")).first()
+            backend = "trigram" if found else "like"
+        else:
+            backend = "like"
+        _backends[key] = backend
+    return backend
+
+
+def normalize_query(q: str) -> str:
+    return " ".join(q.split())[:MAX_QUERY_LENGTH]
+
+
+def _like_escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def _grams(value: str) -> set:
+    """pg_trgm-style trigrams: each word padded with two leading spaces and one trailing"""
+    grams = set()
+    for word in value.split():
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def similarity(a: str, b: str) -> float:
+    """Shared trigrams / all trigrams, as pg_trgm's similarity()"""
+    grams_a, grams_b = _grams(a), _grams(b)
+    if not grams_a or not grams_b:
+        return 0.0
+    return len(grams_a & grams_b) / len(grams_a | grams_b)
+
+
+def rank(query: str, code: str, name: Optional[str]) -> Optional[Tuple[float, str]]:
+    """
+    (score, match) for one row, or None when it does not match
+
+    exact 1.0 > code prefix 0.95 > name prefix 0.9 > word prefix 0.85 >
+    substring 0.75 > fuzzy (0.7 x best trigram similarity with the code,
+    the name, or any run of as many name words as the query has)
+    """
+    q = query.lower()
+    code_l = code.lower()
+    name_l = (name or "").lower()
+    if q == code_l or q == name_l:
+        return 1.0, "exact"
+    if code_l.startswith(q):
+        return 0.95, "prefix"
+    if name_l.startswith(q):
+        return 0.9, "prefix"
+    if f" {q}" in f" {name_l}":
+        return 0.85, "word_prefix"
+    if q in code_l or q in name_l:
+        return 0.75, "substring"
+
+    words = name_l.split()
+    width = len(q.split())
+    windows = [" ".join(words[i:i + width]) for i in range(max(1, len(words) - width + 1))]
+    best = max([similarity(q, code_l)] + [similarity(q, window) for window in windows])
+    if best < SEARCH_FUZZY_THRESHOLD:
+        return None
+    return round(0.7 * best, 4), "fuzzy"
+
+
+def _columns(model, code_column):
+    return select(model.id, code_column, model.name)
+
+
+def _prefix_candidates(db: Session, backend: str, model, code_column, query: str, limit: int):
+    """Rows whose code or name starts with the query, from the code and lower(name) indexes, exact matches first"""
+    lowered = query.lower()
+    if backend == "trigram":
+        pattern = _like_escape(query) + "%"
+        condition = or_(code_column.ilike(pattern, escape="\\"), model.name.ilike(pattern, escape="\\"))
+    else:
+        # Index range scans; codes are matched as typed and upper/lower-cased
+        code_ranges = [and_(code_column >= variant, code_column < variant + "\uffff") for variant in {query, query.upper(), lowered}]
+        name_range = and_(func.lower(model.name) >= lowered, func.lower(model.name) < lowered + "\uffff")
+        condition = or_(*code_ranges, name_range)
+    exact = or_(func.lower(code_column) == lowered, func.lower(model.name) == lowered)
+    statement = _columns(model, code_column).where(condition).order_by(exact.desc(), code_column).limit(limit)
+    return db.execute(statement).all()
+
+
+def _fts_candidates(db: Session, model, code_column, fts: str, match: str):
+    table, code = model.__tablename__, code_column.name
+    return db.execute(
+        text(
+            f"SELECT t.id, t.{code}, t.name FROM {fts} JOIN {table} t ON t.id = {fts}.rowid "
+            f"WHERE {fts} MATCH :match ORDER BY bm25({fts}) LIMIT :limit"
+        ),
+        {"match": match, "limit": SEARCH_CANDIDATES},
+    ).all()
+
+
+def _fts_phrase(value: str) -> str:
+    return '"' + value.replace('"', '""') + '"'
+
+
+def _substring_candidates(db: Session, backend: str, model, code_column, fts: str, query: str):
+    """Rows containing the query anywhere in the code or name (queries of 3+ characters)"""
+    if backend == "fts5":
+        # A trigram-tokenized phrase matches substrings, using the index
+        return _fts_candidates(db, model, code_column, fts, _fts_phrase(query))
+    pattern = "%" + _like_escape(query) + "%"
+    if backend == "trigram":
+        condition = or_(code_column.ilike(pattern, escape="\\"), model.name.ilike(pattern, escape="\\"))
+    else:
+        pattern = pattern.lower()
+        condition = or_(func.lower(code_column).like(pattern, escape="\\"), func.lower(model.name).like(pattern, escape="\\"))
+    return db.execute(_columns(model, code_column).where(condition).limit(SEARCH_CANDIDATES)).all()
+
+
+def _query_trigrams(query: str) -> List[str]:
+    lowered = query.lower()
+    grams = []
+    for i in range(len(lowered) - 2):
+        gram = lowered[i:i + 3]
+        if gram.strip() and gram not in grams:
+            grams.append(gram)
+    return grams[:MAX_QUERY_TRIGRAMS]
+
+
+def _fuzzy_candidates(db: Session, backend: str, model, code_column, fts: str, query: str):
+    """Rows sharing trigrams with the query, most similar first; none without a trigram index"""
+    if backend == "fts5":
+        grams = _query_trigrams(query)
+        if not grams:
+            return []
+        # Any shared trigram matches; bm25 puts rows sharing the most (and rarest) first
+        return _fts_candidates(db, model, code_column, fts, " OR ".join(_fts_phrase(gram) for gram in grams))
+    if backend == "trigram":
+        score = func.greatest(func.similarity(model.name, query), func.similarity(code_column, query))
+        condition = or_(code_column.op("%")(query), model.name.op("%")(query))
+        statement = _columns(model, code_column).where(condition).order_by(score.desc()).limit(SEARCH_CANDIDATES)
+        return db.execute(statement).all()
+    return []
+
+
+def search(db: Session, q: str, types: Iterable[str] = ("retailer", "product"), limit: int = 10) -> List[dict]:
+    """
+    Retailers and products matching q, best first, at most limit
+
+    Per type: one indexed prefix query and, for 3+ characters unless the
+    prefix matches already fill limit, one substring query on the trigram
+    index. Only when all types together still have fewer than limit
+    matches and none exact does each type add one fuzzy query. rank()
+    orders the candidates. At most three statements per type whatever the
+    table size.
+    """
+    query = normalize_query(q)
+    if not query:
+        return []
+    backend = search_backend(db)
+
+    candidates = {}
+    for type_ in types:
+        model, code_column, fts = SEARCH_TYPES[type_]
+        rows = {row[0]: row for row in _prefix_candidates(db, backend, model, code_column, query, limit)}
+        # Prefix matches outrank everything the trigram index adds
+        if len(query) >= 3 and len(rows) < limit:
+            for row in _substring_candidates(db, backend, model, code_column, fts, query):
+                rows.setdefault(row[0], row)
+        candidates[type_] = rows
+
+    def ranked_rows():
+        for type_, rows in candidates.items():
+            for _, code, name in rows.values():
+                ranked = rank(query, code, name)
+                if ranked is not None:
+                    yield ranked[0], len(name or ""), code, type_, name, ranked[1]
+
+    scored = list(ranked_rows())
+    if len(query) >= 3 and len(scored) < limit and not any(item[5] == "exact" for item in scored):
+        for type_, rows in candidates.items():
+            model, code_column, fts = SEARCH_TYPES[type_]
+            for row in _fuzzy_candidates(db, backend, model, code_column, fts, query):
+                rows.setdefault(row[0], row)
+        scored = list(ranked_rows())
+
+    scored.sort(key=lambda item: (-item[0], item[1], item[2]))
+    return [
+        {"type": type_, "code": code, "name": name, "score": score, "match": match}
+        for score, _, code, type_, name, match in scored[:limit]
+    ]
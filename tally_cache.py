@@ -1,79 +1,798 @@
 """Tally Cache - caches Tally ledger balances to reduce API calls"""
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
+import database
+import metrics
+from admission import ADMISSION_QUEUE_TIMEOUT_SECONDS, release_route_slot, tally_fetch_slot, tally_fetch_slot_async
+from data_version import bump_data_version
 from models import TallyLedgerCache, Retailer
-from tally_client import get_closing_balance
+from tally_client import (
+    TALLY_TIMEOUT_SECONDS,
+    get_closing_balance,
+    get_closing_balances,
+    get_closing_balance_async,
+    get_closing_balances_async,
+    tally_breaker,
+)
 
 
-CACHE_TTL_MINUTES = 120  # 2 hours
+CACHE_TTL_MINUTES = int(os.getenv("CACHE_TTL_MINUTES", "120"))  # 2 hours
+MEMORY_CACHE_MAX_ENTRIES = int(os.getenv("MEMORY_CACHE_MAX_ENTRIES", "10000"))
+# How long past the TTL an entry may still be served while it is refreshed in the background
+CACHE_MAX_STALE_MINUTES = int(os.getenv("CACHE_MAX_STALE_MINUTES", "30"))
+TALLY_REFRESH_WORKERS = int(os.getenv("TALLY_REFRESH_WORKERS", "4"))
+# Ledgers a collection export did not return are not requested again for this long
+TALLY_UNKNOWN_LEDGER_TTL_SECONDS = int(os.getenv("TALLY_UNKNOWN_LEDGER_TTL_SECONDS", "300"))
+# Longest a caller waits for another caller's in-flight fetch of the same ledger
+# (default: the leader's wait for a Tally fetch slot plus the Tally timeout, with margin)
+TALLY_COALESCE_WAIT_SECONDS = float(os.getenv(
+    "TALLY_COALESCE_WAIT_SECONDS", str(ADMISSION_QUEUE_TIMEOUT_SECONDS + TALLY_TIMEOUT_SECONDS + 5)
+))
+# Above this many ledgers, bulk reads scan the table instead of binding a huge IN list
+BULK_IN_CLAUSE_LIMIT = 500
+
+logger = logging.getLogger(__name__)
+
+
+def to_local_naive(value: datetime) -> datetime:
+    """Convert an aware timestamp (e.g. '...Z' from the sync agent) to local naive time"""
+    if value.tzinfo is not None:
+        return value.astimezone().replace(tzinfo=None)
+    return value
+
+
+class LedgerBalanceCache:
+    """
+    Process-local, size-bounded TTL cache of ledger balances
+
+    Sits in front of the tally_ledger_cache table so repeated lookups are
+    served without any SQL. Entries keep the as_of timestamp of the balance
+    (not the time they were cached), so expiry matches the database tier.
+    Entries past the TTL are kept for max_stale more minutes so they can be
+    served while a refresh runs. Least recently used entries are evicted once
+    max_entries is reached.
+    """
+
+    def __init__(
+        self,
+        ttl_minutes: int = CACHE_TTL_MINUTES,
+        max_entries: int = MEMORY_CACHE_MAX_ENTRIES,
+        max_stale_minutes: int = CACHE_MAX_STALE_MINUTES,
+    ):
+        self.ttl = timedelta(minutes=ttl_minutes)
+        self.max_stale = timedelta(minutes=max_stale_minutes)
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, datetime]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def lookup(self, ledger_name: str, now: Optional[datetime] = None) -> Optional[Tuple[float, bool]]:
+        """
+        Return (balance, is_fresh) for a servable entry, otherwise None
+
+        is_fresh is False when the entry is past the TTL but still inside the
+        max staleness window; entries beyond that window are dropped.
+        """
+        now = now or datetime.now()
+        with self._lock:
+            entry = self._entries.get(ledger_name)
+            if entry is None:
+                self.misses += 1
+                return None
+            balance, as_of = entry
+            age = now - as_of
+            if age > self.ttl + self.max_stale:
+                del self._entries[ledger_name]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(ledger_name)
+            if age > self.ttl:
+                self.stale_hits += 1
+                return balance, False
+            self.hits += 1
+            return balance, True
+
+    def get(self, ledger_name: str, now: Optional[datetime] = None) -> Optional[float]:
+        """Return the cached balance if present and within TTL, otherwise None"""
+        result = self.lookup(ledger_name, now)
+        if result is None or not result[1]:
+            return None
+        return result[0]
+
+    def set(self, ledger_name: str, balance: float, as_of: datetime) -> None:
+        """Store a balance, keeping the newest as_of if the ledger is already cached"""
+        as_of = to_local_naive(as_of)
+        with self._lock:
+            current = self._entries.get(ledger_name)
+            if current is not None and current[1] > as_of:
+                return
+            self._entries[ledger_name] = (balance, as_of)
+            self._entries.move_to_end(ledger_name)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, ledger_name: Optional[str] = None) -> None:
+        """Drop one ledger, or everything when no ledger is given"""
+        with self._lock:
+            if ledger_name is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(ledger_name, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.stale_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_minutes": int(self.ttl.total_seconds() / 60),
+                "max_stale_minutes": int(self.max_stale.total_seconds() / 60),
+                "hits": self.hits,
+                "stale_hits": self.stale_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": round((self.hits + self.stale_hits) / lookups, 4) if lookups else None,
+            }
+
+
+ledger_cache = LedgerBalanceCache()
+
+# In-flight Tally fetches, one per ledger, shared by every caller that misses
+_inflight: Dict[str, Future] = {}
+_inflight_lock = threading.Lock()
+# Ledgers queued or running in a background batch refresh
+_pending_batch: set = set()
+# Ledger name -> time.monotonic() until which a batch export skips it (Tally did not return it)
+_unknown_ledgers: Dict[str, float] = {}
+_refresh_executor = ThreadPoolExecutor(max_workers=TALLY_REFRESH_WORKERS, thread_name_prefix="tally-refresh")
+refresh_stats = {
+    "tally_fetches": 0,
+    "bulk_tally_fetches": 0,
+    "coalesced_waits": 0,
+    "background_refreshes": 0,
+    "background_failures": 0,
+    "unknown_ledgers_skipped": 0,
+}
+
+
+def _store_balance(db: Session, ledger_name: str, balance: float, as_of: datetime) -> None:
+    """Upsert the latest tally_ledger_cache row for a retailer ledger"""
+    retailer = db.query(Retailer).filter_by(retailer_code=ledger_name).first()
+    if not retailer:
+        # Not a retailer ledger - only the in-memory tier keeps it
+        return
+
+    cache_entry = db.query(TallyLedgerCache).filter_by(
+        retailer_id=retailer.id
+    ).order_by(TallyLedgerCache.as_of.desc()).first()
+
+    if cache_entry:
+        if cache_entry.closing_balance != balance:
+            bump_data_version(db, "ledger_balance")
+        cache_entry.closing_balance = balance
+        cache_entry.as_of = as_of
+        cache_entry.ledger_name = ledger_name
+    else:
+        db.add(TallyLedgerCache(
+            retailer_id=retailer.id,
+            ledger_name=ledger_name,
+            closing_balance=balance,
+            as_of=as_of
+        ))
+        bump_data_version(db, "ledger_balance")
+    db.commit()
+
+
+def _refresh_ledger(ledger_name: str) -> float:
+    """Fetch a ledger from Tally and write it through both cache tiers"""
+    logger.info("⟳ Fetching fresh data from Tally for %s", ledger_name)
+    refresh_stats["tally_fetches"] += 1
+    balance = get_closing_balance(ledger_name)
+    now = datetime.now()
+
+    # Own session: this may run on a background thread after the request is gone
+    db = database.SessionLocal()
+    try:
+        _store_balance(db, ledger_name, balance, now)
+    finally:
+        db.close()
+
+    ledger_cache.set(ledger_name, balance, now)
+    logger.debug("✓ Cached balance for %s: %s", ledger_name, balance)
+    return balance
+
+
+def _fail_inflight(future: Future, ledger_name: str, error: BaseException) -> None:
+    """Resolve a leader's future after it failed, so waiters never hang"""
+    if not isinstance(error, Exception):
+        # Cancellation or interpreter exit: waiters get an ordinary error, not the leader's CancelledError
+        error = Exception(f"In-flight Tally fetch for {ledger_name} was abandoned")
+    if not future.done():
+        future.set_exception(error)
+
+
+def _wait_inflight(future: Future, ledger_name: str) -> float:
+    try:
+        return future.result(timeout=TALLY_COALESCE_WAIT_SECONDS)
+    except FutureTimeoutError:
+        raise Exception(f"Timed out waiting for the in-flight Tally fetch for {ledger_name}")
+
+
+def _fetch_coalesced(ledger_name: str, admit: bool = False) -> float:
+    """
+    Fetch a ledger from Tally, sharing one in-flight request per ledger
+
+    The first caller performs the fetch; concurrent callers for the same
+    ledger wait for its result (or exception) instead of calling Tally,
+    for at most TALLY_COALESCE_WAIT_SECONDS. The future is resolved however
+    the leader exits, so waiters are never left hanging. With admit
+    (request paths) the fetch takes a Tally fetch slot first
+    (admission.tally_fetch_slot) and waiters give up their route slot, so a
+    burst of misses cannot tie up every worker on Tally; background
+    refreshes are bounded by their executor.
+    """
+    with _inflight_lock:
+        future = _inflight.get(ledger_name)
+        is_leader = future is None
+        if is_leader:
+            future = Future()
+            _inflight[ledger_name] = future
+
+    if not is_leader:
+        refresh_stats["coalesced_waits"] += 1
+        if admit:
+            # Waiting on Tally too: give the route slot to requests the cache can answer
+            release_route_slot()
+        return _wait_inflight(future, ledger_name)
+
+    try:
+        if admit:
+            with tally_fetch_slot():
+                balance = _refresh_ledger(ledger_name)
+        else:
+            balance = _refresh_ledger(ledger_name)
+        future.set_result(balance)
+        return balance
+    except BaseException as e:
+        _fail_inflight(future, ledger_name, e)
+        raise
+    finally:
+        with _inflight_lock:
+            _inflight.pop(ledger_name, None)
+
+
+async def _refresh_ledger_async(ledger_name: str) -> float:
+    """_refresh_ledger with an awaited Tally request and async write-through"""
+    logger.info("⟳ Fetching fresh data from Tally for %s", ledger_name)
+    refresh_stats["tally_fetches"] += 1
+    balance = await get_closing_balance_async(ledger_name)
+    now = datetime.now()
+
+    async with database.AsyncSessionLocal() as db:
+        await db.run_sync(_store_balance, ledger_name, balance, now)
+
+    ledger_cache.set(ledger_name, balance, now)
+    logger.debug("✓ Cached balance for %s: %s", ledger_name, balance)
+    return balance
+
+
+async def _fetch_coalesced_async(ledger_name: str) -> float:
+    """
+    Async _fetch_coalesced
+
+    Uses the same in-flight table, so async and sync callers (including
+    background refreshes) for one ledger share a single Tally request.
+    Only request paths call this, so the fetch always takes a Tally
+    fetch slot and waiters give up their route slot. As there, waits are bounded and the future is resolved
+    however the leader exits, including cancellation.
+    """
+    with _inflight_lock:
+        future = _inflight.get(ledger_name)
+        is_leader = future is None
+        if is_leader:
+            future = Future()
+            _inflight[ledger_name] = future
+
+    if not is_leader:
+        refresh_stats["coalesced_waits"] += 1
+        # Waiting on Tally too: give the route slot to requests the cache can answer
+        release_route_slot()
+        try:
+            # shield: a waiter that is cancelled must not cancel the shared future
+            return await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), TALLY_COALESCE_WAIT_SECONDS)
+        except asyncio.TimeoutError:
+            raise Exception(f"Timed out waiting for the in-flight Tally fetch for {ledger_name}")
+
+    try:
+        async with tally_fetch_slot_async():
+            balance = await _refresh_ledger_async(ledger_name)
+        future.set_result(balance)
+        return balance
+    except BaseException as e:
+        # Includes CancelledError (client gone, timeout): waiters get an error instead of hanging
+        _fail_inflight(future, ledger_name, e)
+        raise
+    finally:
+        with _inflight_lock:
+            _inflight.pop(ledger_name, None)
+
+
+def _background_refresh(ledger_name: str) -> None:
+    try:
+        _fetch_coalesced(ledger_name)
+    except Exception as e:
+        refresh_stats["background_failures"] += 1
+        logger.warning("⚠ Background refresh failed for %s: %s", ledger_name, e)
+
+
+def schedule_refresh(ledger_name: str) -> None:
+    """Refresh a ledger in the background unless a fetch is already in flight"""
+    if tally_breaker.is_open():
+        # Tally is down - keep serving the cached value until the circuit half-opens
+        return
+    with _inflight_lock:
+        if ledger_name in _inflight:
+            return
+    refresh_stats["background_refreshes"] += 1
+    _refresh_executor.submit(_background_refresh, ledger_name)
+
+
+def cache_stats() -> dict:
+    """In-memory tier and refresh counters for /debug/tally-cache"""
+    with _inflight_lock:
+        inflight = len(_inflight)
+        pending_batch = len(_pending_batch)
+    return {**ledger_cache.stats(), **refresh_stats, "inflight_fetches": inflight, "pending_batch_ledgers": pending_batch}
+
+
+def _memory_cache_lookups() -> dict:
+    stats = ledger_cache.stats()
+    return {"hit": stats["hits"], "stale": stats["stale_hits"], "miss": stats["misses"]}
+
+
+metrics.registry.gauge(
+    "tally_memory_cache_lookups_total", "In-memory balance cache lookups by result (hit/stale/miss)",
+    _memory_cache_lookups, label="result", kind="counter",
+)
+metrics.registry.gauge(
+    "tally_memory_cache_hit_ratio", "Share of in-memory cache lookups served (fresh or stale)",
+    lambda: ledger_cache.stats()["hit_ratio"],
+)
+metrics.registry.gauge("tally_memory_cache_entries", "Balances held in memory", lambda: ledger_cache.stats()["entries"])
+metrics.registry.gauge(
+    "tally_refresh_events_total", "Tally fetches, coalesced waits and background refreshes",
+    lambda: dict(refresh_stats), label="event", kind="counter",
+)
+metrics.registry.gauge("tally_inflight_fetches", "Tally fetches currently in flight", lambda: len(_inflight))
+
+
+def latest_cache_entry_select(ledger_name: str):
+    """(closing_balance, as_of) of the newest tally_ledger_cache row for a retailer ledger"""
+    return (
+        select(TallyLedgerCache.closing_balance, TallyLedgerCache.as_of)
+        .join(Retailer, Retailer.id == TallyLedgerCache.retailer_id)
+        .where(Retailer.retailer_code == ledger_name)
+        .order_by(TallyLedgerCache.as_of.desc())
+        .limit(1)
+    )
+
+
+def _serve_cache_entry(ledger_name: str, cache_entry, now: datetime) -> Optional[float]:
+    """Balance from a tally_ledger_cache row if it is fresh or only slightly stale, else None"""
+    if cache_entry is None or cache_entry.closing_balance is None:
+        metrics.tally_cache_db_lookups.inc(result="miss")
+        return None
+    age_minutes = (now - cache_entry.as_of).total_seconds() / 60
+
+    # If cache is valid (or only slightly expired), return it
+    if age_minutes > CACHE_TTL_MINUTES + CACHE_MAX_STALE_MINUTES:
+        metrics.tally_cache_db_lookups.inc(result="expired")
+        return None
+    ledger_cache.set(ledger_name, cache_entry.closing_balance, cache_entry.as_of)
+    if age_minutes > CACHE_TTL_MINUTES:
+        metrics.tally_cache_db_lookups.inc(result="stale")
+        logger.info("⟳ Serving stale cache for %s (age: %d min), refreshing", ledger_name, age_minutes)
+        schedule_refresh(ledger_name)
+    else:
+        metrics.tally_cache_db_lookups.inc(result="hit")
+        logger.debug("✓ Cache hit for %s (age: %d min)", ledger_name, age_minutes)
+    return cache_entry.closing_balance
 
 
 def get_closing_balance_with_cache(db: Session, ledger_name: str) -> float:
     """
     Get closing balance from cache if available and fresh, otherwise fetch from Tally
-    
+
+    Lookup order: in-memory cache (no SQL), tally_ledger_cache table, Tally.
+    Entries up to CACHE_MAX_STALE_MINUTES past the TTL are returned immediately
+    and refreshed in the background; concurrent misses share one Tally fetch.
+    Before a Tally request the session's transaction is committed, so its
+    pooled connection is not held for the length of the network call.
+
     Args:
         db: Database session
         ledger_name: Name of the ledger to query
-        
+
     Returns:
         float: Closing balance
-        
+
     Raises:
         Exception: If unable to fetch from Tally and no valid cache exists
     """
-    # Try to find retailer by retailer_code (ledger_name)
-    retailer = db.query(Retailer).filter_by(retailer_code=ledger_name).first()
-    
-    if not retailer:
-        # No retailer found, fetch directly from Tally without caching
-        return get_closing_balance(ledger_name)
-    
-    # Check if we have a valid cache entry
-    cache_entry = db.query(TallyLedgerCache).filter_by(
-        retailer_id=retailer.id
-    ).order_by(TallyLedgerCache.as_of.desc()).first()
-    
     now = datetime.now()
-    cache_is_valid = False
-    
-    if cache_entry:
-        age_minutes = (now - cache_entry.as_of).total_seconds() / 60
-        cache_is_valid = age_minutes <= CACHE_TTL_MINUTES
-    
-    # If cache is valid, return it
-    if cache_is_valid:
-        print(f"✓ Cache hit for {ledger_name} (age: {int(age_minutes)} min)")
-        return cache_entry.closing_balance
-    
-    # Cache miss or expired - fetch from Tally
-    print(f"⟳ Fetching fresh data from Tally for {ledger_name}")
-    try:
-        balance = get_closing_balance(ledger_name)
-        
-        # Update or create cache entry
-        if cache_entry:
-            cache_entry.closing_balance = balance
-            cache_entry.as_of = now
-            cache_entry.ledger_name = ledger_name
-        else:
-            cache_entry = TallyLedgerCache(
-                retailer_id=retailer.id,
-                ledger_name=ledger_name,
-                closing_balance=balance,
-                as_of=now
-            )
-            db.add(cache_entry)
-        
-        db.commit()
-        print(f"✓ Cached balance for {ledger_name}: {balance}")
+
+    cached = ledger_cache.lookup(ledger_name, now)
+    if cached is not None:
+        balance, is_fresh = cached
+        if not is_fresh:
+            schedule_refresh(ledger_name)
         return balance
-        
+
+    # Latest tally_ledger_cache row for the retailer whose code is the ledger name
+    cache_entry = db.execute(latest_cache_entry_select(ledger_name)).first()
+    served = _serve_cache_entry(ledger_name, cache_entry, now)
+    if served is not None:
+        return served
+
+    # Cache miss or too stale - end the read transaction so the pooled
+    # connection is not held while waiting on Tally, then fetch
+    db.commit()
+    try:
+        return _fetch_coalesced(ledger_name, admit=True)
     except Exception as e:
         # If Tally fetch fails but we have an expired cache, use it as fallback
         if cache_entry and cache_entry.closing_balance is not None:
-            print(f"⚠ Tally fetch failed, using stale cache for {ledger_name}")
+            logger.warning("⚠ Tally fetch failed, using stale cache for %s", ledger_name)
             return cache_entry.closing_balance
         else:
             # No cache and fetch failed - raise the error
             raise e
+
+
+async def get_closing_balance_with_cache_async(db: AsyncSession, ledger_name: str) -> float:
+    """
+    Async get_closing_balance_with_cache for the async endpoints
+
+    Same lookup order and stale/fallback rules; the database read and the
+    Tally request are awaited instead of blocking a thread, and a miss
+    shares the in-flight fetch with sync callers for the same ledger.
+    """
+    now = datetime.now()
+
+    cached = ledger_cache.lookup(ledger_name, now)
+    if cached is not None:
+        balance, is_fresh = cached
+        if not is_fresh:
+            schedule_refresh(ledger_name)
+        return balance
+
+    cache_entry = (await db.execute(latest_cache_entry_select(ledger_name))).first()
+    served = _serve_cache_entry(ledger_name, cache_entry, now)
+    if served is not None:
+        return served
+
+    await db.commit()
+    try:
+        return await _fetch_coalesced_async(ledger_name)
+    except Exception as e:
+        if cache_entry and cache_entry.closing_balance is not None:
+            logger.warning("⚠ Tally fetch failed, using stale cache for %s", ledger_name)
+            return cache_entry.closing_balance
+        raise e
+
+
+def _latest_cache_rows(db: Session, ledger_names: List[str]) -> Dict[str, Tuple[float, datetime]]:
+    """Latest (closing_balance, as_of) per retailer ledger, read in a single query"""
+    stmt = select(
+        Retailer.retailer_code, TallyLedgerCache.closing_balance, TallyLedgerCache.as_of
+    ).join(TallyLedgerCache, TallyLedgerCache.retailer_id == Retailer.id)
+    if len(ledger_names) <= BULK_IN_CLAUSE_LIMIT:
+        stmt = stmt.where(Retailer.retailer_code.in_(ledger_names))
+
+    wanted = set(ledger_names)
+    latest: Dict[str, Tuple[float, datetime]] = {}
+    for code, balance, as_of in db.execute(stmt):
+        if code not in wanted or balance is None or as_of is None:
+            continue
+        current = latest.get(code)
+        if current is None or as_of > current[1]:
+            latest[code] = (balance, as_of)
+    return latest
+
+
+def upsert_cache_rows(db: Session, values: Dict[str, Tuple[float, datetime]]) -> Tuple[List[str], bool]:
+    """
+    Bulk upsert of the latest tally_ledger_cache row per retailer ledger
+
+    values maps ledger name (retailer code) to (closing_balance, as_of).
+    Runs a fixed number of statements however many ledgers are given and
+    does not commit. As in LedgerBalanceCache.set, a balance older than
+    the stored one is skipped, so the two tiers keep the same value.
+    Returns the ledgers written (unknown retailer codes and older balances
+    are skipped) and whether any stored balance changed.
+    """
+    codes = list(values)
+    retailer_stmt = select(Retailer.retailer_code, Retailer.id)
+    cache_stmt = select(
+        TallyLedgerCache.id, TallyLedgerCache.retailer_id, TallyLedgerCache.as_of, TallyLedgerCache.closing_balance
+    )
+    if len(codes) <= BULK_IN_CLAUSE_LIMIT:
+        retailer_stmt = retailer_stmt.where(Retailer.retailer_code.in_(codes))
+    retailer_ids = {code: rid for code, rid in db.execute(retailer_stmt) if code in values}
+    if not retailer_ids:
+        return [], False
+
+    if len(retailer_ids) <= BULK_IN_CLAUSE_LIMIT:
+        cache_stmt = cache_stmt.where(TallyLedgerCache.retailer_id.in_(list(retailer_ids.values())))
+    latest_row: Dict[int, Tuple[int, datetime, Optional[float]]] = {}
+    for row_id, retailer_id, row_as_of, row_balance in db.execute(cache_stmt):
+        current = latest_row.get(retailer_id)
+        if current is None or (row_as_of or datetime.min) > (current[1] or datetime.min):
+            latest_row[retailer_id] = (row_id, row_as_of, row_balance)
+
+    updates, inserts, written = [], [], []
+    changed = False
+    for code, retailer_id in retailer_ids.items():
+        balance, as_of = values[code]
+        row = {"ledger_name": code, "closing_balance": balance, "as_of": as_of}
+        if retailer_id in latest_row:
+            row_id, row_as_of, row_balance = latest_row[retailer_id]
+            if row_as_of is not None and row_as_of > as_of:
+                continue
+            updates.append({"id": row_id, **row})
+            changed = changed or row_balance != balance
+        else:
+            inserts.append({"retailer_id": retailer_id, **row})
+            changed = True
+        written.append(code)
+    if updates:
+        db.execute(update(TallyLedgerCache), updates)
+    if inserts:
+        db.execute(insert(TallyLedgerCache), inserts)
+    return written, changed
+
+
+def _store_balances(db: Session, balances: Dict[str, float], as_of: datetime) -> None:
+    """Bulk upsert of fetched balances, all as of one timestamp"""
+    _, changed = upsert_cache_rows(db, {code: (balance, as_of) for code, balance in balances.items()})
+    if changed:
+        bump_data_version(db, "ledger_balance")
+    db.commit()
+
+
+def _remember_unknown(ledger_names: List[str], balances: Dict[str, float]) -> None:
+    """Negative-cache the requested ledgers the export did not return"""
+    expires = time.monotonic() + TALLY_UNKNOWN_LEDGER_TTL_SECONDS
+    with _inflight_lock:
+        for ledger_name in ledger_names:
+            if ledger_name in balances:
+                _unknown_ledgers.pop(ledger_name, None)
+            else:
+                _unknown_ledgers[ledger_name] = expires
+
+
+def _without_unknown(ledger_names: List[str]) -> List[str]:
+    """Ledgers not negative-cached by _remember_unknown"""
+    now = time.monotonic()
+    known = []
+    with _inflight_lock:
+        for ledger_name in ledger_names:
+            expires = _unknown_ledgers.get(ledger_name)
+            if expires is not None and expires > now:
+                continue
+            if expires is not None:
+                del _unknown_ledgers[ledger_name]
+            known.append(ledger_name)
+    refresh_stats["unknown_ledgers_skipped"] += len(ledger_names) - len(known)
+    return known
+
+
+def _refresh_ledgers(ledger_names: List[str]) -> Dict[str, float]:
+    """Fetch many ledgers with one Tally collection export and write them through both tiers"""
+    logger.info("⟳ Fetching %d ledgers from Tally in one batch", len(ledger_names))
+    refresh_stats["bulk_tally_fetches"] += 1
+    balances = get_closing_balances(ledger_names)
+    _remember_unknown(ledger_names, balances)
+    now = datetime.now()
+
+    db = database.SessionLocal()
+    try:
+        _store_balances(db, balances, now)
+    finally:
+        db.close()
+
+    for ledger_name, balance in balances.items():
+        ledger_cache.set(ledger_name, balance, now)
+    logger.info("✓ Cached %d balances from batch", len(balances))
+    return balances
+
+
+def _background_refresh_many(ledger_names: List[str]) -> None:
+    try:
+        _refresh_ledgers(ledger_names)
+    except Exception as e:
+        refresh_stats["background_failures"] += 1
+        logger.warning("⚠ Background batch refresh failed for %d ledgers: %s", len(ledger_names), e)
+    finally:
+        with _inflight_lock:
+            _pending_batch.difference_update(ledger_names)
+
+
+def _resolve_from_memory(ledger_names: Iterable[str], now: datetime):
+    """Split ledgers into memory hits and misses: (balances, stale, pending)"""
+    balances: Dict[str, float] = {}
+    stale: List[str] = []
+    pending: List[str] = []
+    for ledger_name in dict.fromkeys(ledger_names):
+        cached = ledger_cache.lookup(ledger_name, now)
+        if cached is None:
+            pending.append(ledger_name)
+            continue
+        balances[ledger_name] = cached[0]
+        if not cached[1]:
+            stale.append(ledger_name)
+    return balances, stale, pending
+
+
+def _resolve_from_rows(
+    rows: Dict[str, Tuple[float, datetime]],
+    pending: List[str],
+    now: datetime,
+    balances: Dict[str, float],
+    stale: List[str],
+):
+    """Serve pending ledgers from cache rows; returns (fallback, missing)"""
+    fallback: Dict[str, float] = {}
+    metrics.tally_cache_db_lookups.inc(len(pending) - len(rows), result="miss")
+    for ledger_name, (balance, as_of) in rows.items():
+        age_minutes = (now - as_of).total_seconds() / 60
+        if age_minutes <= CACHE_TTL_MINUTES + CACHE_MAX_STALE_MINUTES:
+            ledger_cache.set(ledger_name, balance, as_of)
+            balances[ledger_name] = balance
+            if age_minutes > CACHE_TTL_MINUTES:
+                metrics.tally_cache_db_lookups.inc(result="stale")
+                stale.append(ledger_name)
+            else:
+                metrics.tally_cache_db_lookups.inc(result="hit")
+        else:
+            metrics.tally_cache_db_lookups.inc(result="expired")
+            fallback[ledger_name] = balance
+    missing = [name for name in pending if name not in balances]
+    return fallback, missing
+
+
+def _schedule_batch_refresh(stale: List[str]) -> None:
+    """
+    Refresh stale ledgers in one background batch
+
+    Ledgers already being fetched (singly or in a queued batch) or recently
+    missing from an export are left out, so repeated report builds during
+    the stale window do not each queue another collection export.
+    """
+    if not stale or tally_breaker.is_open():
+        return
+    stale = _without_unknown(stale)
+    with _inflight_lock:
+        batch = [name for name in stale if name not in _inflight and name not in _pending_batch]
+        _pending_batch.update(batch)
+    if batch:
+        refresh_stats["background_refreshes"] += 1
+        _refresh_executor.submit(_background_refresh_many, batch)
+
+
+def _merge_fetched(
+    missing: List[str],
+    fetched: Dict[str, float],
+    fallback: Dict[str, float],
+    balances: Dict[str, float],
+) -> None:
+    for ledger_name in missing:
+        if ledger_name in fetched:
+            balances[ledger_name] = fetched[ledger_name]
+        elif ledger_name in fallback:
+            balances[ledger_name] = fallback[ledger_name]
+
+
+def get_closing_balances_with_cache(db: Session, ledger_names: Iterable[str]) -> Dict[str, float]:
+    """
+    Batch version of get_closing_balance_with_cache for many ledgers
+
+    Serves what it can from the in-memory tier, reads the rest from
+    tally_ledger_cache in one query, and resolves whatever is still missing
+    with a single Tally collection export. Stale entries are returned and
+    refreshed together in one background batch (_schedule_batch_refresh).
+    Ledgers the export did not return are not requested again for
+    TALLY_UNKNOWN_LEDGER_TTL_SECONDS. The export takes a Tally fetch slot
+    (admission.tally_fetch_slot); if none is free in time, missing ledgers
+    fall back to whatever the cache still holds.
+
+    Returns:
+        dict: ledger name -> closing balance. Ledgers that could not be
+        resolved (not in Tally, or Tally down with no cached value) are omitted.
+    """
+    now = datetime.now()
+    balances, stale, pending = _resolve_from_memory(ledger_names, now)
+
+    fallback: Dict[str, float] = {}
+    missing: List[str] = []
+    if pending:
+        fallback, missing = _resolve_from_rows(_latest_cache_rows(db, pending), pending, now, balances, stale)
+
+    _schedule_batch_refresh(stale)
+
+    if missing:
+        # Ledgers the last export did not return keep their old value (if any) without asking again
+        to_fetch = _without_unknown(missing)
+        fetched = {}
+        if to_fetch:
+            db.commit()
+            try:
+                with tally_fetch_slot():
+                    fetched = _refresh_ledgers(to_fetch)
+            except Exception as e:
+                # Includes AdmissionRejected: a report degrades to cached values rather than failing
+                logger.warning("⚠ Batch Tally fetch failed, using stale cache for %d ledgers: %s", len(fallback), e)
+        _merge_fetched(missing, fetched, fallback, balances)
+
+    return balances
+
+
+async def _refresh_ledgers_async(ledger_names: List[str]) -> Dict[str, float]:
+    """_refresh_ledgers with an awaited collection export and async write-through"""
+    logger.info("⟳ Fetching %d ledgers from Tally in one batch", len(ledger_names))
+    refresh_stats["bulk_tally_fetches"] += 1
+    balances = await get_closing_balances_async(ledger_names)
+    _remember_unknown(ledger_names, balances)
+    now = datetime.now()
+
+    async with database.AsyncSessionLocal() as db:
+        await db.run_sync(_store_balances, balances, now)
+
+    for ledger_name, balance in balances.items():
+        ledger_cache.set(ledger_name, balance, now)
+    logger.info("✓ Cached %d balances from batch", len(balances))
+    return balances
+
+
+async def get_closing_balances_with_cache_async(db: AsyncSession, ledger_names: Iterable[str]) -> Dict[str, float]:
+    """Async get_closing_balances_with_cache (same tiers, awaited I/O)"""
+    now = datetime.now()
+    balances, stale, pending = _resolve_from_memory(ledger_names, now)
+
+    fallback: Dict[str, float] = {}
+    missing: List[str] = []
+    if pending:
+        rows = await db.run_sync(_latest_cache_rows, pending)
+        fallback, missing = _resolve_from_rows(rows, pending, now, balances, stale)
+
+    _schedule_batch_refresh(stale)
+
+    if missing:
+        # Ledgers the last export did not return keep their old value (if any) without asking again
+        to_fetch = _without_unknown(missing)
+        fetched = {}
+        if to_fetch:
+            await db.commit()
+            try:
+                async with tally_fetch_slot_async():
+                    fetched = await _refresh_ledgers_async(to_fetch)
+            except Exception as e:
+                # Includes AdmissionRejected: a report degrades to cached values rather than failing
+                logger.warning("⚠ Batch Tally fetch failed, using stale cache for %d ledgers: %s", len(fallback), e)
+        _merge_fetched(missing, fetched, fallback, balances)
+
+    return balances
@@ -1,68 +1,371 @@
 """Tally Client - functions to communicate with Tally via HTTP/XML"""
+import asyncio
+import logging
 import os
+import threading
+import time
+import httpx
 import requests
-import xml.etree.ElementTree as ET
+from contextlib import contextmanager
+from typing import Dict, Iterable, Optional
 from dotenv import load_dotenv
+import metrics
+from tally_envelopes import build_ledger_collection_request, build_ledger_request
+from tally_parser import (
+    ClosingBalanceScanner,
+    LedgerBalancesScanner,
+    TallyParseError,
+)
 
 load_dotenv()
 TALLY_HOST = os.getenv("TALLY_HOST", "http://192.168.31.65:9000")
+# Timeout for a single-ledger request
+TALLY_TIMEOUT_SECONDS = float(os.getenv("TALLY_TIMEOUT_SECONDS", "10"))
+TALLY_BULK_TIMEOUT_SECONDS = float(os.getenv("TALLY_BULK_TIMEOUT_SECONDS", "60"))
+RESPONSE_CHUNK_SIZE = 64 * 1024
+TALLY_BREAKER_FAILURE_THRESHOLD = int(os.getenv("TALLY_BREAKER_FAILURE_THRESHOLD", "5"))
+TALLY_BREAKER_RESET_SECONDS = float(os.getenv("TALLY_BREAKER_RESET_SECONDS", "30"))
+TALLY_BREAKER_HALF_OPEN_MAX_CALLS = int(os.getenv("TALLY_BREAKER_HALF_OPEN_MAX_CALLS", "1"))
+# Connections the async client may open to Tally at once; further requests wait for one
+TALLY_MAX_CONNECTIONS = int(os.getenv("TALLY_MAX_CONNECTIONS", "32"))
 
+logger = logging.getLogger(__name__)
+
+
+class TallyCircuitOpenError(Exception):
+    """Raised without contacting Tally while the circuit breaker is open"""
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker for the Tally host
+
+    closed    - calls go through; failure_threshold consecutive failures open it
+    open      - calls fail fast until reset_seconds have passed
+    half_open - up to half_open_max_calls probes are let through; a success
+                closes the circuit, a failure opens it again
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int, reset_seconds: float, half_open_max_calls: int = 1):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.half_open_max_calls = half_open_max_calls
+        self._state = self.CLOSED
+        self._lock = threading.Lock()
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._half_open_calls = 0
+        self.trips = 0
+        self.rejected_calls = 0
+        self.total_failures = 0
+        self.total_successes = 0
+        self.last_error = None
+
+    def _current_state(self) -> str:
+        # Caller holds the lock
+        if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_seconds:
+            self._state = self.HALF_OPEN
+            self._half_open_calls = 0
+        return self._state
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def is_open(self) -> bool:
+        return self.state == self.OPEN
+
+    def before_call(self) -> None:
+        """Reserve a call slot, raising TallyCircuitOpenError if Tally should not be contacted"""
+        with self._lock:
+            state = self._current_state()
+            if state == self.CLOSED:
+                return
+            if state == self.HALF_OPEN and self._half_open_calls < self.half_open_max_calls:
+                self._half_open_calls += 1
+                return
+            self.rejected_calls += 1
+            retry_in = max(0.0, self.reset_seconds - (time.monotonic() - self._opened_at))
+        raise TallyCircuitOpenError(
+            f"Tally circuit is open after repeated failures at {TALLY_HOST}; retry in {retry_in:.0f}s"
+        )
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.total_successes += 1
+            self._consecutive_failures = 0
+            if self._state != self.CLOSED:
+                logger.info("✓ Tally circuit closed")
+            self._state = self.CLOSED
+
+    def record_failure(self, error: BaseException) -> None:
+        with self._lock:
+            self.total_failures += 1
+            self._consecutive_failures += 1
+            self.last_error = str(error)
+            state = self._current_state()
+            if state == self.HALF_OPEN or (
+                state == self.CLOSED and self._consecutive_failures >= self.failure_threshold
+            ):
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+                self.trips += 1
+                logger.warning("⚠ Tally circuit opened after %d consecutive failures", self._consecutive_failures)
+
+    def release_probe(self) -> None:
+        """Give back a call slot whose outcome says nothing about Tally (e.g. the caller was cancelled)"""
+        with self._lock:
+            if self._current_state() == self.HALF_OPEN and self._half_open_calls > 0:
+                self._half_open_calls -= 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            state = self._current_state()
+            retry_in = None
+            if state == self.OPEN:
+                retry_in = round(max(0.0, self.reset_seconds - (time.monotonic() - self._opened_at)), 1)
+            return {
+                "state": state,
+                "consecutive_failures": self._consecutive_failures,
+                "failure_threshold": self.failure_threshold,
+                "reset_seconds": self.reset_seconds,
+                "retry_in_seconds": retry_in,
+                "trips": self.trips,
+                "rejected_calls": self.rejected_calls,
+                "total_failures": self.total_failures,
+                "total_successes": self.total_successes,
+                "last_error": self.last_error,
+            }
+
+
+tally_breaker = CircuitBreaker(
+    failure_threshold=TALLY_BREAKER_FAILURE_THRESHOLD,
+    reset_seconds=TALLY_BREAKER_RESET_SECONDS,
+    half_open_max_calls=TALLY_BREAKER_HALF_OPEN_MAX_CALLS,
+)
 
-def get_closing_balance(ledger_name: str) -> float:
-    xml_request = f"""<ENVELOPE>
-  <HEADER>
-    <TALLYREQUEST>Export</TALLYREQUEST>
-  </HEADER>
-  <BODY>
-    <EXPORTDATA>
-      <REQUESTDESC>
-        <REPORTNAME>Ledger</REPORTNAME>
-        <STATICVARIABLES>
-          <SVFROMDATE>01-04-2024</SVFROMDATE>
-          <SVTODATE>31-03-2025</SVTODATE>
-          <LEDGERNAME>{ledger_name}</LEDGERNAME>
-        </STATICVARIABLES>
-      </REQUESTDESC>
-    </EXPORTDATA>
-  </BODY>
-</ENVELOPE>"""
 
+def _breaker_state_value() -> dict:
+    state = tally_breaker.state
+    return {s: int(s == state) for s in (CircuitBreaker.CLOSED, CircuitBreaker.OPEN, CircuitBreaker.HALF_OPEN)}
+
+
+metrics.registry.gauge("tally_circuit_state", "1 for the circuit breaker's current state", _breaker_state_value, label="state")
+
+
+@contextmanager
+def _track_tally_call(kind: str):
+    """Count a Tally request by outcome and time it (calls rejected by the breaker are not timed)"""
+    start = time.perf_counter()
+    outcome = "error"
     try:
-        response = requests.post(TALLY_HOST, data=xml_request, headers={"Content-Type": "application/xml"}, timeout=10)
-        if response.status_code != 200:
-            raise Exception(f"Tally returned status code {response.status_code}")
-        
-        root = ET.fromstring(response.text)
-        closing_balance = None
-        balance_tags = [".//CLOSINGBALANCE", ".//CLOSINGBALANCE-CREDIT", ".//CLOSINGBALANCE-DEBIT", ".//CURRBALANCE"]
-        
-        for tag in balance_tags:
-            element = root.find(tag)
-            if element is not None and element.text:
-                try:
-                    balance_text = element.text.strip().replace(",", "").replace("Rs.", "").replace("₹", "")
-                    closing_balance = float(balance_text)
+        yield
+        outcome = "ok"
+    except TallyCircuitOpenError:
+        outcome = "rejected"
+        raise
+    finally:
+        metrics.tally_requests.inc(kind=kind, outcome=outcome)
+        if outcome != "rejected":
+            metrics.tally_request_seconds.observe(time.perf_counter() - start, kind=kind)
+
+
+def _scan_from_tally(xml_request: str, timeout: float, scanner) -> Optional[float]:
+    """
+    POST an envelope and feed the streamed body to a tally_parser scanner
+
+    Returns the first non-None value from scanner.feed() (reading stops
+    there), or None once the body is exhausted. The outcome is recorded on
+    the circuit breaker only after the body has been read, so read
+    timeouts, resets and malformed bodies count as failures, while an
+    interrupt only gives back its probe slot; the sync twin of
+    _stream_from_tally.
+    """
+    # Fails fast with TallyCircuitOpenError while Tally is known to be down
+    tally_breaker.before_call()
+    value = None
+    try:
+        response = requests.post(TALLY_HOST, data=xml_request.encode("utf-8"), headers={"Content-Type": "application/xml"}, timeout=timeout, stream=True)
+        try:
+            if response.status_code != 200:
+                raise Exception(f"Tally returned status code {response.status_code}")
+            for chunk in _iter_response(response):
+                value = scanner.feed(chunk)
+                if value is not None:
                     break
-                except ValueError:
-                    continue
-        
-        if closing_balance is None:
-            for elem in root.iter():
-                if "BALANCE" in elem.tag.upper() and elem.text:
-                    try:
-                        balance_text = elem.text.strip().replace(",", "").replace("Rs.", "").replace("₹", "")
-                        closing_balance = float(balance_text)
-                        break
-                    except ValueError:
-                        continue
-        
-        if closing_balance is None:
-            raise Exception(f"Could not find closing balance for ledger: {ledger_name}")
-        return closing_balance
-        
+        finally:
+            response.close()
+    except Exception as e:
+        tally_breaker.record_failure(e)
+        raise
+    except BaseException:
+        tally_breaker.release_probe()
+        raise
+    tally_breaker.record_success()
+    return value
+
+
+def _iter_response(response: requests.Response):
+    """Response body chunks for the incremental parser (decoded only for non-UTF-8 charsets)"""
+    encoding = (response.encoding or "").lower()
+    if encoding and encoding.replace("-", "") not in ("utf8", "ascii", "usascii", "iso88591"):
+        return response.iter_content(chunk_size=RESPONSE_CHUNK_SIZE, decode_unicode=True)
+    return response.iter_content(chunk_size=RESPONSE_CHUNK_SIZE)
+
+
+def get_closing_balance(ledger_name: str) -> float:
+    scanner = ClosingBalanceScanner()
+    try:
+        with _track_tally_call("ledger"):
+            # Stops reading the body at the first CLOSINGBALANCE
+            value = _scan_from_tally(build_ledger_request(ledger_name), TALLY_TIMEOUT_SECONDS, scanner)
+            if value is not None:
+                return value
+            try:
+                return scanner.finish()
+            except TallyParseError:
+                raise Exception(f"Could not find closing balance for ledger: {ledger_name}")
+
+    except TallyCircuitOpenError:
+        raise
+    except requests.exceptions.Timeout:
+        raise Exception(f"Tally server timeout - could not reach {TALLY_HOST}")
+    except requests.exceptions.ConnectionError:
+        raise Exception(f"Could not connect to Tally at {TALLY_HOST}")
+    except Exception as e:
+        raise Exception(f"Error fetching Tally data: {str(e)}")
+
+
+def get_closing_balances(ledger_names: Optional[Iterable[str]] = None) -> Dict[str, float]:
+    """
+    Fetch closing balances for many ledgers with a single collection export
+
+    Args:
+        ledger_names: Ledgers to return; all ledgers when None
+
+    Returns:
+        dict: ledger name -> closing balance (ledgers Tally does not know are omitted)
+    """
+    scanner = LedgerBalancesScanner(set(ledger_names) if ledger_names is not None else None)
+
+    try:
+        with _track_tally_call("collection"):
+            _scan_from_tally(build_ledger_collection_request(), TALLY_BULK_TIMEOUT_SECONDS, scanner)
+        return scanner.balances
+    except TallyCircuitOpenError:
+        raise
     except requests.exceptions.Timeout:
         raise Exception(f"Tally server timeout - could not reach {TALLY_HOST}")
     except requests.exceptions.ConnectionError:
         raise Exception(f"Could not connect to Tally at {TALLY_HOST}")
+
+
+# --- Async variants (httpx), used by the async API endpoints -------------------
+
+_async_client: Optional[httpx.AsyncClient] = None
+_async_client_loop = None
+
+
+def _get_async_client() -> httpx.AsyncClient:
+    """Shared AsyncClient, recreated if the running event loop has changed"""
+    global _async_client, _async_client_loop
+    loop = asyncio.get_running_loop()
+    if _async_client is None or _async_client_loop is not loop:
+        _async_client = httpx.AsyncClient(
+            headers={"Content-Type": "application/xml"},
+            limits=httpx.Limits(max_connections=TALLY_MAX_CONNECTIONS, max_keepalive_connections=TALLY_MAX_CONNECTIONS),
+        )
+        _async_client_loop = loop
+    return _async_client
+
+
+async def close_async_client() -> None:
+    global _async_client, _async_client_loop
+    if _async_client is not None:
+        await _async_client.aclose()
+    _async_client = None
+    _async_client_loop = None
+
+
+async def _stream_from_tally(xml_request: str, timeout: float, scanner) -> Optional[float]:
+    """
+    POST an envelope and feed the streamed body to a tally_parser scanner
+
+    Returns the first non-None value from scanner.feed() (reading stops
+    there), or None once the body is exhausted. Every call it admits
+    settles with the circuit breaker: success once the body has been read,
+    failure on any error, including one after the connection is made. A
+    cancelled request counts as neither; it only gives back its half-open
+    probe slot (release_probe), so the circuit is not reopened by clients
+    that hung up.
+    """
+    tally_breaker.before_call()
+    value = None
+    try:
+        async with _get_async_client().stream(
+            "POST", TALLY_HOST, content=xml_request.encode("utf-8"), timeout=timeout
+        ) as response:
+            if response.status_code != 200:
+                raise Exception(f"Tally returned status code {response.status_code}")
+
+            encoding = (response.charset_encoding or "").lower()
+            if encoding and encoding.replace("-", "") not in ("utf8", "ascii", "usascii", "iso88591"):
+                chunks = response.aiter_text(RESPONSE_CHUNK_SIZE)
+            else:
+                chunks = response.aiter_bytes(RESPONSE_CHUNK_SIZE)
+            async for chunk in chunks:
+                value = scanner.feed(chunk)
+                if value is not None:
+                    break
     except Exception as e:
-        raise Exception(f"Error fetching Tally data: {str(e)}")
\ No newline at end of file
+        tally_breaker.record_failure(e)
+        raise
+    except BaseException:
+        # Cancelled (client gone, coalescing timeout): not Tally's fault, just free the probe slot
+        tally_breaker.release_probe()
+        raise
+    tally_breaker.record_success()
+    return value
+
+
+async def get_closing_balance_async(ledger_name: str) -> float:
+    """Async get_closing_balance; same errors and breaker behaviour"""
+    scanner = ClosingBalanceScanner()
+    try:
+        with _track_tally_call("ledger"):
+            value = await _stream_from_tally(build_ledger_request(ledger_name), TALLY_TIMEOUT_SECONDS, scanner)
+            if value is not None:
+                return value
+            try:
+                return scanner.finish()
+            except TallyParseError:
+                raise Exception(f"Could not find closing balance for ledger: {ledger_name}")
+
+    except TallyCircuitOpenError:
+        raise
+    except httpx.TimeoutException:
+        raise Exception(f"Tally server timeout - could not reach {TALLY_HOST}")
+    except httpx.TransportError:
+        raise Exception(f"Could not connect to Tally at {TALLY_HOST}")
+    except Exception as e:
+        raise Exception(f"Error fetching Tally data: {str(e)}")
+
+
+async def get_closing_balances_async(ledger_names: Optional[Iterable[str]] = None) -> Dict[str, float]:
+    """Async get_closing_balances (one collection export)"""
+    scanner = LedgerBalancesScanner(set(ledger_names) if ledger_names is not None else None)
+    try:
+        with _track_tally_call("collection"):
+            await _stream_from_tally(build_ledger_collection_request(), TALLY_BULK_TIMEOUT_SECONDS, scanner)
+        return scanner.balances
+    except TallyCircuitOpenError:
+        raise
+    except httpx.TimeoutException:
+        raise Exception(f"Tally server timeout - could not reach {TALLY_HOST}")
+    except httpx.TransportError:
+        raise Exception(f"Could not connect to Tally at {TALLY_HOST}")
@@ -0,0 +1,52 @@
+"""Tally Envelopes - XML request envelopes for Tally, standard library only so the sync agent can ship them"""
+from xml.sax.saxutils import escape
+
+
+def build_ledger_request(ledger_name: str) -> str:
+    """XML envelope for the Ledger report of a single ledger"""
+    return f"""<ENVELOPE>
+  <HEADER>
+    <TALLYREQUEST>Export</TALLYREQUEST>
+  </HEADER>
+  <BODY>
+    <EXPORTDATA>
+      <REQUESTDESC>
+        <REPORTNAME>Ledger</REPORTNAME>
+        <STATICVARIABLES>
+          <SVFROMDATE>01-04-2024</SVFROMDATE>
+          <SVTODATE>31-03-2025</SVTODATE>
+          <LEDGERNAME>{escape(ledger_name)}</LEDGERNAME>
+        </STATICVARIABLES>
+      </REQUESTDESC>
+    </EXPORTDATA>
+  </BODY>
+</ENVELOPE>"""
+
+
+def build_ledger_collection_request() -> str:
+    """XML envelope exporting name and closing balance of every ledger in one response"""
+    return """<ENVELOPE>
+  <HEADER>
+    <VERSION>1</VERSION>
+    <TALLYREQUEST>Export</TALLYREQUEST>
+    <TYPE>Collection</TYPE>
+    <ID>LedgerBalances</ID>
+  </HEADER>
+  <BODY>
+    <DESC>
+      <STATICVARIABLES>
+        <SVFROMDATE>01-04-2024</SVFROMDATE>
+        <SVTODATE>31-03-2025</SVTODATE>
+        <SVEXPORTFORMAT>$$SysName:XML</SVEXPORTFORMAT>
+      </STATICVARIABLES>
+      <TDL>
+        <TDLMESSAGE>
+          <COLLECTION NAME="LedgerBalances" ISMODIFY="No">
+            <TYPE>Ledger</TYPE>
+            <FETCH>Name, ClosingBalance</FETCH>
+          </COLLECTION>
+        </TDLMESSAGE>
+      </TDL>
+    </DESC>
+  </BODY>
+</ENVELOPE>"""
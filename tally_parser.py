@@ -0,0 +1,236 @@
+"""Tally Parser - shared, incremental parsing of Tally XML export responses"""
+import re
+import xml.etree.ElementTree as ET
+from html import unescape
+from typing import Dict, Iterable, Optional, Set, Union
+
+Source = Union[str, bytes, Iterable[Union[str, bytes]]]
+
+# Preferred balance tags, best first. Any other tag containing BALANCE is a last resort.
+BALANCE_TAG_PRIORITY = {
+    "CLOSINGBALANCE": 0,
+    "CLOSINGBALANCE-CREDIT": 1,
+    "CLOSINGBALANCE-DEBIT": 2,
+    "CURRBALANCE": 3,
+}
+_FALLBACK_PRIORITY = len(BALANCE_TAG_PRIORITY)
+
+_CLOSING_OPEN_RE = re.compile(rb"<CLOSINGBALANCE(?:\s[^>]*)?>")
+_CLOSING_CLOSE = b"</CLOSINGBALANCE>"
+# One pass over a collection export: LEDGER open tag (with NAME attribute),
+# NAME child, CLOSINGBALANCE value, LEDGER close tag
+_LEDGER_TOKEN_RE = re.compile(
+    rb"<LEDGER(?=[\s>/])(?:[^>]*?\bNAME\s*=\s*(?:\"([^\"]*)\"|'([^']*)'))?[^>]*>"
+    rb"|<NAME>([^<]*)</NAME>"
+    rb"|<CLOSINGBALANCE(?:\s[^>]*)?>([^<]*)</CLOSINGBALANCE>"
+    rb"|(</LEDGER>)"
+)
+
+_CURRENCY_RE = re.compile(r"(?:Rs\.?|INR|₹|,|\s)", re.I)
+_DR_CR_RE = re.compile(r"(Dr|Cr)\.?$", re.I)
+
+
+class TallyParseError(ValueError):
+    """Raised when a Tally response contains no usable balance"""
+
+
+def normalize_amount(text: Optional[str]) -> Optional[float]:
+    """
+    Convert a Tally amount string to a float, or None if it is not an amount
+
+    Handles thousands separators, 'Rs.' / 'INR' / '₹' prefixes and the 'Dr'/'Cr'
+    suffix used in display formats. Debit balances (amount the party owes)
+    are positive and credit balances negative, matching how OD is computed.
+    Plain signed numbers are returned as-is.
+    """
+    if not text:
+        return None
+    try:
+        # Fast path: plain numbers, as Tally's XML export normally sends them
+        return float(text)
+    except ValueError:
+        pass
+    cleaned = text.strip()
+    match = _DR_CR_RE.search(cleaned)
+    if match:
+        cleaned = cleaned[:match.start()]
+    cleaned = _CURRENCY_RE.sub("", cleaned)
+    if cleaned.startswith("(") and cleaned.endswith(")"):
+        cleaned = "-" + cleaned[1:-1]
+    if not cleaned:
+        return None
+    try:
+        value = float(cleaned)
+    except ValueError:
+        return None
+    if match:
+        return -abs(value) if match.group(1).lower() == "cr" else abs(value)
+    return value
+
+
+def _byte_chunks(source: Source) -> Iterable[bytes]:
+    if isinstance(source, (str, bytes, bytearray)):
+        source = (source,)
+    for chunk in source:
+        yield chunk.encode("utf-8") if isinstance(chunk, str) else chunk
+
+
+def _decode(raw: bytes) -> str:
+    text = raw.decode("utf-8", "replace")
+    return unescape(text) if "&" in text else text
+
+
+def _local_name(tag: str) -> str:
+    # Strip any {namespace} prefix and compare case-insensitively
+    return tag.rsplit("}", 1)[-1].upper()
+
+
+def _fallback_balance(document: bytes) -> float:
+    """Full parse for responses without a CLOSINGBALANCE tag; picks the best other balance tag"""
+    try:
+        root = ET.fromstring(document)
+    except ET.ParseError as e:
+        raise TallyParseError(f"Invalid XML from Tally: {e}")
+
+    best_priority = None
+    best_value = None
+    for elem in root.iter():
+        tag = _local_name(elem.tag)
+        if "BALANCE" not in tag:
+            continue
+        priority = BALANCE_TAG_PRIORITY.get(tag, _FALLBACK_PRIORITY)
+        if best_priority is not None and priority >= best_priority:
+            continue
+        value = normalize_amount(elem.text)
+        if value is not None:
+            best_priority, best_value = priority, value
+
+    if best_value is None:
+        raise TallyParseError("No closing balance found in Tally response")
+    return best_value
+
+
+class ClosingBalanceScanner:
+    """
+    Incremental state behind parse_closing_balance
+
+    feed() each chunk as it arrives; it returns the balance as soon as the
+    first usable CLOSINGBALANCE is complete. If the body ends without one,
+    finish() falls back to a full parse of what was fed.
+    """
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._scan_from = 0
+        self._value_start = None
+
+    def feed(self, chunk: Union[str, bytes]) -> Optional[float]:
+        buffer = self._buffer
+        buffer += chunk.encode("utf-8") if isinstance(chunk, str) else chunk
+        while True:
+            if self._value_start is None:
+                match = _CLOSING_OPEN_RE.search(buffer, self._scan_from)
+                if match is None:
+                    # Keep enough overlap to catch a tag split across chunks
+                    self._scan_from = max(0, len(buffer) - 64)
+                    return None
+                self._value_start = match.end()
+            value_end = buffer.find(_CLOSING_CLOSE, self._value_start)
+            if value_end < 0:
+                return None
+            value = normalize_amount(_decode(buffer[self._value_start:value_end]))
+            if value is not None:
+                return value
+            # Empty or non-numeric CLOSINGBALANCE - keep looking
+            self._scan_from = value_end + len(_CLOSING_CLOSE)
+            self._value_start = None
+
+    def finish(self) -> float:
+        return _fallback_balance(bytes(self._buffer))
+
+
+def parse_closing_balance(source: Source) -> float:
+    """
+    Extract the closing balance from a single-ledger Tally response
+
+    Chunks are scanned as they arrive for the first CLOSINGBALANCE element
+    and reading stops there, so neither a tree nor the rest of a large
+    response is ever built. Only responses without a CLOSINGBALANCE fall
+    back to a full parse, preferring CLOSINGBALANCE-CREDIT/-DEBIT, then
+    CURRBALANCE, then any other *BALANCE* tag.
+
+    Args:
+        source: Response text/bytes, or an iterable of chunks (e.g. iter_content)
+
+    Raises:
+        TallyParseError: If no balance tag with a numeric value is found
+    """
+    scanner = ClosingBalanceScanner()
+    for chunk in _byte_chunks(source):
+        value = scanner.feed(chunk)
+        if value is not None:
+            return value
+    return scanner.finish()
+
+
+class LedgerBalancesScanner:
+    """
+    Incremental state behind parse_ledger_balances
+
+    feed() each chunk; balances collects {ledger name: closing balance}.
+    The consumed part of the buffer is dropped after every chunk.
+    """
+
+    def __init__(self, wanted: Optional[Set[str]] = None):
+        self.wanted = wanted
+        self.balances: Dict[str, float] = {}
+        self._buffer = bytearray()
+        self._name = None
+        self._raw_balance = None
+
+    def feed(self, chunk: Union[str, bytes]) -> None:
+        buffer = self._buffer
+        buffer += chunk.encode("utf-8") if isinstance(chunk, str) else chunk
+        consumed = 0
+        for match in _LEDGER_TOKEN_RE.finditer(buffer):
+            consumed = match.end()
+            attr_dq, attr_sq, child_name, value, closed = match.groups()
+            if closed is not None:
+                if self._name is not None and self._raw_balance is not None:
+                    ledger = _decode(self._name).strip()
+                    if ledger and (self.wanted is None or ledger in self.wanted):
+                        amount = normalize_amount(_decode(self._raw_balance))
+                        if amount is not None:
+                            self.balances[ledger] = amount
+                self._name = self._raw_balance = None
+            elif value is not None:
+                if self._raw_balance is None:
+                    self._raw_balance = value
+            elif child_name is not None:
+                if self._name is None:
+                    self._name = child_name
+            else:
+                # New LEDGER element
+                self._name = attr_dq if attr_dq is not None else attr_sq
+                self._raw_balance = None
+        if consumed:
+            # Tokens never straddle the cut: an incomplete tag simply fails to match yet
+            del buffer[:consumed]
+
+
+def parse_ledger_balances(source: Source, wanted: Optional[Set[str]] = None) -> Dict[str, float]:
+    """
+    Extract {ledger name: closing balance} from a multi-ledger collection response
+
+    The response is tokenized in a single pass as chunks arrive and the
+    consumed part of the buffer is dropped, so memory stays flat regardless
+    of the number of ledgers.
+
+    Args:
+        source: Response text/bytes, or an iterable of chunks
+        wanted: Only return these ledger names (all when None)
+    """
+    scanner = LedgerBalancesScanner(wanted)
+    for chunk in _byte_chunks(source):
+        scanner.feed(chunk)
+    return scanner.balances
@@ -0,0 +1,410 @@
+"""
+Tally Pre-warm - refreshes cached ledger balances ahead of business hours and expiry
+
+Runs in-process (a scheduler thread started by main when PREWARM_ENABLED)
+or standalone, e.g. from cron:
+
+    python tally_prewarm.py             refresh every retailer ledger
+    python tally_prewarm.py --due-only  only ledgers missing or expiring within PREWARM_AHEAD_MINUTES
+"""
+import argparse
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import func, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+import database
+import metrics
+from data_version import bump_data_version
+from models import Activation, Retailer, TallyLedgerCache, TallyPrewarmRunLog
+from tally_cache import CACHE_TTL_MINUTES, ledger_cache, upsert_cache_rows
+from tally_client import TallyCircuitOpenError, get_closing_balance, get_closing_balances, tally_breaker
+
+# Start the scheduler thread with the API (enable on one worker, or use cron instead)
+PREWARM_ENABLED = os.getenv("PREWARM_ENABLED", "false").lower() in ("1", "true", "yes")
+# Daily full refreshes, local HH:MM, comma separated (before business hours)
+PREWARM_TIMES = os.getenv("PREWARM_TIMES", "07:30")
+# Between full runs, refresh ledgers about to expire this often (0 disables)
+PREWARM_INTERVAL_MINUTES = int(os.getenv("PREWARM_INTERVAL_MINUTES", "30"))
+# A ledger is due when its cached balance expires within this many minutes
+PREWARM_AHEAD_MINUTES = int(os.getenv("PREWARM_AHEAD_MINUTES", "30"))
+# Parallel single-ledger Tally requests when the collection export fails
+PREWARM_CONCURRENCY = int(os.getenv("PREWARM_CONCURRENCY", "4"))
+# Activations in this window rank a retailer ahead of quieter ones
+PREWARM_ACTIVITY_DAYS = int(os.getenv("PREWARM_ACTIVITY_DAYS", "14"))
+# A run still marked running after this long is taken to be from a crashed process
+PREWARM_STALE_RUN_MINUTES = int(os.getenv("PREWARM_STALE_RUN_MINUTES", "60"))
+# Fallback results are written in chunks of this size, busiest retailers first
+PREWARM_WRITE_BATCH = 500
+
+logger = logging.getLogger(__name__)
+
+# Serializes the in-progress check and the new run's log row within this process
+# (across processes, scheduled runs are claimed through the unique slot column)
+_start_lock = threading.Lock()
+
+
+class PrewarmInProgress(Exception):
+    """Raised by start_prewarm while another run is still running"""
+
+    def __init__(self, run: "TallyPrewarmRunLog"):
+        super().__init__(f"Pre-warm run {run.id} is in progress (started {run.started_at.isoformat()})")
+        self.run_id = run.id
+
+
+def parse_times(value: str) -> List[Tuple[int, int]]:
+    """'07:30,12:00' -> [(7, 30), (12, 0)]"""
+    times = []
+    for part in value.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        hour, minute = part.split(":")
+        times.append((int(hour), int(minute)))
+    return sorted(times)
+
+
+def prioritized_ledgers(db: Session, due_only: bool = False, now: Optional[datetime] = None) -> List[str]:
+    """
+    Retailer ledgers to refresh, busiest first
+
+    Ranked by activations in the last PREWARM_ACTIVITY_DAYS (the retailers
+    that order, and so get approvals, most), then by retailer code. With
+    due_only, ledgers whose cached balance is still fresh for more than
+    PREWARM_AHEAD_MINUTES are left out. Two grouped subqueries, one statement.
+    """
+    now = now or datetime.now()
+    activity = (
+        select(Activation.retailer_id, func.count().label("sales"))
+        .where(Activation.activation_time >= now - timedelta(days=PREWARM_ACTIVITY_DAYS))
+        .group_by(Activation.retailer_id)
+        .subquery()
+    )
+    latest = (
+        select(TallyLedgerCache.retailer_id, func.max(TallyLedgerCache.as_of).label("as_of"))
+        .group_by(TallyLedgerCache.retailer_id)
+        .subquery()
+    )
+    stmt = (
+        select(Retailer.retailer_code)
+        .outerjoin(activity, activity.c.retailer_id == Retailer.id)
+        .outerjoin(latest, latest.c.retailer_id == Retailer.id)
+        .order_by(func.coalesce(activity.c.sales, 0).desc(), Retailer.retailer_code)
+    )
+    if due_only:
+        due_before = now - timedelta(minutes=CACHE_TTL_MINUTES - PREWARM_AHEAD_MINUTES)
+        stmt = stmt.where((latest.c.as_of == None) | (latest.c.as_of <= due_before))  # noqa: E711
+    return list(db.execute(stmt).scalars())
+
+
+def _write_balances(db: Session, balances: Dict[str, float], as_of: datetime) -> int:
+    """Write fetched balances through both cache tiers; returns the ledgers stored"""
+    written, changed = upsert_cache_rows(db, {code: (balance, as_of) for code, balance in balances.items()})
+    if changed:
+        bump_data_version(db, "ledger_balance")
+    db.commit()
+    for code in written:
+        ledger_cache.set(code, balances[code], as_of)
+    return len(written)
+
+
+def _fetch_one_by_one(db: Session, ledgers: List[str]) -> Tuple[int, int]:
+    """
+    Per-ledger fallback with at most PREWARM_CONCURRENCY requests in flight
+
+    Results are written in chunks as they arrive, so the busiest retailers
+    are warm first. Stops submitting once the circuit breaker opens.
+    Returns (refreshed, failed).
+    """
+    refreshed = failed = 0
+    with ThreadPoolExecutor(max_workers=PREWARM_CONCURRENCY, thread_name_prefix="tally-prewarm") as pool:
+        for start in range(0, len(ledgers), PREWARM_WRITE_BATCH):
+            chunk = ledgers[start:start + PREWARM_WRITE_BATCH]
+            if tally_breaker.is_open():
+                failed += len(ledgers) - start
+                logger.warning("⚠ Tally circuit open, skipping %d ledgers", len(ledgers) - start)
+                break
+            futures = {pool.submit(get_closing_balance, code): code for code in chunk}
+            balances: Dict[str, float] = {}
+            for future in as_completed(futures):
+                try:
+                    balances[futures[future]] = future.result()
+                except Exception as e:
+                    failed += 1
+                    logger.debug("Pre-warm fetch failed for %s: %s", futures[future], e)
+            refreshed += _write_balances(db, balances, datetime.now())
+    return refreshed, failed
+
+
+def refresh_ledgers(db: Session, ledgers: List[str]) -> Tuple[int, int]:
+    """
+    Refresh ledgers with one collection export, falling back to single-ledger requests
+
+    Ledgers the export does not list are counted as failed. Returns (refreshed, failed).
+    """
+    if not ledgers:
+        return 0, 0
+    try:
+        balances = get_closing_balances(ledgers)
+    except TallyCircuitOpenError:
+        raise
+    except Exception as e:
+        logger.warning("⚠ Collection export failed, fetching %d ledgers one by one: %s", len(ledgers), e)
+        return _fetch_one_by_one(db, ledgers)
+
+    refreshed = _write_balances(db, balances, datetime.now())
+    return refreshed, len(ledgers) - refreshed
+
+
+def _recent_run(db: Session, since: datetime) -> Optional[TallyPrewarmRunLog]:
+    """A run started since then that is still running or succeeded (another worker's, say)"""
+    return (
+        db.query(TallyPrewarmRunLog)
+        .filter(TallyPrewarmRunLog.started_at >= since, TallyPrewarmRunLog.status.in_(("running", "success")))
+        .order_by(TallyPrewarmRunLog.started_at.desc())
+        .first()
+    )
+
+
+def _running_run(db: Session, now: datetime) -> Optional[TallyPrewarmRunLog]:
+    """A run still in progress (not older than PREWARM_STALE_RUN_MINUTES), from any worker"""
+    return (
+        db.query(TallyPrewarmRunLog)
+        .filter(
+            TallyPrewarmRunLog.status == "running",
+            TallyPrewarmRunLog.started_at >= now - timedelta(minutes=PREWARM_STALE_RUN_MINUTES),
+        )
+        .order_by(TallyPrewarmRunLog.started_at.desc())
+        .first()
+    )
+
+
+def _claim_run(db: Session, started: datetime, trigger: str, slot: Optional[str] = None) -> Optional[int]:
+    """
+    Log a new run as running and return its id
+
+    The caller holds _start_lock. With slot, the INSERT itself claims it:
+    when another worker logged a run for the same slot first, the unique
+    index rejects this one and None is returned.
+
+    Raises:
+        PrewarmInProgress: If a run (on any worker) is still running
+    """
+    running = _running_run(db, started)
+    if running is not None:
+        raise PrewarmInProgress(running)
+    run_log = TallyPrewarmRunLog(started_at=started, trigger=trigger, slot=slot, status="running")
+    db.add(run_log)
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        return None
+    return run_log.id
+
+
+def execute_run(run_id: int, due_only: bool = False) -> dict:
+    """
+    Refresh the ledgers for a run logged as running and record the outcome
+
+    Returns the run summary; status is success, partial (some ledgers
+    failed) or error (nothing could be refreshed).
+    """
+    db = database.SessionLocal()
+    try:
+        run_log = db.get(TallyPrewarmRunLog, run_id)
+        started = run_log.started_at
+        refreshed = failed = 0
+        error = None
+        try:
+            ledgers = prioritized_ledgers(db, due_only=due_only, now=started)
+            run_log.ledgers_requested = len(ledgers)
+            logger.info("⟳ Pre-warming %d Tally ledgers (%s)", len(ledgers), run_log.trigger)
+            refreshed, failed = refresh_ledgers(db, ledgers)
+            if not failed:
+                status = "success"
+            elif refreshed:
+                status = "partial"
+            else:
+                # Nothing refreshed at all is an outage, not a partial run
+                status = "error"
+                error = f"None of {failed} ledgers could be refreshed from Tally"
+        except Exception as e:
+            db.rollback()
+            error = str(e)
+            status = "error"
+            failed = (run_log.ledgers_requested or 0) - refreshed
+
+        run_log.finished_at = datetime.now()
+        run_log.status = status
+        run_log.ledgers_refreshed = refreshed
+        run_log.ledgers_failed = failed
+        run_log.error_message = error
+        db.commit()
+
+        seconds = (run_log.finished_at - started).total_seconds()
+        metrics.tally_prewarm_seconds.observe(seconds, status=status)
+        metrics.tally_prewarm_ledgers.inc(refreshed, result="refreshed")
+        metrics.tally_prewarm_ledgers.inc(failed, result="failed")
+        if status == "error":
+            logger.error("Pre-warm run %s failed: %s", run_id, error)
+        else:
+            logger.info("✓ Pre-warmed %d ledgers in %.1fs (%d failed)", refreshed, seconds, failed)
+        return {
+            "run_id": run_id,
+            "status": status,
+            "ledgers_requested": run_log.ledgers_requested,
+            "ledgers_refreshed": refreshed,
+            "ledgers_failed": failed,
+            "duration_seconds": round(seconds, 3),
+            "error_message": error,
+        }
+    finally:
+        db.close()
+
+
+def start_prewarm(trigger: str = "api") -> int:
+    """
+    Log a new run as running and return its id, for execute_run to carry out
+
+    Raises:
+        PrewarmInProgress: If a run (on any worker) is still running
+    """
+    with _start_lock:
+        db = database.SessionLocal()
+        try:
+            return _claim_run(db, datetime.now(), trigger)
+        finally:
+            db.close()
+
+
+def run_prewarm(
+    due_only: bool = False,
+    trigger: str = "manual",
+    skip_if_ran_within: Optional[timedelta] = None,
+    slot: Optional[str] = None,
+) -> dict:
+    """
+    Refresh cached Tally balances for all (or only due) retailers and log the run
+
+    Starts the same way as start_prewarm, so it never overlaps a running
+    run; with slot (scheduled runs) only the first worker to log that slot
+    runs it. Returns the run summary; status is success, partial (some
+    ledgers failed), error, or skipped (a run is in progress, a recent run
+    already covered it, or another worker claimed the slot).
+    """
+    with _start_lock:
+        db = database.SessionLocal()
+        try:
+            started = datetime.now()
+            if skip_if_ran_within is not None:
+                recent = _recent_run(db, started - skip_if_ran_within)
+                if recent is not None:
+                    logger.info("Pre-warm skipped, run %s started at %s", recent.id, recent.started_at)
+                    return {"run_id": recent.id, "status": "skipped"}
+            try:
+                run_id = _claim_run(db, started, trigger, slot)
+            except PrewarmInProgress as e:
+                logger.info("Pre-warm skipped: %s", e)
+                return {"run_id": e.run_id, "status": "skipped"}
+            if run_id is None:
+                claimed = db.query(TallyPrewarmRunLog.id).filter(TallyPrewarmRunLog.slot == slot).scalar()
+                logger.info("Pre-warm skipped, slot %s was claimed by run %s", slot, claimed)
+                return {"run_id": claimed, "status": "skipped"}
+        finally:
+            db.close()
+    return execute_run(run_id, due_only=due_only)
+
+
+class PrewarmScheduler:
+    """
+    Background thread running full pre-warms at PREWARM_TIMES and due-only
+    pre-warms every PREWARM_INTERVAL_MINUTES in between
+
+    Interval runs fall on multiples of the interval, so every worker
+    computes the same slots. Each slot is claimed by logging its run
+    (run_prewarm's slot), so several workers with the scheduler enabled
+    run it once between them. A run is also skipped when the run log
+    shows one started recently.
+    """
+
+    def __init__(self, times: str = PREWARM_TIMES, interval_minutes: int = PREWARM_INTERVAL_MINUTES):
+        self.times = parse_times(times)
+        self.interval = timedelta(minutes=interval_minutes) if interval_minutes > 0 else None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def next_full_run(self, now: datetime) -> Optional[datetime]:
+        candidates = []
+        for hour, minute in self.times:
+            at = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+            candidates.append(at if at > now else at + timedelta(days=1))
+        return min(candidates) if candidates else None
+
+    def next_interval_run(self, now: datetime) -> Optional[datetime]:
+        if not self.interval:
+            return None
+        step = self.interval.total_seconds()
+        return datetime.fromtimestamp((now.timestamp() // step + 1) * step)
+
+    def _run(self) -> None:
+        next_due = self.next_interval_run(datetime.now())
+        while not self._stop.is_set():
+            now = datetime.now()
+            next_full = self.next_full_run(now)
+            upcoming = [t for t in (next_full, next_due) if t is not None]
+            if not upcoming:
+                return
+            run_at = min(upcoming)
+            if self._stop.wait(max(0.0, (run_at - datetime.now()).total_seconds())):
+                return
+
+            full = next_full is not None and run_at == next_full
+            trigger = "schedule" if full else "interval"
+            slot = f"{trigger}:{run_at:%Y-%m-%dT%H:%M}"
+            try:
+                if full:
+                    run_prewarm(trigger=trigger, skip_if_ran_within=timedelta(minutes=10), slot=slot)
+                else:
+                    run_prewarm(due_only=True, trigger=trigger, skip_if_ran_within=self.interval / 2, slot=slot)
+            except Exception as e:
+                logger.warning("⚠ Scheduled pre-warm failed: %s", e)
+            next_due = self.next_interval_run(datetime.now())
+
+    def start(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="tally-prewarm-scheduler", daemon=True)
+        self._thread.start()
+        logger.info("✓ Tally pre-warm scheduled at %s, due ledgers every %s", PREWARM_TIMES, self.interval or "never")
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+
+prewarm_scheduler = PrewarmScheduler()
+
+
+def main():
+    from logging_config import configure_logging
+
+    parser = argparse.ArgumentParser(description="Refresh cached Tally ledger balances")
+    parser.add_argument("--due-only", action="store_true", help="Only ledgers missing or expiring within PREWARM_AHEAD_MINUTES")
+    args = parser.parse_args()
+
+    configure_logging()
+    result = run_prewarm(due_only=args.due_only, trigger="command")
+    print(result)
+    return 0 if result["status"] in ("success", "skipped") else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
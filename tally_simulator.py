@@ -0,0 +1,226 @@
+"""
+Tally Simulator
+
+A local stand-in for Tally's XML-over-HTTP export interface, used for load
+testing without a production Tally instance. It answers the envelopes built
+by tally_client:
+
+- Ledger report (REPORTNAME Ledger + LEDGERNAME) -> voucher lines + CLOSINGBALANCE
+- Ledger collection export (TYPE Collection)     -> one LEDGER element per ledger
+
+Usage:
+    python tally_simulator.py --port 9000 --ledgers 5000 --latency-ms 20 --error-rate 0.01
+
+Then point TALLY_HOST at http://127.0.0.1:9000.
+"""
+
+import argparse
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+from xml.sax.saxutils import escape, quoteattr
+
+_LEDGER_NAME_RE = re.compile(r"<LEDGERNAME>(.*?)</LEDGERNAME>", re.S)
+_COLLECTION_RE = re.compile(r"<TYPE>\s*Collection\s*</TYPE>", re.I)
+
+
+class _SimulatorHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # The default backlog of 5 refuses connections under concurrent load tests
+    request_queue_size = 512
+
+
+def make_ledger_names(count: int, prefix: str = "R") -> List[str]:
+    """Ledger names R00001, R00002, ... (also used as retailer codes when seeding)"""
+    width = max(5, len(str(count)))
+    return [f"{prefix}{i:0{width}d}" for i in range(1, count + 1)]
+
+
+class TallySimulator:
+    """
+    Threaded HTTP server imitating Tally's export responses
+
+    Args:
+        ledgers: Ledger names the simulated company knows about
+        latency_ms: Base latency added to every response
+        jitter_ms: Uniform random extra latency (0..jitter_ms)
+        error_rate: Fraction of requests answered with HTTP 500
+        vouchers: Voucher lines emitted before the balance in Ledger reports
+        seed: Seed for balances, latency jitter and error injection
+    """
+
+    def __init__(
+        self,
+        ledgers: List[str],
+        host: str = "127.0.0.1",
+        port: int = 9000,
+        latency_ms: float = 0.0,
+        jitter_ms: float = 0.0,
+        error_rate: float = 0.0,
+        vouchers: int = 20,
+        seed: int = 1,
+    ):
+        rng = random.Random(seed)
+        self.balances: Dict[str, float] = {
+            name: round(rng.uniform(-50_000, 250_000), 2) for name in ledgers
+        }
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.vouchers = vouchers
+        self._rng = random.Random(seed + 1)
+        self._rng_lock = threading.Lock()
+        self.stats = {"ledger_requests": 0, "collection_requests": 0, "errors_injected": 0, "unknown_ledgers": 0}
+        self._server = _SimulatorHTTPServer((host, port), self._handler_class())
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "TallySimulator":
+        """Serve on a background daemon thread"""
+        self._thread = threading.Thread(target=self._server.serve_forever, name="tally-simulator", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        if self._thread is not None:
+            self._server.shutdown()
+            self._thread = None
+        self._server.server_close()
+
+    def serve_forever(self) -> None:
+        self._server.serve_forever()
+
+    # --- response generation -------------------------------------------------
+
+    def _delay_and_should_fail(self):
+        with self._rng_lock:
+            delay = self.latency_ms + (self._rng.uniform(0, self.jitter_ms) if self.jitter_ms else 0.0)
+            fail = self.error_rate > 0 and self._rng.random() < self.error_rate
+        return delay / 1000.0, fail
+
+    def ledger_report(self, ledger_name: str) -> Optional[str]:
+        balance = self.balances.get(ledger_name)
+        if balance is None:
+            return None
+        lines = []
+        running = 0.0
+        for i in range(self.vouchers):
+            amount = round((i % 7 + 1) * 1250.5, 2)
+            running += amount
+            lines.append(
+                "<DSPVCHDATE>01-04-2024</DSPVCHDATE>"
+                f"<DSPVCHLEDACCOUNT>Sales Account</DSPVCHLEDACCOUNT>"
+                f"<DSPVCHTYPE>Sales</DSPVCHTYPE><DSPVCHNUMBER>{i + 1}</DSPVCHNUMBER>"
+                f"<DSPVCHDRAMT>{amount:,.2f}</DSPVCHDRAMT><DSPVCHCRAMT></DSPVCHCRAMT>"
+            )
+        return (
+            "<ENVELOPE>"
+            + "".join(lines)
+            + f"<LEDGERNAME>{escape(ledger_name)}</LEDGERNAME>"
+            + f"<CLOSINGBALANCE>{balance:.2f}</CLOSINGBALANCE>"
+            + "</ENVELOPE>"
+        )
+
+    def ledger_collection(self) -> str:
+        parts = ["<ENVELOPE><HEADER><VERSION>1</VERSION><STATUS>1</STATUS></HEADER><BODY><DESC></DESC><DATA><COLLECTION>"]
+        for name, balance in self.balances.items():
+            parts.append(
+                f"<LEDGER NAME={quoteattr(name)} RESERVEDNAME=\"\">"
+                f"<CLOSINGBALANCE TYPE=\"Amount\">{balance:.2f}</CLOSINGBALANCE>"
+                "</LEDGER>"
+            )
+        parts.append("</COLLECTION></DATA></BODY></ENVELOPE>")
+        return "".join(parts)
+
+    def _handler_class(self):
+        simulator = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def _reply(self, status: int, body: str):
+                data = body.encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "text/xml; charset=utf-8")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                request = self.rfile.read(length).decode("utf-8", errors="replace")
+
+                delay, fail = simulator._delay_and_should_fail()
+                if delay:
+                    time.sleep(delay)
+                if fail:
+                    simulator.stats["errors_injected"] += 1
+                    self._reply(500, "<RESPONSE>Simulated Tally error</RESPONSE>")
+                    return
+
+                if _COLLECTION_RE.search(request):
+                    simulator.stats["collection_requests"] += 1
+                    self._reply(200, simulator.ledger_collection())
+                    return
+
+                match = _LEDGER_NAME_RE.search(request)
+                simulator.stats["ledger_requests"] += 1
+                ledger_name = match.group(1).strip() if match else ""
+                ledger_name = ledger_name.replace("&amp;", "&").replace("&lt;", "<").replace("&gt;", ">")
+                report = simulator.ledger_report(ledger_name)
+                if report is None:
+                    simulator.stats["unknown_ledgers"] += 1
+                    self._reply(200, f"<ENVELOPE><LINEERROR>Could not find Ledger '{escape(ledger_name)}'</LINEERROR></ENVELOPE>")
+                    return
+                self._reply(200, report)
+
+            def do_GET(self):
+                # Tally answers a plain GET with a status line; handy for "is it up" checks
+                self._reply(200, "<RESPONSE>TallyPrime Server is Running</RESPONSE>")
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local Tally XML export simulator")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--ledgers", type=int, default=1000, help="Number of ledgers (R00001..)")
+    parser.add_argument("--prefix", default="R", help="Ledger name prefix")
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with HTTP 500")
+    parser.add_argument("--vouchers", type=int, default=20, help="Voucher lines per Ledger report")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    simulator = TallySimulator(
+        make_ledger_names(args.ledgers, args.prefix),
+        host=args.host,
+        port=args.port,
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate,
+        vouchers=args.vouchers,
+        seed=args.seed,
+    )
+    print("=== Tally Simulator ===")
+    print(f"Listening on {simulator.url} with {args.ledgers} ledgers")
+    try:
+        simulator.serve_forever()
+    except KeyboardInterrupt:
+        print("\nStopped")
+
+
+if __name__ == "__main__":
+    main()
@@ -6,72 +6,69 @@ Run this on a PC that:
 - Can reach the backend API (local or cloud)
 
 Flow:
-1) GET /retailers from backend
+1) GET /retailers from backend (page by page)
 2) For each retailer_code, fetch closing balance from Tally
 3) POST to /tally-sync/bulk-ledger-balances with api_key and entries[]
+
+Copy tally_envelopes.py and tally_parser.py alongside this script; it shares
+their request envelope and response parser. Both use only the standard
+library, so the agent needs nothing beyond requests.
 """
 
 import os
 from datetime import datetime
 from decimal import Decimal
-from typing import List
+from typing import Iterator, List
 
 import requests
-from xml.etree import ElementTree as ET
+
+from tally_envelopes import build_ledger_request
+from tally_parser import TallyParseError, parse_closing_balance
 
 BACKEND_BASE_URL = os.getenv("BACKEND_BASE_URL", "http://127.0.0.1:8000")
 TALLY_HOST = os.getenv("TALLY_HOST", "http://192.168.31.65:9000")
 TALLY_SYNC_API_KEY = os.getenv("TALLY_SYNC_API_KEY")
+RETAILER_PAGE_SIZE = int(os.getenv("RETAILER_PAGE_SIZE", "1000"))
 
 if not TALLY_SYNC_API_KEY:
     raise ValueError("TALLY_SYNC_API_KEY environment variable must be set")
 
 
+def iter_retailer_codes(page_size: int = RETAILER_PAGE_SIZE) -> Iterator[str]:
+    """Yield retailer codes from the backend, following the X-Next-Cursor header"""
+    url = f"{BACKEND_BASE_URL}/retailers"
+    cursor = None
+    while True:
+        params = {"limit": page_size}
+        if cursor:
+            params["cursor"] = cursor
+        resp = requests.get(url, params=params, timeout=15)
+        resp.raise_for_status()
+        for r in resp.json():
+            yield r["retailer_code"]
+        cursor = resp.headers.get("X-Next-Cursor")
+        if not cursor:
+            return
+
+
 def get_all_retailer_codes() -> List[str]:
     """Fetch all retailer codes from backend API"""
-    url = f"{BACKEND_BASE_URL}/retailers"
-    resp = requests.get(url, timeout=15)
-    resp.raise_for_status()
-    data = resp.json()
-    return [r["retailer_code"] for r in data]
+    return list(iter_retailer_codes())
 
 
 def get_closing_balance_from_tally(ledger_name: str) -> Decimal:
     """Fetch closing balance for a ledger from Tally"""
-    xml = f"""
-    <ENVELOPE>
-      <HEADER>
-        <TALLYREQUEST>Export</TALLYREQUEST>
-      </HEADER>
-      <BODY>
-        <EXPORTDATA>
-          <REQUESTDESC>
-            <REPORTNAME>Ledger</REPORTNAME>
-            <STATICVARIABLES>
-              <SVFROMDATE>01-04-2024</SVFROMDATE>
-              <SVTODATE>31-03-2025</SVTODATE>
-              <LEDGERNAME>{ledger_name}</LEDGERNAME>
-            </STATICVARIABLES>
-          </REQUESTDESC>
-        </EXPORTDATA>
-      </BODY>
-    </ENVELOPE>
-    """.strip()
+    xml = build_ledger_request(ledger_name)
 
     resp = requests.post(TALLY_HOST, data=xml.encode("utf-8"), timeout=20)
     resp.raise_for_status()
-    text = resp.text
-
-    root = ET.fromstring(text)
-    for elem in root.iter():
-        if elem.tag.upper().endswith("CLOSINGBALANCE"):
-            raw = elem.text or "0"
-            cleaned = "".join(ch for ch in raw if ch.isdigit() or ch in "-.")
-            if cleaned in ("", "-"):
-                return Decimal("0")
-            return Decimal(cleaned)
-
-    return Decimal("0")
+
+    try:
+        balance = parse_closing_balance(resp.content)
+    except TallyParseError:
+        # Ledger has no balance in this period
+        return Decimal("0")
+    return Decimal(str(balance))
 
 
 def main():